@@ -2,6 +2,7 @@ from fastapi import APIRouter
 from .endpoints import auth, diagnosis
 from .endpoints import questions
 from .endpoints import action_plan
+from .endpoints import admin
 
 api_router = APIRouter()
 
@@ -10,6 +11,7 @@ api_router.include_router(auth.router, prefix="/auth", tags=["Autenticación"])
 api_router.include_router(diagnosis.router, prefix="/diagnosis", tags=["Diagnósticos"])
 api_router.include_router(questions.router, prefix="/questions", tags=["Questions"])
 api_router.include_router(action_plan.router, prefix="/action-plan", tags=["Action Plan (Transformación)"])
+api_router.include_router(admin.router, prefix="/admin", tags=["Administración"])
 # app/main.py
 
 from fastapi import FastAPI
@@ -46,6 +48,7 @@ app.add_middleware(
 # Esta línea le dice a SQLAlchemy que cree todas las tablas
 # definidas en nuestros modelos si no existen.
 Base.metadata.create_all(bind=engine)
+# Las columnas nuevas de las tablas existentes se agregan en el arranque (lifespan de app.main).
 
 
 # --- Inclusión de las rutas de la API ---
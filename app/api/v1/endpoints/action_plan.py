@@ -1,17 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Optional
+import asyncio
+import json
 
-from app.db.database import get_db
-from app.schemas.action_plan_schema import TareaUpdate, DashboardTransformacionResponse
+from app.core import idempotency, pubsub
+from app.core.config import settings
+from app.db import replicas
+from app.db.database import get_async_db, get_db
+from app.models.diagnosis import Diagnostico
+from app.schemas.action_plan_schema import TareaUpdate, TareasUpdateLote, DashboardTransformacionResponse
 from app.services import action_plan_service
-from app.api.v1.endpoints.auth import get_current_user
+from app.api.v1.endpoints.auth import get_current_user, get_read_db, limitar
 from app.schemas.user_schema import Usuario
 
 router = APIRouter()
 
-@router.post("/diagnostico/{id_diagnostico}", status_code=status.HTTP_201_CREATED)
-def generar_o_obtener_plan(
+@router.post("/diagnostico/{id_diagnostico}", status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(limitar(costo=5, pesado=True))])
+async def generar_o_obtener_plan(
     id_diagnostico: int, 
     db: Session = Depends(get_db), 
     current_user: Usuario = Depends(get_current_user)
@@ -20,41 +30,163 @@ def generar_o_obtener_plan(
     Toma el ID de un diagnóstico, extrae sus debilidades y genera un Plan de Acción.
     Si el plan ya existe, simplemente lo devuelve.
     """
-    # Llama a nuestro servicio
-    plan = action_plan_service.crear_o_obtener_plan(db, id_diagnostico=id_diagnostico)
+    existe = db.query(Diagnostico.id_diagnostico).filter(
+        Diagnostico.id_diagnostico == id_diagnostico,
+        Diagnostico.id_usuario == current_user.id_usuario
+    ).first()
+    if not existe:
+        raise HTTPException(status_code=404, detail="Diagnóstico no encontrado o no pertenece al usuario.")
+
+    # Llama a nuestro servicio (ordenar las tareas ejecuta el modelo: va al threadpool)
+    plan = await run_in_threadpool(action_plan_service.crear_o_obtener_plan, db, id_diagnostico=id_diagnostico)
+    await replicas.marcar_escritura(current_user.id_usuario)
     
     return {
         "id_plan": plan.id_plan, 
         "mensaje": "Plan de acción listo para este diagnóstico."
     }
 
-@router.get("/{id_plan}/dashboard", response_model=DashboardTransformacionResponse)
+@router.get("/{id_plan}/dashboard", response_model=DashboardTransformacionResponse,
+            dependencies=[Depends(limitar(costo=2, pesado=True))])
 def obtener_dashboard_simulacion(
     id_plan: int, 
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
     current_user: Usuario = Depends(get_current_user)
 ):
     """
     El motor de simulación. Devuelve las tareas y los datos actuales vs. proyectados.
     """
+    if not action_plan_service.plan_pertenece(db, id_plan, current_user.id_usuario):
+        raise HTTPException(status_code=404, detail="Plan de Acción no encontrado")
     datos_dashboard = action_plan_service.obtener_datos_dashboard(db, id_plan=id_plan)
     if not datos_dashboard:
         raise HTTPException(status_code=404, detail="Plan de Acción no encontrado")
     
     return datos_dashboard
 
+@router.get("/{id_plan}/stream", dependencies=[Depends(limitar(costo=2))])
+async def stream_dashboard(
+    id_plan: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Stream SSE (text/event-stream) del dashboard del plan: un evento `dashboard`
+    con el estado actual al conectarse y otro cada vez que una actualización
+    de tareas cambia el progreso, con el mismo JSON que GET /dashboard.
+    Reemplaza el sondeo periódico de ese endpoint. Sin Redis, los cambios
+    hechos en otro worker llegan al releer el estado cada SSE_HEARTBEAT_SECONDS.
+    """
+    if not await action_plan_service.plan_pertenece_async(db, id_plan, current_user.id_usuario):
+        raise HTTPException(status_code=404, detail="Plan de Acción no encontrado")
+    # El stream puede durar horas: la sesión de la solicitud no debe retener su conexión
+    await db.close()
+
+    return StreamingResponse(
+        _eventos_dashboard(id_plan, current_user.id_usuario),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _eventos_dashboard(id_plan: int, id_usuario: int):
+    # Primero la suscripción y después el estado actual, para no perder un cambio entre ambos
+    async with pubsub.suscribir(action_plan_service.canal_plan(id_plan)) as cola:
+        ultimo = await _dashboard_actual(id_plan, id_usuario)
+        if ultimo is None:
+            return
+        yield _evento_sse("dashboard", ultimo)
+
+        while True:
+            try:
+                ultimo = await asyncio.wait_for(cola.get(), timeout=settings.SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Sin Redis no llegan los cambios hechos en otros workers: se relee el estado
+                actual = None if pubsub.compartido() else await _dashboard_actual(id_plan, id_usuario)
+                if actual is None or actual == ultimo:
+                    yield ": latido\n\n"
+                    continue
+                ultimo = actual
+            yield _evento_sse("dashboard", ultimo)
+
+async def _dashboard_actual(id_plan: int, id_usuario: int) -> Optional[str]:
+    db = await replicas.sesion_lectura(id_usuario)
+    try:
+        datos = await run_in_threadpool(action_plan_service.dashboard_serializado, db, id_plan)
+    finally:
+        await run_in_threadpool(db.close)
+    return None if datos is None else json.dumps(datos)
+
+def _evento_sse(evento: str, datos: str) -> str:
+    return f"event: {evento}\ndata: {datos}\n\n"
+
 @router.put("/tareas/{id_tarea}")
-def actualizar_tarea(
+async def actualizar_tarea(
     id_tarea: int, 
     tarea_update: TareaUpdate, 
-    db: Session = Depends(get_db), 
-    current_user: Usuario = Depends(get_current_user)
+    response: Response,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: Usuario = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
 ):
     """
     Permite marcar una tarea como 'Completada' o 'Pendiente', y establecer fecha límite.
+    Responde 404 si la tarea no existe o es de un plan de otro usuario.
+    Admite la cabecera Idempotency-Key, igual que el envío de diagnósticos.
+    Si cambia el progreso, los streams del plan reciben el dashboard recalculado.
     """
-    tarea = action_plan_service.actualizar_tarea(db, id_tarea=id_tarea, update_data=tarea_update)
-    if not tarea:
-        raise HTTPException(status_code=404, detail="Tarea no encontrada")
-        
-    return {"mensaje": f"Tarea {id_tarea} actualizada a estado: {tarea.estado}"}
\ No newline at end of file
+    async def actualizar():
+        resultado = await action_plan_service.actualizar_tarea_async(
+            db, id_tarea=id_tarea, id_usuario=current_user.id_usuario, update_data=tarea_update
+        )
+        if not resultado:
+            raise HTTPException(status_code=404, detail="Tarea no encontrada")
+        tarea, cambio = resultado
+        await replicas.marcar_escritura(current_user.id_usuario)
+        if cambio:
+            background_tasks.add_task(action_plan_service.publicar_dashboard, tarea.id_plan)
+        return {"mensaje": f"Tarea {id_tarea} actualizada a estado: {tarea.estado}"}
+
+    respuesta, _ = await idempotency.responder(
+        response, current_user.id_usuario, idempotency_key, f"PUT /action-plan/tareas/{id_tarea}",
+        tarea_update.model_dump(mode="json"), actualizar
+    )
+    return respuesta
+
+@router.patch("/{id_plan}/tareas", response_model=DashboardTransformacionResponse,
+              dependencies=[Depends(limitar(costo=2, pesado=True))])
+async def actualizar_tareas(
+    id_plan: int,
+    actualizacion: TareasUpdateLote,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: Usuario = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
+    """
+    Actualiza varias tareas del plan a la vez (en una transacción) y devuelve
+    el dashboard ya proyectado, sin necesidad de volver a pedirlo. Si cambia
+    el progreso, los streams del plan reciben el mismo dashboard.
+    Admite la cabecera Idempotency-Key, igual que el envío de diagnósticos.
+    """
+    async def actualizar():
+        try:
+            # Proyectar el dashboard ejecuta el modelo: va al threadpool
+            resultado = await run_in_threadpool(
+                action_plan_service.actualizar_tareas_lote, db, id_plan, current_user.id_usuario, actualizacion.tareas
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        if resultado is None:
+            raise HTTPException(status_code=404, detail="Plan de Acción no encontrado")
+        dashboard, cambio = resultado
+        await replicas.marcar_escritura(current_user.id_usuario)
+        if cambio:
+            await pubsub.publicar(action_plan_service.canal_plan(id_plan), dashboard)
+        return dashboard
+
+    respuesta, _ = await idempotency.responder(
+        response, current_user.id_usuario, idempotency_key, f"PATCH /action-plan/{id_plan}/tareas",
+        actualizacion.model_dump(mode="json"), actualizar
+    )
+    return respuesta
@@ -0,0 +1,247 @@
+# ==============================================================================
+# Módulo de Endpoints de Administración
+# Herramientas internas (perfiles de CPU, memoria, cachés, versiones del
+# modelo, analítica, exportación e importación de datos) restringidas a los usuarios listados en ADMIN_EMAILS
+# ==============================================================================
+
+import datetime
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.core import memory, profiling
+from app.db.database import get_db
+from app.ml import loader, registry
+from app.services import (
+    analytics_service, catalog_service, export_service, import_service, percentile_service, report_service
+)
+from app.api.v1.endpoints.auth import get_current_admin
+
+router = APIRouter(dependencies=[Depends(get_current_admin)])
+
+# ==============================================================================
+# PERFILES DE CPU
+# ==============================================================================
+@router.get("/profiles")
+def listar_perfiles():
+    """
+    Lista los perfiles de CPU guardados por el middleware de perfilado,
+    del más reciente al más antiguo.
+    """
+    return profiling.list_profiles()
+
+@router.get("/profiles/{nombre}")
+def descargar_perfil(nombre: str):
+    """
+    Devuelve un perfil en formato speedscope (abrir en https://www.speedscope.app).
+    El nombre se obtiene de la cabecera X-Profile-Id de la solicitud perfilada.
+    """
+    ruta = profiling.get_profile_path(nombre)
+    if not ruta:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Perfil no encontrado")
+    return FileResponse(ruta, media_type="application/json", filename=nombre)
+
+# ==============================================================================
+# MEMORIA DEL WORKER
+# Cada worker de gunicorn tiene su propia memoria: las respuestas incluyen el
+# PID para saber qué worker atendió la solicitud, y las instantáneas solo
+# pueden compararse dentro del mismo worker.
+# ==============================================================================
+@router.get("/memory")
+def estado_memoria(incluir_artefactos: bool = False, incluir_objetos: bool = False, limite: int = 20):
+    """
+    Devuelve el RSS del worker, el estado de tracemalloc y, opcionalmente,
+    el tamaño estimado de los artefactos de ML y el conteo de objetos vivos por tipo.
+    """
+    resultado = {
+        "pid": os.getpid(),
+        **memory.get_rss_bytes(),
+        "tracemalloc": memory.tracing_status(),
+    }
+    if incluir_artefactos:
+        resultado["artefactos_ml"] = memory.ml_artifact_sizes()
+    if incluir_objetos:
+        resultado["objetos"] = memory.object_counts(limite)
+    return resultado
+
+@router.post("/memory/tracemalloc/start")
+def iniciar_tracemalloc(frames: int = 1):
+    """Activa tracemalloc en este worker (añade sobrecosto a cada asignación mientras esté activo)."""
+    iniciado = memory.start_tracing(frames)
+    return {"pid": os.getpid(), "iniciado": iniciado, "tracemalloc": memory.tracing_status()}
+
+@router.post("/memory/tracemalloc/stop")
+def detener_tracemalloc():
+    memory.stop_tracing()
+    return {"pid": os.getpid(), "tracemalloc": memory.tracing_status()}
+
+@router.post("/memory/snapshots")
+def tomar_snapshot(limite: int = 20):
+    """Toma una instantánea de tracemalloc y devuelve los principales asignadores."""
+    try:
+        snapshot = memory.take_snapshot(limite)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"pid": os.getpid(), **snapshot}
+
+@router.get("/memory/snapshots/{id_anterior}/diff/{id_posterior}")
+def comparar_snapshots(id_anterior: str, id_posterior: str, limite: int = 20):
+    """Compara dos instantáneas tomadas en este mismo worker."""
+    diferencia = memory.compare_snapshots(id_anterior, id_posterior, limite)
+    if diferencia is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Instantánea no encontrada en el worker {os.getpid()}."
+        )
+    return {"pid": os.getpid(), **diferencia}
+
+# ==============================================================================
+# REPORTES MATERIALIZADOS
+# ==============================================================================
+@router.delete("/reports")
+def invalidar_reportes_materializados(db: Session = Depends(get_db)):
+    """
+    Elimina todos los reportes materializados. Usar tras editar el catálogo de
+    preguntas/recomendaciones para no esperar a CATALOG_VERSION_TTL.
+    """
+    eliminados = report_service.invalidar_reportes(db)
+    db.commit()
+    catalog_service.reset_catalog_version()
+    return {"reportes_eliminados": eliminados}
+
+# ==============================================================================
+# REGISTRO DE VERSIONES DEL MODELO
+# ==============================================================================
+@router.get("/models")
+def listar_modelos():
+    """Versiones registradas, la activa según el manifiesto y la cargada en este worker."""
+    activo = loader.modelo_cargado()
+    return {
+        **registry.listar(),
+        "pid": os.getpid(),
+        "cargada_en_worker": activo.version if activo else None,
+    }
+
+@router.post("/models/{version}/activate")
+def activar_modelo(version: str):
+    """
+    Carga y activa una versión registrada (ver app.cli.model_registry). Este
+    worker la usa de inmediato; los demás la cargan en segundo plano en su
+    siguiente revisión del manifiesto (MODEL_REGISTRY_POLL_SECONDS), sin
+    reiniciarse ni rechazar solicitudes. Los diagnósticos existentes conservan
+    su versión hasta que se re-puntúen (app.cli.rescore_diagnoses).
+    """
+    try:
+        loader.activar(version)
+    except KeyError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    return {"activa": version, "pid": os.getpid()}
+
+# ==============================================================================
+# ANALÍTICA DE COHORTES
+# Se leen de las tablas de resumen mensuales, así que el costo no depende del
+# número de diagnósticos. Los periodos tienen el formato AAAA-MM.
+# ==============================================================================
+_PERIODO = r"^\d{4}-(0[1-9]|1[0-2])$"
+
+@router.get("/analytics/levels")
+def analitica_niveles(
+    desde: Optional[str] = Query(None, pattern=_PERIODO),
+    hasta: Optional[str] = Query(None, pattern=_PERIODO),
+    db: Session = Depends(get_db)
+):
+    """Distribución de niveles de madurez por mes."""
+    return analytics_service.niveles_por_mes(db, desde=desde, hasta=hasta)
+
+@router.get("/analytics/domains")
+def analitica_dominios(
+    desde: Optional[str] = Query(None, pattern=_PERIODO),
+    hasta: Optional[str] = Query(None, pattern=_PERIODO),
+    db: Session = Depends(get_db)
+):
+    """Puntaje promedio por dominio (y capacidades digital y de liderazgo) por mes."""
+    return analytics_service.dominios_por_mes(db, desde=desde, hasta=hasta)
+
+@router.get("/analytics/drivers")
+def analitica_drivers(
+    desde: Optional[str] = Query(None, pattern=_PERIODO),
+    hasta: Optional[str] = Query(None, pattern=_PERIODO),
+    limite: int = Query(10, ge=1, le=20),
+    db: Session = Depends(get_db)
+):
+    """Preguntas que más veces aparecen como driver clave (debilidad)."""
+    return analytics_service.drivers_frecuentes(db, desde=desde, hasta=hasta, limite=limite)
+
+@router.post("/analytics/rebuild")
+def reconstruir_analitica(db: Session = Depends(get_db)):
+    """
+    Recalcula las tablas de resumen desde los diagnósticos. Solo hace falta tras
+    cargas masivas fuera de la API o si se sospecha que quedaron desalineadas.
+    """
+    return analytics_service.reconstruir(db)
+
+# ==============================================================================
+# PERCENTILES ENTRE PARES
+# ==============================================================================
+@router.get("/percentiles")
+def estado_percentiles():
+    """Archivo del histograma de esta máquina y observaciones por métrica."""
+    return percentile_service.estado()
+
+@router.post("/percentiles/rebuild")
+def reconstruir_percentiles(db: Session = Depends(get_db)):
+    """Recalcula el histograma de percentiles desde los diagnósticos (ver app.cli.rebuild_percentiles)."""
+    return percentile_service.reconstruir(db)
+
+# ==============================================================================
+# EXPORTACIÓN DE DATOS
+# ==============================================================================
+@router.get("/export")
+def exportar_diagnosticos(
+    formato: str = Query("csv", pattern="^(csv|parquet)$"),
+    desde: Optional[datetime.date] = None,
+    hasta: Optional[datetime.date] = None,
+    lote: int = Query(1000, ge=100, le=20000)
+):
+    """
+    Descarga todos los diagnósticos (una fila por diagnóstico) con sus
+    respuestas crudas y normalizadas y sus valores SHAP, para reentrenar el
+    modelo. Se transmite por bloques de `lote` diagnósticos: la memoria del
+    worker no crece con el tamaño de las tablas. Ver también app.cli.export_diagnoses.
+    """
+    try:
+        contenido = export_service.exportar(formato=formato, desde=desde, hasta=hasta, lote=lote)
+    except export_service.ParquetNoDisponible as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+
+    nombre = f"diagnosticos_{datetime.date.today():%Y%m%d}.{formato}"
+    return StreamingResponse(
+        contenido,
+        media_type="text/csv" if formato == "csv" else "application/vnd.apache.parquet",
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'}
+    )
+
+# ==============================================================================
+# IMPORTACIÓN DE CUESTIONARIOS
+# ==============================================================================
+@router.post("/import")
+def importar_diagnosticos(
+    archivo: UploadFile = File(...),
+    lote: int = Query(500, ge=50, le=5000),
+    db: Session = Depends(get_db)
+):
+    """
+    Importa un CSV con un cuestionario por fila (columnas ruc, Q1..Q20 y
+    opcionalmente fecha AAAA-MM-DD; separador ',' o ';'). Las filas inválidas
+    no detienen la carga: se devuelven en `errores` con su número de fila.
+    Ver también app.cli.import_diagnoses.
+    """
+    try:
+        return import_service.importar(db, archivo.file, lote=lote)
+    except import_service.ArchivoInvalido as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
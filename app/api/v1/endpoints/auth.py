@@ -1,10 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import timedelta
+import math
 from pydantic import BaseModel, EmailStr
 
-from app.db.database import get_db
+from app.core import rate_limit
+from app.core.config import settings
+from app.db import replicas
+from app.db.database import get_async_db, get_db
 from app.schemas.user_schema import Usuario, UsuarioCreate, Token, UsuarioUpdate
 from app.services import auth_service
 
@@ -14,10 +20,12 @@ oauth2_scheme = HTTPBearer()
 # ==============================================================================
 # FUNCIÓN DE DEPENDENCIA DE SEGURIDAD
 # ==============================================================================
-def get_current_user(token_creds: HTTPAuthorizationCredentials = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token_creds: HTTPAuthorizationCredentials = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     """
     Decodifica el token Bearer, valida al usuario y devuelve el objeto de usuario de la BD.
     Actúa como el "guardia de seguridad" para los endpoints protegidos.
+    El usuario se lee con la sesión asíncrona de la solicitud: los endpoints
+    síncronos solo leen sus atributos, nunca lo guardan con su propia sesión.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -32,12 +40,75 @@ def get_current_user(token_creds: HTTPAuthorizationCredentials = Depends(oauth2_
     if email is None:
         raise credentials_exception
 
-    user = auth_service.get_user_by_email(db, email=email)
+    user = await auth_service.get_user_by_email_async(db, email=email)
     if user is None:
         raise credentials_exception
 
     return user
 
+async def get_current_admin(current_user: Usuario = Depends(get_current_user)):
+    """
+    Igual que get_current_user, pero exige que el correo del usuario esté
+    listado en ADMIN_EMAILS. Protege los endpoints de diagnóstico interno.
+    """
+    if current_user.correo_electronico.lower() not in settings.admin_emails:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Se requieren permisos de administrador."
+        )
+    return current_user
+
+def limitar(costo: int, pesado: bool = False):
+    """
+    Dependencia para rutas costosas. Descuenta `costo` tokens de la cubeta del
+    usuario y, si la ruta es `pesado` (ejecuta el modelo), ocupa uno de los
+    ML_MAX_CONCURRENT cupos mientras se atiende. Si no se admite responde 429
+    con Retry-After, en lugar de encolar la solicitud.
+    """
+    async def dependencia(current_user: Usuario = Depends(get_current_user)):
+        if not settings.RATE_LIMIT_ENABLED:
+            yield
+            return
+
+        # Primero el cupo: si el servidor está lleno no se cobran tokens al usuario
+        cupo = await rate_limit.ocupar_cupo() if pesado else None
+        if pesado and cupo is None:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="El servidor está procesando demasiados análisis. Intente de nuevo en unos segundos.",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            espera = await rate_limit.consumir(current_user.id_usuario, costo)
+            if espera > 0:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Demasiadas solicitudes. Espere unos segundos antes de volver a intentarlo.",
+                    headers={"Retry-After": str(math.ceil(espera))},
+                )
+            yield
+        finally:
+            if cupo is not None:
+                await rate_limit.liberar_cupo(cupo)
+    return dependencia
+
+async def get_read_db(current_user: Usuario = Depends(get_current_user)):
+    """
+    Sesión síncrona de solo lectura (una réplica si hay) para los datos del
+    usuario. Si el usuario escribió hace poco se usa la primaria, para que
+    vea sus propios cambios aunque la réplica vaya atrasada.
+    """
+    db = await replicas.sesion_lectura(current_user.id_usuario)
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+async def get_async_read_db(current_user: Usuario = Depends(get_current_user)):
+    """Igual que get_read_db, con una sesión asíncrona."""
+    async with await replicas.sesion_lectura_async(current_user.id_usuario) as db:
+        yield db
+
 # ==============================================================================
 # ESQUEMAS LOCALES PARA RECUPERACIÓN DE CONTRASEÑA
 # ==============================================================================
@@ -85,22 +156,25 @@ def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2Passw
 # ENDPOINTS DE GESTIÓN DE PERFIL (/me)
 # ==============================================================================
 @router.get("/me", response_model=Usuario)
-def read_current_user(current_user: Usuario = Depends(get_current_user)):
+async def read_current_user(current_user: Usuario = Depends(get_current_user)):
     """
     Endpoint para que un usuario autenticado obtenga su propia información.
     """
     return current_user
 
 @router.put("/me", response_model=Usuario)
-def update_current_user_profile(
+async def update_current_user_profile(
     user_update: UsuarioUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Usuario = Depends(get_current_user)
 ):
     """
     Endpoint para que un usuario autenticado actualice su propio perfil (nombre y RUC).
+    get_current_user comparte esta misma sesión asíncrona, así que el usuario se guarda con ella.
     """
-    return auth_service.update_user(db=db, db_user=current_user, user_update=user_update)
+    usuario = await auth_service.update_user_async(db=db, db_user=current_user, user_update=user_update)
+    await replicas.marcar_escritura(usuario.id_usuario)
+    return usuario
 
 # ==============================================================================
 # ENDPOINTS DE RECUPERACIÓN DE CONTRASEÑA
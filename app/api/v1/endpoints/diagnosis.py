@@ -3,23 +3,27 @@
 # Maneja la creación, consulta y generación de reportes de diagnósticos
 # ==============================================================================
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Response, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from app.core import idempotency
+from app.db import replicas
 from app.db.database import get_db
 from app.schemas.diagnosis_schema import Diagnostico, DiagnosticoCreate
 from app.services import diagnosis_service
 from app.schemas.user_schema import Usuario
-from app.api.v1.endpoints.auth import get_current_user
-from app.schemas.report_schema import ReporteDiagnostico
-from app.services import report_service
+from app.api.v1.endpoints.auth import get_async_read_db, get_current_user, get_read_db, limitar
+from app.schemas.report_schema import ReporteDiagnostico, ComparacionDiagnosticos, RutaSiguienteNivel
+from app.services import counterfactual_service, report_service
 from app.models.diagnosis import Diagnostico as DiagnosticoModel
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Diagnostico])
-def get_user_diagnosis_history(
-    db: Session = Depends(get_db),
+async def get_user_diagnosis_history(
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: Usuario = Depends(get_current_user)
 ):
     """
@@ -27,13 +31,29 @@ def get_user_diagnosis_history(
     """
 
     user_id = current_user.id_usuario
-    return diagnosis_service.get_user_diagnoses(db=db, user_id=user_id)
+    return await diagnosis_service.get_user_diagnoses_async(db=db, user_id=user_id)
 
-@router.post("/", response_model=Diagnostico, status_code=status.HTTP_201_CREATED)
-def submit_diagnosis(
+@router.get("/compare", response_model=ComparacionDiagnosticos)
+def compare_user_diagnoses(
+    db: Session = Depends(get_read_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Endpoint para el gráfico de evolución: compara los diagnósticos conservados
+    del usuario (del más antiguo al más reciente) y devuelve los cambios por
+    dominio y por pregunta, sin volver a ejecutar el modelo.
+    """
+    return report_service.comparar_diagnosticos(db, user_id=current_user.id_usuario)
+
+@router.post("/", response_model=Diagnostico, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(limitar(costo=10, pesado=True))])
+async def submit_diagnosis(
     diagnostico_data: DiagnosticoCreate,
+    background_tasks: BackgroundTasks,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: Usuario = Depends(get_current_user)
+    current_user: Usuario = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
 ):
     """
     Endpoint para procesar un nuevo diagnóstico.
@@ -44,7 +64,12 @@ def submit_diagnosis(
     - current_user: Usuario autenticado que realiza la solicitud
     
     El sistema procesa las respuestas utilizando el modelo de Machine Learning
-    y genera un diagnóstico completo con recomendaciones.
+    y genera un diagnóstico completo con recomendaciones. El reporte se
+    materializa en segundo plano, después de enviar la respuesta.
+
+    Con la cabecera Idempotency-Key, los reintentos con la misma clave reciben
+    el diagnóstico creado la primera vez (o esperan a que termine) en lugar
+    de crear otro.
     """
     if len(diagnostico_data.respuestas) != 20:
         raise HTTPException(
@@ -54,35 +79,75 @@ def submit_diagnosis(
 
     user_id = current_user.id_usuario
 
-    return diagnosis_service.create_and_process_diagnosis(
-        db=db, 
-        user_id=user_id, 
-        respuestas_schema=diagnostico_data.respuestas
+    def crear():
+        db_diagnostico = diagnosis_service.create_and_process_diagnosis(
+            db=db, 
+            user_id=user_id, 
+            respuestas_schema=diagnostico_data.respuestas
+        )
+        return Diagnostico.model_validate(db_diagnostico).model_dump(mode="json")
+
+    # El modelo y SHAP son trabajo de CPU: se ejecutan en el threadpool, no en el event loop
+    respuesta, repetida = await idempotency.responder(
+        response, user_id, idempotency_key, "POST /diagnosis", diagnostico_data.model_dump(mode="json"),
+        lambda: run_in_threadpool(crear)
     )
+    await replicas.marcar_escritura(user_id)
+    if not repetida:
+        background_tasks.add_task(report_service.materializar_reporte_en_segundo_plano, respuesta["id_diagnostico"])
+    return respuesta
 
-@router.get("/{diagnosis_id}/report", response_model=ReporteDiagnostico)
-def get_diagnosis_full_report(
+@router.get("/{diagnosis_id}/report", response_model=ReporteDiagnostico,
+            dependencies=[Depends(limitar(costo=1))])
+async def get_diagnosis_full_report(
     diagnosis_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: Usuario = Depends(get_current_user)
 ):
     """
     Endpoint que devuelve el reporte completo y formateado para el dashboard
-    de un diagnóstico específico.
+    de un diagnóstico específico. Si ya está materializado para la versión
+    actual del modelo y del catálogo, es una única lectura por clave. Los
+    percentiles frente a otras empresas se añaden al leer, desde el histograma.
     """
     user_id = current_user.id_usuario
-    
-    # Verificamos que el diagnóstico exista y pertenezca al usuario
-    db_diagnostico = db.query(DiagnosticoModel).filter(
-        DiagnosticoModel.id_diagnostico == diagnosis_id,
-        DiagnosticoModel.id_usuario == user_id
-    ).first()
 
-    if not db_diagnostico:
+    reporte = await report_service.obtener_reporte_materializado_async(db, id_diagnostico=diagnosis_id, user_id=user_id)
+    if reporte is not None:
+        return report_service.agregar_percentiles(reporte)
+
+    # Primera lectura (o versión obsoleta): generar el reporte ejecuta el modelo,
+    # así que se hace en el threadpool y no en el event loop. Guarda el reporte,
+    # por eso usa su propia sesión de la primaria.
+    reporte = await run_in_threadpool(report_service.materializar_reporte_de_usuario, diagnosis_id, user_id)
+    if reporte is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Diagnóstico no encontrado o no pertenece al usuario."
         )
+    return report_service.agregar_percentiles(reporte)
 
-    # Llamamos a un futuro servicio que generará el reporte
-    return report_service.generate_full_report(db=db, db_diagnostico=db_diagnostico)
\ No newline at end of file
+@router.get("/{diagnosis_id}/next-level", response_model=RutaSiguienteNivel,
+            dependencies=[Depends(limitar(costo=5, pesado=True))])
+def get_path_to_next_level(
+    diagnosis_id: int,
+    max_cambios: int = Query(5, ge=1, le=10),
+    db: Session = Depends(get_read_db),
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Endpoint que devuelve el conjunto más pequeño de mejoras en las respuestas
+    con el que el modelo predice el siguiente nivel de madurez (a lo sumo
+    `max_cambios` preguntas), con cada respuesta sugerida en la escala del
+    cuestionario. La búsqueda tiene presupuestos de evaluaciones y de tiempo.
+    """
+    existe = db.query(DiagnosticoModel.id_diagnostico).filter(
+        DiagnosticoModel.id_diagnostico == diagnosis_id,
+        DiagnosticoModel.id_usuario == current_user.id_usuario
+    ).first()
+    if not existe:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Diagnóstico no encontrado o no pertenece al usuario."
+        )
+    return counterfactual_service.ruta_siguiente_nivel(db, id_diagnostico=diagnosis_id, max_cambios=max_cambios)
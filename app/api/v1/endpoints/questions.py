@@ -4,17 +4,18 @@
 # ==============================================================================
 
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from app.db.database import get_db
+from app.db.replicas import get_async_replica_db
 from app.models.question import Pregunta
 from app.schemas.question_schema import Pregunta as PreguntaSchema
 
 router = APIRouter()
 
 @router.get("/", response_model=List[PreguntaSchema])
-def read_questions(db: Session = Depends(get_db)):
+async def read_questions(db: AsyncSession = Depends(get_async_replica_db)):
     """
     Endpoint para obtener la lista completa de las 20 preguntas del cuestionario.
     
@@ -24,5 +25,5 @@ def read_questions(db: Session = Depends(get_db)):
     - El orden es crítico para el correcto procesamiento del diagnóstico
     """
     # Se asegura de que las preguntas se envíen siempre en el orden correcto.
-    questions = db.query(Pregunta).order_by(Pregunta.id_pregunta.asc()).all()
+    questions = (await db.execute(select(Pregunta).order_by(Pregunta.id_pregunta.asc()))).scalars().all()
     return questions
\ No newline at end of file
@@ -0,0 +1,86 @@
+# ==============================================================================
+# Compactación del Modelo
+# Convierte el RandomForest de una versión del registro (la activa por
+# defecto) en un BosqueCompacto (app.ml.compact), imprime el reporte de
+# paridad y, si las probabilidades son idénticas bit a bit, registra el
+# resultado como nueva versión con el mismo codificador y explicador SHAP.
+#
+# Uso:
+#   python -m app.cli.compact_model
+#   python -m app.cli.compact_model --version 41209cd70a80 --reporte paridad.json --activar
+#   python -m app.cli.compact_model --sin-registrar
+# ==============================================================================
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from app.ml import compact, loader, registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compacta el modelo de ML y verifica la paridad de sus predicciones.")
+    parser.add_argument("--version", help="Versión a compactar (por defecto, la activa)")
+    parser.add_argument("--filas", type=int, default=20000, help="Filas del corpus de paridad")
+    parser.add_argument("--reporte", help="Además de imprimirlo, guarda el reporte JSON en este archivo")
+    parser.add_argument("--sin-registrar", action="store_true", help="Solo genera el reporte")
+    parser.add_argument("--activar", action="store_true", help="Activa la versión compacta tras registrarla")
+    args = parser.parse_args()
+
+    import joblib
+
+    if args.version:
+        version, rutas = args.version, registry.rutas(args.version)
+    else:
+        version, rutas = registry.version_activa()
+    bosque = joblib.load(rutas["modelo"])
+    if isinstance(bosque, compact.BosqueCompacto):
+        sys.exit(f"La versión {version} ya está compactada.")
+    explainer = joblib.load(rutas["explainer"])
+
+    compacto, estadisticas = compact.compactar(bosque)
+    reporte = {"version_original": version, "estructura": estadisticas,
+               **compact.comparar(bosque, compacto, explainer, filas=args.filas)}
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.reporte:
+        with open(args.reporte, "w", encoding="utf-8") as f:
+            f.write(texto)
+
+    if not reporte["identicas"]:
+        sys.exit(f"El bosque compacto difiere en {reporte['filas_con_diferencias']} filas; no se registra.")
+    if args.sin_registrar:
+        return
+
+    if registry.leer_manifest() is None:
+        # Sin registro, la primera versión registrada queda activa: se registra antes la original
+        registry.registrar(os.path.dirname(rutas["modelo"]), descripcion="Artefactos sueltos de app/ml")
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        joblib.dump(compacto, os.path.join(carpeta, registry.ARCHIVOS["modelo"]))
+        # El codificador y el explicador no cambian: el bosque compacto calcula la misma función
+        for clave in ("label_encoder", "explainer"):
+            shutil.copy2(rutas[clave], os.path.join(carpeta, registry.ARCHIVOS[clave]))
+        nueva = registry.registrar(carpeta, descripcion=f"Compactado de {version}", metricas={
+            "compactado_de": version,
+            "paridad_filas": reporte["filas"],
+            "shap_desviacion_aditividad_max": reporte["shap"]["desviacion_aditividad_max"],
+            "tamano": reporte["tamano"],
+            "latencia_ms": reporte["latencia_ms"],
+        })
+    print(f"Registrada la versión compacta {nueva} en {registry.directorio()}")
+    if not args.activar:
+        return
+
+    try:
+        loader.activar(nueva)
+    except (KeyError, RuntimeError) as e:
+        sys.exit(str(e))
+    print(f"Versión activa: {nueva}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# ==============================================================================
+# Exportación de Diagnósticos
+# Escribe a un archivo la misma exportación que GET /admin/export (una fila
+# por diagnóstico con respuestas y valores SHAP), con memoria acotada.
+#
+# Uso:
+#   python -m app.cli.export_diagnoses --formato parquet --salida diagnosticos.parquet
+#   python -m app.cli.export_diagnoses --desde 2025-01-01 --hasta 2025-06-30 > diagnosticos.csv
+# ==============================================================================
+
+import argparse
+import datetime
+import sys
+import time
+
+from app.services import export_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta los diagnósticos con sus respuestas y valores SHAP.")
+    parser.add_argument("--formato", choices=export_service.FORMATOS, default="csv")
+    parser.add_argument("--salida", help="Archivo de salida (por defecto, la salida estándar)")
+    parser.add_argument("--desde", type=datetime.date.fromisoformat, help="Fecha inicial (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=datetime.date.fromisoformat, help="Fecha final inclusiva (AAAA-MM-DD)")
+    parser.add_argument("--lote", type=int, default=1000, help="Diagnósticos por bloque")
+    args = parser.parse_args()
+
+    if args.formato == "parquet" and not args.salida:
+        parser.error("--salida es obligatorio para Parquet")
+
+    inicio = time.perf_counter()
+    try:
+        contenido = export_service.exportar(args.formato, desde=args.desde, hasta=args.hasta, lote=args.lote)
+    except export_service.ParquetNoDisponible as e:
+        sys.exit(str(e))
+
+    salida = open(args.salida, "wb") if args.salida else sys.stdout.buffer
+    total = 0
+    try:
+        for bloque in contenido:
+            salida.write(bloque)
+            total += len(bloque)
+    finally:
+        if args.salida:
+            salida.close()
+    print(f"Exportados {total / 1e6:.1f} MB en {time.perf_counter() - inicio:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
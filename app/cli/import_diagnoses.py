@@ -0,0 +1,52 @@
+# ==============================================================================
+# Importación de Diagnósticos
+# Carga el mismo CSV que POST /admin/import (ruc, Q1..Q20 y opcionalmente
+# fecha) directamente contra la base de datos, sin límite de tamaño de subida.
+#
+# Uso:
+#   python -m app.cli.import_diagnoses cuestionarios.csv
+#   python -m app.cli.import_diagnoses cuestionarios.csv --errores errores.csv --lote 1000
+# ==============================================================================
+
+import argparse
+import csv
+import sys
+
+from app.db.database import SessionLocal
+from app.services import import_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa cuestionarios desde un CSV (una fila por empresa).")
+    parser.add_argument("archivo", help="CSV con las columnas ruc, Q1..Q20 y opcionalmente fecha")
+    parser.add_argument("--errores", help="Escribe aquí el reporte de filas rechazadas (CSV)")
+    parser.add_argument("--lote", type=int, default=500, help="Filas puntuadas y guardadas por transacción")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        with open(args.archivo, "rb") as archivo:
+            resumen = import_service.importar(db, archivo, lote=args.lote, log=True)
+    except import_service.ArchivoInvalido as e:
+        sys.exit(str(e))
+    finally:
+        db.close()
+
+    if args.errores:
+        with open(args.errores, "w", newline="", encoding="utf-8") as salida:
+            escritor = csv.writer(salida)
+            escritor.writerow(["fila", "ruc", "errores"])
+            for error in resumen["errores"]:
+                escritor.writerow([error["fila"], error["ruc"], " | ".join(error["errores"])])
+    else:
+        for error in resumen["errores"][:20]:
+            print(f"  fila {error['fila']} ({error['ruc'] or 'sin ruc'}): {'; '.join(error['errores'])}")
+        if resumen["con_errores"] > 20:
+            print(f"  ... y {resumen['con_errores'] - 20} filas más (usar --errores para el detalle)")
+
+    print(f"Listo en {resumen['duracion_s']}s: {resumen['filas']} filas, "
+          f"{resumen['importadas']} importadas, {resumen['con_errores']} con errores")
+
+
+if __name__ == "__main__":
+    main()
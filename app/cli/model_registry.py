@@ -0,0 +1,52 @@
+# ==============================================================================
+# Registro de Versiones del Modelo
+# Registra una carpeta con modelo_rf.joblib, label_encoder.joblib y
+# shap_explainer.joblib como nueva versión, la activa o lista las existentes.
+# Los workers en ejecución cargan la versión activa sin reiniciarse.
+#
+# Uso:
+#   python -m app.cli.model_registry listar
+#   python -m app.cli.model_registry registrar ruta/artefactos --descripcion "Reentrenado 2025-10" --activar
+#   python -m app.cli.model_registry activar 41209cd70a80
+# ==============================================================================
+
+import argparse
+import json
+import sys
+
+from app.ml import loader, registry
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Administra las versiones del modelo de ML.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    comandos.add_parser("listar", help="Muestra las versiones registradas y la activa")
+    registrar = comandos.add_parser("registrar", help="Copia una carpeta de artefactos al registro")
+    registrar.add_argument("carpeta")
+    registrar.add_argument("--descripcion", default="")
+    registrar.add_argument("--activar", action="store_true", help="Activa la versión tras registrarla")
+    activar = comandos.add_parser("activar", help="Cambia la versión activa")
+    activar.add_argument("version")
+    args = parser.parse_args()
+
+    if args.comando == "listar":
+        print(json.dumps(registry.listar(), indent=2, ensure_ascii=False))
+        return
+    if args.comando == "registrar":
+        version = registry.registrar(args.carpeta, descripcion=args.descripcion)
+        print(f"Registrada la versión {version} en {registry.directorio()}")
+        if not args.activar:
+            return
+    else:
+        version = args.version
+
+    try:
+        # Cargarla aquí verifica que los artefactos sirven antes de publicarla
+        loader.activar(version)
+    except (KeyError, RuntimeError) as e:
+        sys.exit(str(e))
+    print(f"Versión activa: {version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# ==============================================================================
+# Reconstrucción del Histograma de Percentiles
+# Recalcula desde la base de datos los histogramas de SKETCH_DIR. La API ya
+# los reconstruye sola si el archivo no existe o deja de cuadrar; esto sirve
+# tras cargas masivas fuera de la API.
+#
+# Uso:
+#   python -m app.cli.rebuild_percentiles
+# ==============================================================================
+
+import argparse
+import time
+
+from app.db.database import SessionLocal
+from app.services import percentile_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruye el histograma de percentiles entre pares.")
+    parser.add_argument("--lote", type=int, default=5000, help="Diagnósticos leídos por consulta")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    db = SessionLocal()
+    try:
+        resumen = percentile_service.reconstruir(db, lote=args.lote, log=True)
+    finally:
+        db.close()
+    print(f"Listo en {time.perf_counter() - inicio:.1f}s: {resumen}")
+    print(percentile_service.estado())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# ==============================================================================
+# Re-puntuación de Diagnósticos
+# Tras reemplazar modelo_rf.joblib / shap_explainer.joblib, recalcula el nivel
+# predicho y los valores SHAP de todos los diagnósticos guardados. Se puede
+# interrumpir (Ctrl+C) y volver a lanzar: continúa desde el punto de control.
+#
+# Uso:
+#   python -m app.cli.rescore_diagnoses
+#   python -m app.cli.rescore_diagnoses --workers 4 --lote 5000 --checkpoint /var/tmp/rescore.json
+# ==============================================================================
+
+import argparse
+import sys
+
+from app.db.database import SessionLocal
+from app.services import rescoring_service
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-puntúa los diagnósticos guardados con los artefactos actuales.")
+    parser.add_argument("--checkpoint", default="rescore_checkpoint.json", help="Archivo del punto de control")
+    parser.add_argument("--lote", type=int, default=2000, help="Diagnósticos leídos y escritos por transacción")
+    parser.add_argument("--workers", type=int, help="Procesos de puntuación (por defecto, uno por CPU; 0 = sin pool)")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora el punto de control y empieza de cero")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        estado = rescoring_service.re_puntuar(
+            db, args.checkpoint, lote=args.lote, workers=args.workers, reiniciar=args.reiniciar, log=True
+        )
+    except KeyboardInterrupt:
+        sys.exit(f"\nInterrumpido. Vuelva a ejecutar el comando para continuar desde {args.checkpoint}.")
+    finally:
+        db.close()
+    print(f"Listo: {estado['procesados']} diagnósticos re-puntuados con la versión {estado['version_modelo']}, "
+          f"{estado['cambios_nivel']} cambiaron de nivel.")
+
+
+if __name__ == "__main__":
+    main()
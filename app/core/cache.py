@@ -0,0 +1,65 @@
+# ==============================================================================
+# Caché LRU en memoria
+# Caché acotada y segura entre hilos para resultados derivados que son caros de
+# calcular (por ejemplo, las simulaciones del modelo). Cada worker de gunicorn
+# tiene la suya, así que las claves deben identificar por completo el resultado.
+# ==============================================================================
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class LRUCache:
+    """Diccionario con capacidad máxima que descarta la entrada usada hace más tiempo."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._datos: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clave: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                valor = self._datos[clave]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return valor
+
+    def set(self, clave: Hashable, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def get_or_compute(self, clave: Hashable, calcular: Callable[[], Any]) -> Any:
+        """
+        Devuelve el valor cacheado o lo calcula fuera del lock y lo guarda.
+        Dos hilos pueden calcular la misma clave a la vez; el resultado es el mismo.
+        """
+        valor = self.get(clave, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = calcular()
+            self.set(clave, valor)
+        return valor
+
+    def clear(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entradas": len(self._datos), "capacidad": self.maxsize,
+                    "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+_AUSENTE = object()
@@ -1,9 +1,16 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    
+
     FRONTEND_URL: str = "http://localhost:8080" # Un valor por defecto para desarrollo local
     DATABASE_URL: str
+    # Réplicas de solo lectura (URLs separadas por comas; vacío = todo a la primaria).
+    # Sin REDIS_URL, las lecturas de usuarios van igual a la primaria (ver app.db.replicas).
+    DATABASE_REPLICA_URLS: str = ""
+    # Segundos que las lecturas de un usuario van a la primaria después de que escribe.
+    REPLICA_LAG_GUARD_SECONDS: float = 5.0
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
@@ -14,9 +21,80 @@ class Settings(BaseSettings):
     MAIL_SERVER: str
     MAIL_STARTTLS: bool = True
     MAIL_SSL_TLS: bool = False
+
+    # --- Administración ---
+    # Correos (separados por comas) de los usuarios con acceso a los endpoints /admin.
+    ADMIN_EMAILS: str = ""
+
+    # --- Perfilado bajo demanda (CPU) ---
+    # Si PROFILING_ENABLED es False el middleware ni siquiera se registra (costo cero).
+    PROFILING_ENABLED: bool = False
+    # Token que debe enviarse en la cabecera X-Profile para perfilar una solicitud concreta.
+    PROFILING_TOKEN: str = ""
+    # Fracción de solicitudes (0.0 a 1.0) que se perfilan de forma aleatoria.
+    PROFILING_SAMPLE_RATE: float = 0.0
+    # Intervalo de muestreo del perfilador estadístico, en segundos.
+    PROFILING_INTERVAL: float = 0.005
+    PROFILING_DIR: str = "profiles"
+
+    # --- Reportes materializados ---
+    # Cada cuántos segundos se recalcula la huella del catálogo de preguntas/recomendaciones.
+    CATALOG_VERSION_TTL: int = 300
+
+    # --- Caché del dashboard del plan de acción ---
+    # Entradas máximas (por worker) de análisis base y proyecciones cacheadas.
+    DASHBOARD_CACHE_SIZE: int = 2048
+
+    # --- Percentiles entre pares ---
+    # Carpeta local donde se guardan los histogramas compartidos entre workers
+    # (si es relativa, respecto de la raíz del proyecto).
+    SKETCH_DIR: str = "sketches"
+
+    # --- Registro de versiones del modelo ---
+    # Carpeta con manifest.json y una subcarpeta por versión (vacío = app/ml/registry).
+    MODEL_REGISTRY_DIR: str = ""
+    # Cada cuántos segundos cada worker revisa si cambió la versión activa (0 = nunca).
+    MODEL_REGISTRY_POLL_SECONDS: int = 30
+
+    # --- Límite de solicitudes en rutas costosas ---
+    RATE_LIMIT_ENABLED: bool = True
+    # Cubeta de tokens por usuario: tokens máximos acumulados y tokens recuperados por segundo.
+    RATE_LIMIT_BURST: int = 60
+    RATE_LIMIT_TOKENS_PER_SECOND: float = 1.0
+    # Solicitudes de rutas con ML atendidas a la vez (por worker; con Redis, entre todos los workers).
+    ML_MAX_CONCURRENT: int = 8
+    # Redis compartido entre workers (vacío = estado en memoria de cada worker).
+    REDIS_URL: str = ""
+
+    # --- Solicitudes idempotentes (cabecera Idempotency-Key) ---
+    # Segundos que se guarda la primera respuesta de cada clave.
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    # Segundos que un reintento espera a que termine la solicitud original con la misma clave.
+    IDEMPOTENCY_WAIT_SECONDS: float = 30.0
+
+    # --- Streams SSE (dashboard en vivo) ---
+    # Segundos entre comentarios de latido, para que los proxies no cierren la conexión inactiva.
+    # Sin REDIS_URL, en cada latido se relee el dashboard (los cambios de otros workers no llegan).
+    SSE_HEARTBEAT_SECONDS: float = 15.0
+
+    # --- Trazado de consultas SQL (desarrollo) ---
+    # Si QUERY_TRACING_ENABLED es False el middleware ni siquiera se registra (costo cero).
+    QUERY_TRACING_ENABLED: bool = False
+    # Veces que una sentencia debe repetirse en una solicitud para listarla en el log (posible N+1).
+    QUERY_TRACING_REPEAT_THRESHOLD: int = 3
+
     class Config:
         env_file = ".env"
 
+    @property
+    def admin_emails(self) -> set:
+        return {e.strip().lower() for e in self.ADMIN_EMAILS.split(",") if e.strip()}
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Instancia única de la configuración; el entorno y .env se leen en la primera llamada."""
+    return Settings()
+
 # Creamos una instancia única de la configuración que será importada
 # por el resto de la aplicación.
-settings = Settings()
\ No newline at end of file
+settings: Settings = get_settings()
@@ -0,0 +1,197 @@
+# ==============================================================================
+# Solicitudes Idempotentes (cabecera Idempotency-Key)
+# Un cliente que reintenta una solicitud con la misma clave recibe la primera
+# respuesta guardada en lugar de volver a ejecutarla. La respuesta se guarda
+# por (usuario, clave) durante IDEMPOTENCY_TTL_SECONDS; si la original sigue
+# en curso, el reintento espera su resultado (hasta IDEMPOTENCY_WAIT_SECONDS).
+#
+# Solo se guardan las respuestas exitosas: si la solicitud original falla, la
+# clave se libera y el siguiente reintento la ejecuta de nuevo.
+#
+# Con REDIS_URL las claves viven en Redis; sin él (o si Redis no responde)
+# en la tabla Claves_Idempotencia. En ambos casos las comparten todos los
+# workers: un reintento que llega a otro worker encuentra la misma clave.
+# ==============================================================================
+
+import asyncio
+import datetime
+import hashlib
+import json
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, delete, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from app.core import redis_client
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.models.idempotency import ClaveIdempotencia
+
+_PREFIJO = "digipath:idempotencia"
+# Mientras la original está en curso la clave caduca antes, por si el worker muere a mitad
+_TTL_EN_CURSO = 120
+_SONDEO_S = 0.05
+_SONDEO_DB_S = 0.2
+
+_EN_CURSO = "en_curso"
+_LISTA = "lista"
+
+
+class ClaveReutilizada(Exception):
+    """La clave ya se usó con otra operación u otro cuerpo de solicitud."""
+
+class SolicitudEnCurso(Exception):
+    """La solicitud original con esta clave no terminó dentro del tiempo de espera."""
+
+class _SinRedis(Exception):
+    """Redis falló antes de ejecutar la solicitud: todavía se puede usar la base de datos."""
+
+
+def huella(operacion: str, cuerpo: Any) -> str:
+    """Identifica la operación y el cuerpo enviados con la clave."""
+    contenido = json.dumps([operacion, cuerpo], sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+async def ejecutar(id_usuario: int, clave: str, huella_solicitud: str,
+                   calcular: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """
+    Ejecuta `calcular` una sola vez por (usuario, clave). Devuelve la respuesta
+    (que debe ser serializable a JSON) y si es una repetición de la guardada.
+    """
+    cliente = redis_client.get_redis()
+    if cliente is not None:
+        try:
+            return await _ejecutar_redis(cliente, f"{_PREFIJO}:{id_usuario}:{clave}", huella_solicitud, calcular)
+        except _SinRedis as e:
+            print(f"Idempotencia sin Redis ({e}); se usa la base de datos.")
+    return await _ejecutar_db(id_usuario, clave, huella_solicitud, calcular)
+
+async def responder(response: Response, id_usuario: int, clave: Optional[str], operacion: str, cuerpo: Any,
+                    calcular: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """
+    Para los endpoints: sin clave solo ejecuta `calcular`. Con clave, las
+    repeticiones llevan la cabecera Idempotent-Replayed y los conflictos se
+    responden con 422 (clave reutilizada) o 409 (original aún en curso).
+    """
+    if clave is None:
+        return await calcular(), False
+    try:
+        respuesta, repetida = await ejecutar(id_usuario, clave, huella(operacion, cuerpo), calcular)
+    except ClaveReutilizada:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="La cabecera Idempotency-Key ya se usó con otra solicitud."
+        )
+    except SolicitudEnCurso:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="La solicitud original con esta Idempotency-Key aún está en curso.",
+            headers={"Retry-After": "1"}
+        )
+    if repetida:
+        response.headers["Idempotent-Replayed"] = "true"
+    return respuesta, repetida
+
+
+# ==============================================================================
+# COMPARTIDO EN LA BASE DE DATOS (sin Redis)
+# ==============================================================================
+def _fila(id_usuario: int, clave: str):
+    return and_(ClaveIdempotencia.id_usuario == id_usuario, ClaveIdempotencia.clave == clave)
+
+async def _ejecutar_db(id_usuario: int, clave: str, huella_solicitud: str,
+                       calcular: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    limite = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        async with AsyncSessionLocal() as db:
+            ahora = datetime.datetime.utcnow()
+            # Las claves caducadas del usuario (también una en curso de un worker que murió)
+            await db.execute(delete(ClaveIdempotencia).where(
+                ClaveIdempotencia.id_usuario == id_usuario, ClaveIdempotencia.expira < ahora
+            ))
+            db.add(ClaveIdempotencia(
+                id_usuario=id_usuario, clave=clave, huella=huella_solicitud, estado=_EN_CURSO,
+                expira=ahora + datetime.timedelta(seconds=_TTL_EN_CURSO)
+            ))
+            try:
+                # La clave primaria hace de candado: solo un INSERT gana
+                await db.commit()
+                break
+            except IntegrityError:
+                await db.rollback()
+            entrada = await db.get(ClaveIdempotencia, (id_usuario, clave))
+
+        if entrada is None:
+            continue  # se liberó entre el INSERT y la lectura
+        if entrada.huella != huella_solicitud:
+            raise ClaveReutilizada()
+        if entrada.estado == _LISTA:
+            return json.loads(entrada.respuesta), True
+        if time.monotonic() >= limite:
+            raise SolicitudEnCurso()
+        await asyncio.sleep(_SONDEO_DB_S)
+
+    try:
+        respuesta = await calcular()
+    except BaseException:
+        await _escribir_db(delete(ClaveIdempotencia).where(_fila(id_usuario, clave)))
+        raise
+    await _escribir_db(update(ClaveIdempotencia).where(_fila(id_usuario, clave)).values(
+        estado=_LISTA, respuesta=json.dumps(respuesta),
+        expira=datetime.datetime.utcnow() + datetime.timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+    ))
+    return respuesta, False
+
+async def _escribir_db(sentencia):
+    # La solicitud ya se ejecutó: un fallo aquí no debe hacer que se repita, solo se registra
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(sentencia)
+            await db.commit()
+    except SQLAlchemyError as e:
+        print(f"No se pudo actualizar la clave de idempotencia: {e}")
+
+
+# ==============================================================================
+# COMPARTIDO EN REDIS
+# ==============================================================================
+async def _ejecutar_redis(cliente, clave: str, huella_solicitud: str,
+                          calcular: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    limite = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    en_curso = json.dumps({"huella": huella_solicitud, "estado": _EN_CURSO})
+    try:
+        while not await cliente.set(clave, en_curso, nx=True, ex=_TTL_EN_CURSO):
+            valor = await cliente.get(clave)
+            if valor is None:
+                continue  # caducó o se liberó entre el SET y el GET
+            entrada = json.loads(valor)
+            if entrada["huella"] != huella_solicitud:
+                raise ClaveReutilizada()
+            if entrada["estado"] == _LISTA:
+                return entrada["respuesta"], True
+            if time.monotonic() >= limite:
+                raise SolicitudEnCurso()
+            await asyncio.sleep(_SONDEO_S)
+    except redis_client.ERRORES_REDIS as e:
+        raise _SinRedis(e)
+
+    # Desde aquí la solicitud ya se ejecutó (o se está ejecutando): un fallo de
+    # Redis no debe hacer que se repita, solo se registra
+    try:
+        respuesta = await calcular()
+    except BaseException:
+        await _sin_fallar(cliente.delete(clave))
+        raise
+    await _sin_fallar(cliente.set(
+        clave, json.dumps({"huella": huella_solicitud, "estado": _LISTA, "respuesta": respuesta}),
+        ex=settings.IDEMPOTENCY_TTL_SECONDS
+    ))
+    return respuesta, False
+
+async def _sin_fallar(operacion: Awaitable[Any]):
+    try:
+        await operacion
+    except redis_client.ERRORES_REDIS as e:
+        print(f"No se pudo actualizar la clave de idempotencia: {e}")
@@ -0,0 +1,42 @@
+# ==============================================================================
+# Importaciones Perezosas
+# pandas y numpy tardan cientos de milisegundos en importarse y solo los usan
+# las rutas con ML. Los servicios los declaran así:
+#
+#   np = importar_perezoso("numpy")
+#
+# y la importación real ocurre en el primer acceso a un atributo (np.array),
+# de modo que arrancar un worker (importar app.main) no paga ese costo.
+# Esos módulos llevan `from __future__ import annotations`, para que las
+# anotaciones como pd.DataFrame no se evalúen al importarlos.
+# ==============================================================================
+
+import importlib
+from types import ModuleType
+from typing import Optional
+
+
+class ModuloPerezoso:
+    """Representa un módulo que se importa recién cuando se usa uno de sus atributos."""
+
+    __slots__ = ("_nombre", "_modulo")
+
+    def __init__(self, nombre: str):
+        self._nombre = nombre
+        self._modulo: Optional[ModuleType] = None
+
+    def __getattr__(self, atributo: str):
+        # Solo se llama para atributos que no son los de __slots__
+        modulo = self._modulo
+        if modulo is None:
+            # import_module usa el lock de importación: dos hilos no lo importan dos veces
+            modulo = self._modulo = importlib.import_module(self._nombre)
+        return getattr(modulo, atributo)
+
+    def __repr__(self) -> str:
+        estado = "importado" if self._modulo is not None else "sin importar"
+        return f"<módulo perezoso {self._nombre!r} ({estado})>"
+
+
+def importar_perezoso(nombre: str) -> ModuloPerezoso:
+    return ModuloPerezoso(nombre)
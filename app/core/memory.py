@@ -0,0 +1,159 @@
+# ==============================================================================
+# Introspección de Memoria del Worker
+# Utilidades para medir RSS, tomar y comparar instantáneas de tracemalloc
+# y estimar el tamaño de los artefactos de ML cargados en memoria
+# ==============================================================================
+
+import gc
+import os
+import pickle
+import threading
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from app.ml import loader, registry
+
+# Las instantáneas viven en memoria del propio worker; limitamos cuántas guardamos
+# porque cada una puede ocupar varios MB.
+_MAX_SNAPSHOTS = 10
+_snapshots: "OrderedDict[str, tuple]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_rss_bytes() -> Dict[str, Optional[int]]:
+    """Devuelve el RSS actual y el pico del proceso (en bytes) cuando el sistema lo permite."""
+    actual, pico = None, None
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    actual = int(linea.split()[1]) * 1024
+                elif linea.startswith("VmHWM:"):
+                    pico = int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    if pico is None:
+        try:
+            import resource
+            # En Linux ru_maxrss viene en KB
+            pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except (ImportError, OSError):
+            pass
+    return {"rss_bytes": actual, "rss_pico_bytes": pico}
+
+
+# --- tracemalloc ---
+
+def start_tracing(nframes: int = 1) -> bool:
+    """Activa tracemalloc. Devuelve False si ya estaba activo."""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(nframes)
+    return True
+
+def stop_tracing():
+    """Desactiva tracemalloc y descarta las instantáneas guardadas."""
+    with _lock:
+        _snapshots.clear()
+    tracemalloc.stop()
+
+def tracing_status() -> Dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        return {"activo": False}
+    actual, pico = tracemalloc.get_traced_memory()
+    return {
+        "activo": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "memoria_trazada_bytes": actual,
+        "memoria_trazada_pico_bytes": pico,
+        "instantaneas": list(_snapshots.keys()),
+    }
+
+def _formatear_estadisticas(estadisticas, limite: int, diferencia: bool = False) -> List[Dict[str, Any]]:
+    filas = []
+    for stat in estadisticas[:limite]:
+        fila = {
+            "ubicacion": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            "tamano_bytes": stat.size,
+            "bloques": stat.count,
+        }
+        if diferencia:
+            fila["diferencia_bytes"] = stat.size_diff
+            fila["diferencia_bloques"] = stat.count_diff
+        filas.append(fila)
+    return filas
+
+def take_snapshot(limite: int = 20) -> Dict[str, Any]:
+    """
+    Toma una instantánea de tracemalloc, la guarda para comparaciones
+    posteriores y devuelve los principales asignadores de memoria.
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc no está activo.")
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    id_snapshot = uuid.uuid4().hex[:8]
+    fecha = datetime.now(timezone.utc).isoformat()
+    with _lock:
+        _snapshots[id_snapshot] = (fecha, snapshot)
+        while len(_snapshots) > _MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return {
+        "id_snapshot": id_snapshot,
+        "fecha": fecha,
+        "top": _formatear_estadisticas(snapshot.statistics("lineno"), limite),
+    }
+
+def compare_snapshots(id_anterior: str, id_posterior: str, limite: int = 20) -> Optional[Dict[str, Any]]:
+    """Compara dos instantáneas guardadas. Devuelve None si alguna no existe en este worker."""
+    with _lock:
+        anterior = _snapshots.get(id_anterior)
+        posterior = _snapshots.get(id_posterior)
+    if anterior is None or posterior is None:
+        return None
+    estadisticas = posterior[1].compare_to(anterior[1], "lineno")
+    return {
+        "desde": {"id_snapshot": id_anterior, "fecha": anterior[0]},
+        "hasta": {"id_snapshot": id_posterior, "fecha": posterior[0]},
+        "diferencia_total_bytes": sum(s.size_diff for s in estadisticas),
+        "top": _formatear_estadisticas(estadisticas, limite, diferencia=True),
+    }
+
+
+# --- Artefactos de ML y objetos vivos ---
+
+def ml_artifact_sizes() -> Dict[str, Any]:
+    """
+    Estima el tamaño de los artefactos de ML. El tamaño en memoria se aproxima
+    con el tamaño de su serialización (dominado por los arrays de numpy de los
+    árboles), y solo se calcula si el artefacto ya fue cargado en este worker.
+    """
+    activo = loader.modelo_cargado()
+    rutas = activo.rutas if activo else registry.version_activa()[1]
+    artefactos = {
+        "modelo": (rutas["modelo"], activo.model if activo else None),
+        "label_encoder": (rutas["label_encoder"], activo.label_encoder if activo else None),
+        "explainer": (rutas["explainer"], activo.explainer if activo else None),
+    }
+    resultado = {}
+    for nombre, (ruta, objeto) in artefactos.items():
+        resultado[nombre] = {
+            "cargado": objeto is not None,
+            "tamano_disco_bytes": os.path.getsize(ruta) if os.path.exists(ruta) else None,
+            "tamano_estimado_bytes": len(pickle.dumps(objeto, protocol=pickle.HIGHEST_PROTOCOL)) if objeto is not None else None,
+        }
+    return resultado
+
+def object_counts(limite: int = 20) -> List[Dict[str, Any]]:
+    """
+    Cuenta los objetos vivos rastreados por el GC agrupados por tipo. Útil para
+    detectar acumulación de DataFrames, sesiones o instancias ORM. Es costoso:
+    recorre todo el heap.
+    """
+    conteo = Counter(f"{type(o).__module__}.{type(o).__qualname__}" for o in gc.get_objects())
+    return [{"tipo": tipo, "cantidad": cantidad} for tipo, cantidad in conteo.most_common(limite)]
@@ -0,0 +1,252 @@
+# ==============================================================================
+# Perfilado de CPU bajo demanda
+# Middleware opcional que ejecuta un perfilador estadístico sobre una única
+# solicitud y guarda el resultado en formato speedscope (JSON)
+#
+# Solo se guardan las muestras de la solicitud perfilada, aunque haya otras
+# atendiéndose a la vez:
+# - En el hilo del event loop, las pilas que pasan por la llamada del
+#   middleware para esa solicitud. Las tareas hijas que crea la solicitud
+#   (p. ej. el envío del cuerpo de un StreamingResponse) no se atribuyen.
+# - En los hilos del threadpool, los que están ejecutando una función enviada
+#   desde esa solicitud: el middleware envuelve anyio.to_thread.run_sync (por
+#   donde pasan los endpoints y dependencias síncronos y run_in_threadpool)
+#   para que la función anote su hilo en el perfilador mientras se ejecuta.
+# ==============================================================================
+
+import contextvars
+import functools
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+import anyio.to_thread
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_NOMBRE_VALIDO = re.compile(r"^[\w.-]+\.speedscope\.json$")
+_MAX_PERFILES = 200
+
+# Perfilador de la solicitud en curso (cada solicitud tiene su propio contexto)
+_perfil_actual: contextvars.ContextVar[Optional["SamplingProfiler"]] = contextvars.ContextVar(
+    "digipath_perfil", default=None
+)
+
+
+def _registrar_hilos():
+    """
+    Envuelve anyio.to_thread.run_sync (una sola vez): si la solicitud que envía
+    la función se está perfilando, el hilo que la ejecuta queda anotado en su
+    perfilador mientras dura la llamada.
+    """
+    original = anyio.to_thread.run_sync
+    if getattr(original, "_digipath_perfil", False):
+        return
+
+    @functools.wraps(original)
+    async def run_sync(func, *args, **kwargs):
+        perfil = _perfil_actual.get()
+        if perfil is None:
+            return await original(func, *args, **kwargs)
+
+        def anotada(*argumentos):
+            tid = threading.get_ident()
+            perfil.hilos.add(tid)
+            try:
+                return func(*argumentos)
+            finally:
+                perfil.hilos.discard(tid)
+        return await original(anotada, *args, **kwargs)
+
+    run_sync._digipath_perfil = True
+    anyio.to_thread.run_sync = run_sync
+
+
+class SamplingProfiler:
+    """
+    Perfilador estadístico mínimo: un hilo en segundo plano toma una foto de
+    las pilas de todos los hilos cada `interval` segundos mediante
+    sys._current_frames(). No instrumenta el código, por lo que su costo
+    es proporcional al número de muestras y no al de llamadas.
+
+    Con `raiz` (el frame de la llamada que atiende la solicitud) solo conserva
+    las pilas que pasan por ella y las de los hilos anotados en `hilos`; sin
+    ella, las de todos los hilos.
+    """
+
+    def __init__(self, interval: float, raiz=None):
+        self.interval = interval
+        self.raiz = raiz
+        self.hilos: Set[int] = set()
+        self._frames: List[dict] = []
+        self._indices: Dict[tuple, int] = {}
+        self._muestras: Dict[int, List[List[int]]] = {}
+        self._pesos: Dict[int, List[float]] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="digipath-profiler", daemon=True)
+        self._inicio = 0.0
+        self._fin = 0.0
+
+    def start(self):
+        self._inicio = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._fin = time.perf_counter()
+
+    def _indice(self, code) -> int:
+        clave = (code.co_name, code.co_filename, code.co_firstlineno)
+        idx = self._indices.get(clave)
+        if idx is None:
+            idx = len(self._frames)
+            self._indices[clave] = idx
+            self._frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return idx
+
+    def _run(self):
+        propio = threading.get_ident()
+        anterior = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            ahora = time.perf_counter()
+            peso = (ahora - anterior) * 1000.0
+            anterior = ahora
+            for tid, frame in sys._current_frames().items():
+                if tid == propio:
+                    continue
+                pila = []
+                propia = self.raiz is None or tid in self.hilos
+                while frame is not None:
+                    pila.append(self._indice(frame.f_code))
+                    propia = propia or frame is self.raiz
+                    frame = frame.f_back
+                if not propia:
+                    continue
+                pila.reverse()
+                self._muestras.setdefault(tid, []).append(pila)
+                self._pesos.setdefault(tid, []).append(peso)
+
+    def to_speedscope(self, nombre: str) -> dict:
+        """Devuelve el perfil en el formato de archivo de https://www.speedscope.app."""
+        duracion = (self._fin - self._inicio) * 1000.0
+        nombres_hilos = {t.ident: t.name for t in threading.enumerate()}
+        # Descartamos los hilos que no ejecutaron código de `app/` (p. ej. hilos ociosos del pool)
+        frames_app = {i for i, f in enumerate(self._frames) if f["file"].startswith(_APP_DIR)}
+        perfiles = []
+        for tid, muestras in self._muestras.items():
+            if not any(frames_app.intersection(pila) for pila in muestras):
+                continue
+            perfiles.append({
+                "type": "sampled",
+                "name": nombres_hilos.get(tid, str(tid)),
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": duracion,
+                "samples": muestras,
+                "weights": self._pesos[tid],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": nombre,
+            "exporter": "digipath-profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self._frames},
+            "profiles": perfiles,
+        }
+
+
+# --- Almacenamiento de perfiles ---
+
+def _guardar_perfil(nombre: str, perfil: dict):
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    with open(os.path.join(settings.PROFILING_DIR, nombre), "w", encoding="utf-8") as f:
+        json.dump(perfil, f)
+
+    # Conservamos solo los perfiles más recientes para no llenar el disco
+    existentes = list_profiles()
+    for antiguo in existentes[_MAX_PERFILES:]:
+        try:
+            os.remove(os.path.join(settings.PROFILING_DIR, antiguo["nombre"]))
+        except OSError:
+            pass
+
+def list_profiles() -> List[dict]:
+    """Lista los perfiles guardados, del más reciente al más antiguo."""
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return []
+    perfiles = []
+    for entrada in os.scandir(settings.PROFILING_DIR):
+        if entrada.is_file() and _NOMBRE_VALIDO.match(entrada.name):
+            info = entrada.stat()
+            perfiles.append({
+                "nombre": entrada.name,
+                "tamano_bytes": info.st_size,
+                "fecha": datetime.fromtimestamp(info.st_mtime, tz=timezone.utc).isoformat(),
+            })
+    return sorted(perfiles, key=lambda p: p["fecha"], reverse=True)
+
+def get_profile_path(nombre: str) -> Optional[str]:
+    """Devuelve la ruta de un perfil por su nombre, o None si no existe o el nombre no es válido."""
+    if not _NOMBRE_VALIDO.match(nombre):
+        return None
+    ruta = os.path.join(settings.PROFILING_DIR, nombre)
+    return ruta if os.path.isfile(ruta) else None
+
+
+# --- Middleware ---
+
+def _debe_perfilar(scope) -> bool:
+    if settings.PROFILING_TOKEN:
+        for clave, valor in scope.get("headers", []):
+            if clave == b"x-profile":
+                return hmac.compare_digest(valor, settings.PROFILING_TOKEN.encode())
+    return settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI que perfila las solicitudes que traen la cabecera
+    `X-Profile: <PROFILING_TOKEN>` o que caen dentro de PROFILING_SAMPLE_RATE.
+    El nombre del perfil generado se devuelve en la cabecera `X-Profile-Id`.
+    Solo se registra en main.py cuando PROFILING_ENABLED es True.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        _registrar_hilos()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _debe_perfilar(scope):
+            await self.app(scope, receive, send)
+            return
+
+        marca = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        ruta = re.sub(r"[^\w-]+", "_", scope["path"]).strip("_") or "root"
+        nombre = f"{marca}-{scope['method']}-{ruta[:60]}-{uuid.uuid4().hex[:8]}.speedscope.json"
+
+        async def send_con_cabecera(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(b"x-profile-id", nombre.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler = SamplingProfiler(settings.PROFILING_INTERVAL, raiz=sys._getframe())
+        token = _perfil_actual.set(profiler)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_con_cabecera)
+        finally:
+            profiler.stop()
+            _perfil_actual.reset(token)
+            perfil = profiler.to_speedscope(f"{scope['method']} {scope['path']}")
+            await run_in_threadpool(_guardar_perfil, nombre, perfil)
@@ -0,0 +1,112 @@
+# ==============================================================================
+# Publicación y Suscripción entre Workers
+# Canales de eventos para los streams SSE (p. ej. el dashboard de un plan):
+# quien cambia algo publica en el canal y cada conexión suscrita recibe el
+# mensaje, aunque esté abierta en otro worker.
+#
+# Con REDIS_URL los mensajes pasan por Redis pub/sub: cada worker tiene una
+# sola suscripción (a todos los canales) y reparte lo que llega entre sus
+# conexiones. Sin Redis, o si Redis no responde al publicar, el mensaje solo
+# llega a las conexiones del mismo worker: quien atiende un stream debe
+# consultar compartido() y, si es False, volver a leer el estado cada tanto.
+# ==============================================================================
+
+import asyncio
+import contextlib
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+from app.core import redis_client
+from app.core.config import settings
+
+_PREFIJO = "digipath:eventos"
+# Mensajes pendientes por conexión: si un cliente lento se atrasa se descartan
+# los más viejos (cada mensaje reemplaza al anterior, basta con el último).
+_PENDIENTES = 4
+_REINTENTO_S = 1.0
+
+# --- Estado del worker (solo se usa desde su event loop) ---
+_suscriptores: Dict[str, Set[asyncio.Queue]] = {}
+_oyente: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Task]] = None
+
+
+def compartido() -> bool:
+    """True si los mensajes llegan a todos los workers (hay Redis configurado)."""
+    return redis_client.get_redis() is not None
+
+def advertir_configuracion():
+    """Al arrancar: avisa si los eventos no van a cruzar de un worker a otro."""
+    if not compartido():
+        print("ADVERTENCIA: REDIS_URL no está configurado. Los eventos de los streams SSE solo llegan "
+              "a las conexiones del mismo worker; con varios workers, los streams se resincronizan "
+              f"leyendo el estado cada {settings.SSE_HEARTBEAT_SECONDS:g} s.")
+
+async def publicar(canal: str, mensaje: Any):
+    """Envía `mensaje` (serializable a JSON) a todos los suscriptores del canal."""
+    datos = json.dumps(mensaje, default=str)
+    cliente = redis_client.get_redis()
+    if cliente is not None:
+        try:
+            await cliente.publish(f"{_PREFIJO}:{canal}", datos)
+            return
+        except redis_client.ERRORES_REDIS as e:
+            print(f"Publicación sin Redis ({e}); solo llega a las conexiones de este worker.")
+    _entregar(canal, datos)
+
+@contextlib.asynccontextmanager
+async def suscribir(canal: str) -> AsyncIterator[asyncio.Queue]:
+    """
+    Suscripción al canal mientras dure el bloque `async with`. La cola recibe
+    cada mensaje publicado como texto JSON.
+    """
+    _asegurar_oyente()
+    cola = asyncio.Queue(maxsize=_PENDIENTES)
+    _suscriptores.setdefault(canal, set()).add(cola)
+    try:
+        yield cola
+    finally:
+        colas = _suscriptores.get(canal)
+        if colas is not None:
+            colas.discard(cola)
+            if not colas:
+                del _suscriptores[canal]
+
+def _entregar(canal: str, datos: str):
+    for cola in _suscriptores.get(canal, ()):
+        if cola.full():
+            cola.get_nowait()
+        cola.put_nowait(datos)
+
+
+# ==============================================================================
+# SUSCRIPCIÓN DEL WORKER EN REDIS
+# ==============================================================================
+def _asegurar_oyente():
+    """Arranca (una vez por event loop) la tarea que escucha Redis, si hay Redis."""
+    global _oyente
+    if redis_client.get_redis() is None:
+        return
+    loop = asyncio.get_running_loop()
+    if _oyente is None or _oyente[0] is not loop or _oyente[1].done():
+        _oyente = (loop, loop.create_task(_escuchar()))
+
+async def _escuchar():
+    while True:
+        suscripcion = None
+        try:
+            suscripcion = redis_client.get_redis().pubsub(ignore_subscribe_messages=True)
+            await suscripcion.psubscribe(f"{_PREFIJO}:*")
+            async for mensaje in suscripcion.listen():
+                if mensaje["type"] != "pmessage":
+                    continue
+                canal = mensaje["channel"]
+                canal = canal.decode() if isinstance(canal, bytes) else canal
+                datos = mensaje["data"]
+                _entregar(canal[len(_PREFIJO) + 1:], datos.decode() if isinstance(datos, bytes) else datos)
+        except redis_client.ERRORES_REDIS as e:
+            print(f"Suscripción a Redis interrumpida ({e}); se reintenta en {_REINTENTO_S} s.")
+            await asyncio.sleep(_REINTENTO_S)
+        finally:
+            if suscripcion is not None:
+                with contextlib.suppress(*redis_client.ERRORES_REDIS):
+                    await suscripcion.aclose()
@@ -0,0 +1,170 @@
+# ==============================================================================
+# Trazado de Consultas SQL
+# Cuenta las sentencias que cada solicitud envía a la base de datos, el tiempo
+# total que pasan en ella y cuántas veces se repite cada sentencia (su
+# "huella": el SQL sin literales ni listas de parámetros). Una misma huella
+# repetida muchas veces en una solicitud suele ser una carga perezosa dentro
+# de un bucle (N+1).
+#
+# - En desarrollo (QUERY_TRACING_ENABLED) el middleware devuelve las cifras en
+#   las cabeceras X-DB-Queries, X-DB-Time-Ms y X-DB-Max-Repeats, y escribe una
+#   línea JSON por solicitud en el log.
+# - En pruebas, presupuesto_consultas() falla si un bloque de código supera su
+#   presupuesto de consultas o repite una sentencia más de lo permitido.
+#
+# Los eventos se registran en la clase Engine, así que cubren la primaria, las
+# réplicas y los motores asíncronos. Fuera de un bloque trazado solo cuestan
+# leer una ContextVar por sentencia.
+# ==============================================================================
+
+import contextlib
+import contextvars
+import json
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ESPACIOS = re.compile(r"\s+")
+
+
+class EstadisticasConsultas:
+    """Consultas de un bloque trazado (una solicitud o un bloque de prueba)."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_ms = 0.0
+        self.huellas: Counter = Counter()
+
+    def repetidas(self, umbral: int = 2) -> List[Tuple[str, int]]:
+        """Huellas ejecutadas al menos `umbral` veces, de la más repetida a la menos."""
+        return [(huella, n) for huella, n in self.huellas.most_common() if n >= umbral]
+
+    def max_repeticiones(self) -> int:
+        return max(self.huellas.values(), default=0)
+
+    def resumen(self, umbral: int = 2) -> dict:
+        return {
+            "consultas": self.consultas,
+            "tiempo_db_ms": round(self.tiempo_ms, 2),
+            "repetidas": [{"veces": n, "sentencia": huella[:300]} for huella, n in self.repetidas(umbral)],
+        }
+
+_actual: contextvars.ContextVar[Optional[EstadisticasConsultas]] = contextvars.ContextVar(
+    "digipath_consultas", default=None
+)
+
+
+@lru_cache(maxsize=2048)
+def huella(sentencia: str) -> str:
+    """SQL normalizado: sin literales, con las listas IN (?, ?, ...) reducidas a (?)."""
+    sentencia = _ESPACIOS.sub(" ", sentencia).strip()
+    return _LISTAS.sub("(?)", _LITERALES.sub("?", sentencia))
+
+
+# ==============================================================================
+# EVENTOS DE SQLALCHEMY
+# ==============================================================================
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if _actual.get() is not None and context is not None:
+        context._digipath_inicio = time.perf_counter()
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    estadisticas = _actual.get()
+    inicio = getattr(context, "_digipath_inicio", None)
+    if estadisticas is None or inicio is None:
+        return
+    estadisticas.consultas += 1
+    estadisticas.tiempo_ms += (time.perf_counter() - inicio) * 1000
+    estadisticas.huellas[huella(statement)] += 1
+
+def instrumentar():
+    """Registra los eventos (una sola vez por proceso)."""
+    if not event.contains(Engine, "before_cursor_execute", _antes):
+        event.listen(Engine, "before_cursor_execute", _antes)
+        event.listen(Engine, "after_cursor_execute", _despues)
+
+@contextlib.contextmanager
+def trazar_consultas() -> Iterator[EstadisticasConsultas]:
+    """Registra las consultas ejecutadas dentro del bloque `with` (también en hilos del threadpool)."""
+    instrumentar()
+    estadisticas = EstadisticasConsultas()
+    token = _actual.set(estadisticas)
+    try:
+        yield estadisticas
+    finally:
+        _actual.reset(token)
+
+@contextlib.contextmanager
+def presupuesto_consultas(maximo: int, repeticiones: Optional[int] = None) -> Iterator[EstadisticasConsultas]:
+    """
+    Para pruebas: falla (AssertionError) si el bloque ejecuta más de `maximo`
+    consultas o, con `repeticiones`, si alguna sentencia se repite más veces.
+
+        with presupuesto_consultas(6, repeticiones=1):
+            generate_full_report(db, diagnostico)
+    """
+    with trazar_consultas() as estadisticas:
+        yield estadisticas
+    detalle = json.dumps(estadisticas.resumen(), indent=2, ensure_ascii=False)
+    assert estadisticas.consultas <= maximo, (
+        f"{estadisticas.consultas} consultas > presupuesto de {maximo}:\n{detalle}"
+    )
+    if repeticiones is not None:
+        assert estadisticas.max_repeticiones() <= repeticiones, (
+            f"Una sentencia se repite {estadisticas.max_repeticiones()} veces > {repeticiones} "
+            f"(posible N+1):\n{detalle}"
+        )
+
+
+# ==============================================================================
+# MIDDLEWARE
+# ==============================================================================
+class QueryTracingMiddleware:
+    """
+    Middleware ASGI que traza las consultas de cada solicitud. Las cabeceras
+    reflejan las consultas hechas antes de empezar la respuesta; la línea del
+    log se escribe al terminar (incluye las tareas en segundo plano).
+    Solo se registra en main.py cuando QUERY_TRACING_ENABLED es True.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        estado = None
+        with trazar_consultas() as estadisticas:
+            async def send_con_cabeceras(message):
+                nonlocal estado
+                if message["type"] == "http.response.start":
+                    estado = message["status"]
+                    headers = list(message.get("headers", [])) + [
+                        (b"x-db-queries", str(estadisticas.consultas).encode()),
+                        (b"x-db-time-ms", f"{estadisticas.tiempo_ms:.2f}".encode()),
+                        (b"x-db-max-repeats", str(estadisticas.max_repeticiones()).encode()),
+                    ]
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_con_cabeceras)
+            finally:
+                print(json.dumps({
+                    "evento": "consultas_db",
+                    "metodo": scope["method"],
+                    "ruta": scope["path"],
+                    "estado": estado,
+                    **estadisticas.resumen(settings.QUERY_TRACING_REPEAT_THRESHOLD),
+                }, ensure_ascii=False))
@@ -0,0 +1,133 @@
+# ==============================================================================
+# Límite de Solicitudes y Control de Admisión
+# Dos protecciones para las rutas costosas (las que ejecutan el bosque y SHAP):
+#
+# - Cubeta de tokens por usuario: cada usuario acumula hasta RATE_LIMIT_BURST
+#   tokens, que se recuperan a razón de RATE_LIMIT_TOKENS_PER_SECOND, y cada
+#   ruta consume su costo. Sin tokens suficientes se rechaza con el tiempo
+#   que falta para tenerlos.
+# - Tope de concurrencia: a lo sumo ML_MAX_CONCURRENT solicitudes de rutas con
+#   ML a la vez; las demás se rechazan al instante en lugar de encolarse.
+#
+# Con REDIS_URL el estado es uno solo para todos los workers (scripts Lua
+# atómicos); sin él, cada worker lleva el suyo en memoria. Si Redis no
+# responde se usa el estado en memoria, para no rechazar ni dejar pasar todo.
+# ==============================================================================
+
+import time
+import uuid
+from typing import Optional
+
+from app.core import redis_client
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+_PREFIJO = "digipath:limite"
+# Un cupo que nunca se liberó (worker terminado a mitad de solicitud) caduca solo
+_TTL_CUPO = 300
+_CUPO_LOCAL = "local"
+
+# Devuelve los segundos que faltan para tener `costo` tokens (0 = admitida y descontada)
+_SCRIPT_CUBETA = """
+local capacidad, recarga = tonumber(ARGV[1]), tonumber(ARGV[2])
+local costo, ahora = tonumber(ARGV[3]), tonumber(ARGV[4])
+local datos = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(datos[1]) or capacidad
+local ts = tonumber(datos[2]) or ahora
+tokens = math.min(capacidad, tokens + math.max(0, ahora - ts) * recarga)
+local espera = 0
+if tokens >= costo then
+    tokens = tokens - costo
+else
+    espera = (costo - tokens) / recarga
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', ahora)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidad / recarga) + 1)
+return tostring(espera)
+"""
+
+# Conjunto ordenado de cupos ocupados (puntaje = momento en que se ocuparon)
+_SCRIPT_CUPO = """
+local limite, ahora, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ahora - ttl)
+if redis.call('ZCARD', KEYS[1]) >= limite then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ahora, ARGV[4])
+redis.call('EXPIRE', KEYS[1], ttl)
+return 1
+"""
+
+# --- Estado en memoria del worker (solo se usa desde su event loop) ---
+_cubetas = LRUCache(maxsize=10000)
+_cupos_locales = 0
+
+
+# ==============================================================================
+# CUBETA DE TOKENS POR USUARIO
+# ==============================================================================
+def _consumir_local(id_usuario: int, costo: float, capacidad: float, recarga: float, ahora: float) -> float:
+    tokens, ts = _cubetas.get(id_usuario, (capacidad, ahora))
+    tokens = min(capacidad, tokens + max(0.0, ahora - ts) * recarga)
+    espera = 0.0
+    if tokens >= costo:
+        tokens -= costo
+    else:
+        espera = (costo - tokens) / recarga
+    _cubetas.set(id_usuario, (tokens, ahora))
+    return espera
+
+async def consumir(id_usuario: int, costo: int) -> float:
+    """
+    Descuenta `costo` tokens de la cubeta del usuario. Devuelve 0 si la
+    solicitud se admite, o los segundos que debe esperar (sin descontar nada).
+    """
+    capacidad = float(settings.RATE_LIMIT_BURST)
+    recarga = settings.RATE_LIMIT_TOKENS_PER_SECOND
+    # Una ruta más cara que la cubeta entera nunca se admitiría
+    costo = min(float(costo), capacidad)
+    ahora = time.time()
+
+    cliente = redis_client.get_redis()
+    if cliente is not None:
+        try:
+            return float(await cliente.eval(
+                _SCRIPT_CUBETA, 1, f"{_PREFIJO}:cubeta:{id_usuario}", capacidad, recarga, costo, ahora
+            ))
+        except redis_client.ERRORES_REDIS as e:
+            print(f"Límite de solicitudes sin Redis ({e}); se usa el estado del worker.")
+    return _consumir_local(id_usuario, costo, capacidad, recarga, ahora)
+
+
+# ==============================================================================
+# TOPE DE CONCURRENCIA DE RUTAS CON ML
+# ==============================================================================
+async def ocupar_cupo() -> Optional[str]:
+    """Reserva un cupo de ejecución. Devuelve su id (para liberar_cupo) o None si no hay."""
+    global _cupos_locales
+    limite = settings.ML_MAX_CONCURRENT
+
+    cliente = redis_client.get_redis()
+    if cliente is not None:
+        cupo = uuid.uuid4().hex
+        try:
+            ocupado = await cliente.eval(_SCRIPT_CUPO, 1, f"{_PREFIJO}:cupos", limite, time.time(), _TTL_CUPO, cupo)
+            return cupo if int(ocupado) else None
+        except redis_client.ERRORES_REDIS as e:
+            print(f"Tope de concurrencia sin Redis ({e}); se usa el estado del worker.")
+
+    if _cupos_locales >= limite:
+        return None
+    _cupos_locales += 1
+    return _CUPO_LOCAL
+
+async def liberar_cupo(cupo: str):
+    global _cupos_locales
+    if cupo == _CUPO_LOCAL:
+        _cupos_locales -= 1
+        return
+    try:
+        await redis_client.get_redis().zrem(f"{_PREFIJO}:cupos", cupo)
+    except redis_client.ERRORES_REDIS as e:
+        # Si no se pudo liberar, caduca solo después de _TTL_CUPO segundos
+        print(f"No se pudo liberar el cupo {cupo}: {e}")
@@ -0,0 +1,39 @@
+# ==============================================================================
+# Cliente Redis compartido
+# Estado que debe ser el mismo para todos los workers de gunicorn (límites de
+# solicitudes, etc.). Si REDIS_URL está vacío no hay Redis y cada módulo usa
+# su alternativa en memoria del worker. La librería redis solo se importa si
+# se usa.
+# ==============================================================================
+
+from typing import Any, Optional, Tuple, Type
+
+from app.core.config import settings
+
+_cliente: Optional[Any] = None
+
+# Excepciones que indican que Redis no respondió, para los `except` de quienes lo usan.
+# RedisError se agrega al crear el cliente (sin cliente, nadie puede recibirla).
+ERRORES_REDIS: Tuple[Type[BaseException], ...] = (OSError,)
+
+
+def get_redis():
+    """Cliente asíncrono (uno por worker), o None si REDIS_URL no está configurado."""
+    global _cliente
+    if _cliente is None and settings.REDIS_URL:
+        import redis.asyncio as redis
+        _registrar_errores()
+        _cliente = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _cliente
+
+def set_redis(cliente):
+    """Reemplaza el cliente, p. ej. por fakeredis.FakeAsyncRedis() en pruebas locales."""
+    global _cliente
+    if cliente is not None:
+        _registrar_errores()
+    _cliente = cliente
+
+def _registrar_errores():
+    global ERRORES_REDIS
+    from redis.exceptions import RedisError
+    ERRORES_REDIS = (RedisError, OSError)
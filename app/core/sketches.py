@@ -0,0 +1,169 @@
+# ==============================================================================
+# Histogramas Compartidos para Percentiles
+# Boceto (sketch) de cuantiles de resolución fija: un contador por cada valor
+# posible entre `minimo` y `maximo` en pasos de `resolucion`. Es combinable
+# (se suman los contadores), admite bajas (se restan) y, como los puntajes ya
+# se redondean a 2 decimales, es exacto a la resolución del reporte.
+#
+# Los contadores viven en un archivo mapeado en memoria (numpy.memmap) que
+# comparten todos los workers de la máquina. Las escrituras se serializan con
+# un lock de archivo (fcntl); las lecturas no toman lock. `exclusivo()` expone
+# ese lock para que una reconstrucción lo retenga de principio a fin.
+#
+# Un archivo recién creado está vacío y un contador negativo indica que el
+# archivo no refleja los datos: en ambos casos se avisa a `al_desfasar`
+# (p. ej. para reconstruirlo desde la base de datos).
+# ==============================================================================
+
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+from typing import Callable, List, Optional
+
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializan los hilos del mismo proceso
+    fcntl = None
+
+
+class HistogramaCompartido:
+    """Matriz de contadores (métricas x bins) persistida en `ruta`."""
+
+    def __init__(self, ruta: str, metricas: int, minimo: float = 1.0, maximo: float = 7.0,
+                 resolucion: float = 0.01, al_desfasar: Optional[Callable[[str], None]] = None):
+        self.ruta = ruta
+        self.metricas = metricas
+        self.minimo = minimo
+        self.resolucion = resolucion
+        self.bins = int(round((maximo - minimo) / resolucion)) + 1
+        self._conteos = None
+        # Reentrante: agregar/reemplazar dentro de exclusivo() no vuelven a pedir el lock
+        self._lock = threading.RLock()
+        self._flock_tomado = False
+        # Recibe el motivo; se llama fuera del bloque de escritura, pero puede ser
+        # dentro de exclusivo(): no debe esperar a que el lock se libere
+        self.al_desfasar = al_desfasar
+
+    # --- Archivo y lock ---
+
+    @contextlib.contextmanager
+    def _bloqueo(self):
+        with self._lock:
+            # Un segundo flock desde el mismo proceso, con otro descriptor, se bloquearía a sí mismo
+            if fcntl is None or self._flock_tomado:
+                yield
+                return
+            with open(self.ruta + ".lock", "a") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                self._flock_tomado = True
+                try:
+                    yield
+                finally:
+                    self._flock_tomado = False
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def exclusivo(self):
+        """
+        Retiene el lock de escritura durante todo el bloque: ningún otro hilo ni
+        worker de la máquina agrega o reemplaza contadores hasta que termine.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+        with self._bloqueo():
+            yield self
+
+    def _abrir(self, avisar: bool = True) -> np.memmap:
+        if self._conteos is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.ruta)), exist_ok=True)
+            forma = (self.metricas, self.bins)
+            tamano = self.metricas * self.bins * np.dtype(np.int64).itemsize
+            creado = False
+            with self._bloqueo():
+                if not os.path.exists(self.ruta) or os.path.getsize(self.ruta) != tamano:
+                    # Archivo nuevo (o de otra forma): empieza vacío y hay que reconstruirlo.
+                    # Solo el proceso que lo crea avisa (los demás ya lo encuentran creado).
+                    np.memmap(self.ruta, dtype=np.int64, mode="w+", shape=forma).flush()
+                    creado = True
+                self._conteos = np.memmap(self.ruta, dtype=np.int64, mode="r+", shape=forma)
+            if creado and avisar:
+                self._desfasado("se creó vacío")
+        return self._conteos
+
+    def _desfasado(self, motivo: str):
+        print(f"Histograma {self.ruta}: {motivo}.")
+        if self.al_desfasar is not None:
+            self.al_desfasar(motivo)
+
+    # --- Escrituras ---
+
+    def _indices(self, valores: np.ndarray) -> np.ndarray:
+        indices = np.rint((valores - self.minimo) / self.resolucion)
+        return np.clip(indices, 0, self.bins - 1).astype(np.int64)
+
+    def agregar(self, filas: np.ndarray, signo: int = 1):
+        """
+        Suma (o resta, con signo=-1) una matriz de valores de forma (n, metricas).
+        Los NaN se ignoran.
+        """
+        filas = np.atleast_2d(np.asarray(filas, dtype=float))
+        if filas.size == 0:
+            return
+        metrica = np.broadcast_to(np.arange(self.metricas), filas.shape)
+        validos = ~np.isnan(filas)
+        conteos = self._abrir()
+        with self._bloqueo():
+            np.add.at(conteos, (metrica[validos], self._indices(filas[validos])), signo)
+            negativos = int(np.count_nonzero(conteos < 0))
+            conteos.flush()
+        if negativos:
+            # Se restó algo que nunca se sumó: el archivo no refleja los datos
+            self._desfasado(f"{negativos} contadores quedaron negativos")
+
+    def reemplazar(self, nuevos: np.ndarray):
+        """Sustituye todos los contadores (reconstrucción)."""
+        # Si el archivo no existía no hace falta avisar: se está llenando ahora
+        conteos = self._abrir(avisar=False)
+        with self._bloqueo():
+            conteos[:] = nuevos
+            conteos.flush()
+
+    def contar(self, filas: np.ndarray) -> np.ndarray:
+        """Histograma en memoria de una matriz (n, metricas), para combinar con otros."""
+        filas = np.atleast_2d(np.asarray(filas, dtype=float))
+        resultado = np.zeros((self.metricas, self.bins), dtype=np.int64)
+        if filas.size:
+            metrica = np.broadcast_to(np.arange(self.metricas), filas.shape)
+            validos = ~np.isnan(filas)
+            np.add.at(resultado, (metrica[validos], self._indices(filas[validos])), 1)
+        return resultado
+
+    # --- Lecturas ---
+
+    def totales(self) -> np.ndarray:
+        return np.asarray(self._abrir().sum(axis=1))
+
+    def percentiles(self, valores: np.ndarray) -> List[Optional[float]]:
+        """
+        Posición percentil (0-100) de cada valor en su métrica: porcentaje de
+        observaciones menores más la mitad de las iguales. None si la métrica
+        está vacía o el valor es NaN. El costo no depende de cuántas
+        observaciones haya, solo del número de bins.
+        """
+        conteos = np.array(self._abrir())
+        valores = np.asarray(valores, dtype=float)
+        resultado = []
+        for metrica, valor in enumerate(valores):
+            fila = conteos[metrica]
+            total = fila.sum()
+            if total <= 0 or np.isnan(valor):
+                resultado.append(None)
+                continue
+            indice = self._indices(np.array([valor]))[0]
+            menores = fila[:indice].sum()
+            resultado.append(round(100.0 * (menores + 0.5 * fila[indice]) / total, 1))
+        return resultado
@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -16,6 +18,27 @@ engine = create_engine(
 # para asegurar que las transacciones se manejen explícitamente.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# --- Motor y sesiones asíncronas ---
+# Los endpoints de solo E/S (lecturas por clave, actualizaciones pequeñas) usan
+# estas sesiones y no ocupan un hilo del threadpool mientras esperan a la base
+# de datos. Misma base de datos, con el driver asíncrono equivalente.
+_DRIVERS_ASYNC = {
+    "mssql": "mssql+aioodbc",
+    "mssql+pyodbc": "mssql+aioodbc",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+def url_async(url: str) -> URL:
+    url = make_url(url)
+    return url.set(drivername=_DRIVERS_ASYNC.get(url.drivername, url.drivername))
+
+async_engine = create_async_engine(url_async(settings.DATABASE_URL), pool_pre_ping=True)
+
+# expire_on_commit=False: tras el commit los objetos se siguen leyendo sin otra consulta
+# (en modo asíncrono no se puede cargar un atributo de forma perezosa)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Crear una clase base para nuestros modelos ORM (los que irán en la carpeta models/)
 Base = declarative_base()
 
@@ -31,4 +54,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Igual que get_db, con una sesión asíncrona (AsyncSession)."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,44 @@
+# ==============================================================================
+# Migraciones de Columnas
+# create_all crea las tablas que faltan pero no agrega columnas nuevas a las
+# tablas que ya existen. Aquí se listan las columnas agregadas después de la
+# primera versión del esquema; al arrancar la aplicación (lifespan de
+# app.main) se crean las que falten con ALTER TABLE ... ADD. Solo columnas que
+# admiten NULL (o con valor por defecto de servidor), para que funcione con
+# filas existentes.
+# ==============================================================================
+
+from typing import List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from app.models.action_plan import TareaPlan
+from app.models.diagnosis import Diagnostico
+
+COLUMNAS_AGREGADAS = [
+    Diagnostico.__table__.c.version_modelo,
+    TareaPlan.__table__.c.ganancia_esperada,
+    TareaPlan.__table__.c.prioridad,
+]
+
+
+def asegurar_columnas(engine: Engine) -> List[str]:
+    """Agrega las columnas de COLUMNAS_AGREGADAS que no existan. Devuelve las creadas."""
+    inspector = inspect(engine)
+    creadas = []
+    with engine.begin() as conexion:
+        for columna in COLUMNAS_AGREGADAS:
+            tabla = columna.table.name
+            existentes = {c["name"] for c in inspector.get_columns(tabla)}
+            if columna.name in existentes:
+                continue
+            tipo = columna.type.compile(dialect=engine.dialect)
+            preparador = engine.dialect.identifier_preparer
+            conexion.execute(text(
+                f"ALTER TABLE {preparador.quote(tabla)} ADD {preparador.quote(columna.name)} {tipo} NULL"
+            ))
+            creadas.append(f"{tabla}.{columna.name}")
+    for nombre in creadas:
+        print(f"Columna agregada: {nombre}")
+    return creadas
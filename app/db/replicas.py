@@ -0,0 +1,108 @@
+# ==============================================================================
+# Réplicas de Solo Lectura
+# Los endpoints que solo leen (catálogo de preguntas, historial, reportes,
+# dashboards) pueden consultar réplicas de la base de datos en lugar de la
+# primaria, que queda para los envíos y actualizaciones. Las réplicas se
+# configuran en DATABASE_REPLICA_URLS (separadas por comas) y se reparten por
+# turnos; sin réplicas todo va a la primaria.
+#
+# Una réplica puede ir unos segundos atrasada. Para que un usuario vea lo que
+# acaba de escribir, cada escritura se marca (marcar_escritura) y durante
+# REPLICA_LAG_GUARD_SECONDS las lecturas de ese usuario van a la primaria.
+# La marca vive en Redis, donde la ven todos los workers (y además en la
+# memoria del worker, que evita la consulta a Redis en el mismo worker). Sin
+# Redis un worker no puede saber si el usuario escribió a través de otro, así
+# que las lecturas de usuarios van siempre a la primaria y las réplicas solo
+# atienden las lecturas sin usuario (p. ej. el catálogo de preguntas).
+# ==============================================================================
+
+import itertools
+import time
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.core import redis_client
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal, SessionLocal, url_async
+
+_URLS = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+
+replica_engines = [create_engine(url, pool_pre_ping=True) for url in _URLS]
+async_replica_engines = [create_async_engine(url_async(url), pool_pre_ping=True) for url in _URLS]
+_turno = itertools.count()
+
+_PREFIJO = "digipath:escritura"
+_escrituras = LRUCache(maxsize=10000)
+
+
+# ==============================================================================
+# MARCA DE ESCRITURAS RECIENTES
+# ==============================================================================
+def advertir_configuracion():
+    """Al arrancar: avisa si hay réplicas pero no Redis (las lecturas de usuarios irán a la primaria)."""
+    if _URLS and not settings.REDIS_URL:
+        print("ADVERTENCIA: DATABASE_REPLICA_URLS está configurado pero REDIS_URL no. Sin una marca de "
+              "escritura compartida entre workers, las lecturas de los usuarios van a la primaria y las "
+              "réplicas solo atienden las lecturas sin usuario. Configure REDIS_URL.")
+
+async def marcar_escritura(id_usuario: int):
+    """Registra que el usuario acaba de escribir: sus lecturas irán a la primaria por un tiempo."""
+    if not _URLS:
+        return
+    guarda = settings.REPLICA_LAG_GUARD_SECONDS
+    # También en memoria: si Redis falla después, este worker sigue sabiéndolo
+    _escrituras.set(id_usuario, time.monotonic() + guarda)
+    cliente = redis_client.get_redis()
+    if cliente is not None:
+        try:
+            await cliente.set(f"{_PREFIJO}:{id_usuario}", 1, px=int(guarda * 1000))
+        except redis_client.ERRORES_REDIS as e:
+            print(f"No se pudo marcar la escritura en Redis: {e}")
+
+async def escribio_hace_poco(id_usuario: int) -> bool:
+    """
+    Si el usuario pudo escribir dentro de REPLICA_LAG_GUARD_SECONDS. Sin Redis
+    la marca de otros workers no se ve y devuelve siempre True.
+    """
+    if _escrituras.get(id_usuario, 0.0) > time.monotonic():
+        return True
+    cliente = redis_client.get_redis()
+    if cliente is None:
+        return True
+    try:
+        return bool(await cliente.exists(f"{_PREFIJO}:{id_usuario}"))
+    except redis_client.ERRORES_REDIS as e:
+        # Sin saber si escribió en otro worker, la primaria es la opción segura
+        print(f"No se pudo consultar la marca de escritura en Redis: {e}")
+        return True
+
+
+# ==============================================================================
+# SESIONES DE LECTURA
+# ==============================================================================
+def _indice_replica() -> int:
+    return next(_turno) % len(_URLS)
+
+async def sesion_lectura(id_usuario: Optional[int] = None) -> Session:
+    """
+    Sesión síncrona para leer: de una réplica, o de la primaria si no hay
+    réplicas o si el usuario escribió hace poco (sin Redis, siempre que hay usuario).
+    """
+    if not _URLS or (id_usuario is not None and await escribio_hace_poco(id_usuario)):
+        return SessionLocal()
+    return SessionLocal(bind=replica_engines[_indice_replica()])
+
+async def sesion_lectura_async(id_usuario: Optional[int] = None) -> AsyncSession:
+    """Igual que sesion_lectura, con una sesión asíncrona."""
+    if not _URLS or (id_usuario is not None and await escribio_hace_poco(id_usuario)):
+        return AsyncSessionLocal()
+    return AsyncSessionLocal(bind=async_replica_engines[_indice_replica()])
+
+async def get_async_replica_db():
+    """Dependencia para datos que los usuarios no escriben (p. ej. el catálogo de preguntas)."""
+    async with await sesion_lectura_async() as db:
+        yield db
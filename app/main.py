@@ -1,14 +1,38 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 from app.api.v1.api import api_router
+from app.core import pubsub
+from app.core.config import settings
+from app.core.profiling import ProfilingMiddleware
+from app.core.query_tracing import QueryTracingMiddleware
+from app.db import replicas
+from app.db.database import engine
+from app.db.migrations import asegurar_columnas
+from app.ml import loader
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Agrega a las tablas existentes las columnas nuevas de los modelos (DDL en la primaria)
+    await run_in_threadpool(asegurar_columnas, engine)
+    # Carga el modelo en segundo plano y sigue la versión activa del registro
+    loader.iniciar_monitor(settings.MODEL_REGISTRY_POLL_SECONDS)
+    # Estado que debería compartirse entre workers y no lo está
+    pubsub.advertir_configuracion()
+    replicas.advertir_configuracion()
+    yield
 
 app = FastAPI(
     title="DigiPath API",
     description="API para el Sistema Predictivo de Madurez Digital para MYPEs Industriales.",
     version="1.0.0",
     openapi_url="/api/v1/openapi.json",
-    docs_url="/api/v1/docs"
+    docs_url="/api/v1/docs",
+    lifespan=lifespan
 )
 
 # --- 1. AÑADIMOS EL MIDDLEWARE PARA EL PROXY ---
@@ -34,6 +58,14 @@ app.add_middleware(
     allow_headers=["*"],    # Permitir todas las cabeceras
 )
 
+# 4. PERFILADO BAJO DEMANDA (solo si está habilitado, para que su costo sea cero en caso contrario)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# 5. TRAZADO DE CONSULTAS SQL (desarrollo): cabeceras X-DB-* y una línea de log por solicitud
+if settings.QUERY_TRACING_ENABLED:
+    app.add_middleware(QueryTracingMiddleware)
+
 
 # Incluye todas las rutas de la API bajo el prefijo /api/v1
 app.include_router(api_router, prefix="/api/v1")
@@ -0,0 +1,274 @@
+# ==============================================================================
+# Bosque Compacto
+# Representación del RandomForest entrenado equivalente a la de sklearn, pero
+# con todos los árboles en unos pocos arreglos planos y pequeños:
+#
+# - Umbrales en float32 cuando todos son exactos en float32 (sklearn compara
+#   la entrada ya convertida a float32, así que el resultado no cambia).
+# - Índices de nodo en el entero más chico que alcanza (int16 para ~1500 nodos).
+# - Nodos idénticos compartidos: hojas con las mismas probabilidades y
+#   subárboles iguales se guardan una sola vez, aunque estén en árboles
+#   distintos.
+# - Sin divisiones muertas: si ambas ramas son el mismo subárbol, o si una
+#   rama es inalcanzable por las divisiones anteriores del camino, el nodo se
+#   reemplaza por la rama que queda.
+#
+# predict y predict_proba suman las hojas en el mismo orden que sklearn, así
+# que las probabilidades son idénticas bit a bit. El explicador SHAP no se
+# toca: explica la misma función.
+#
+# comparar() genera el reporte de paridad (predicciones, aditividad de SHAP,
+# tamaño y latencia) que usa app.cli.compact_model antes de registrar.
+# ==============================================================================
+
+from __future__ import annotations
+
+import pickle
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+pd = importar_perezoso("pandas")
+
+
+# Filas por bloque al predecir: la matriz de decisiones ocupa filas x nodos
+_BLOQUE = 4096
+
+
+class BosqueCompacto:
+    """Sustituto de RandomForestClassifier para predecir (predict, predict_proba)."""
+
+    def __init__(self, classes_, feature_names_in_, n_estimators: int, raices, caracteristica, umbral,
+                 nan_izquierda, hijos, hoja, valores, profundidad: int):
+        self.classes_ = classes_
+        self.n_classes_ = len(classes_)
+        self.feature_names_in_ = feature_names_in_
+        self.n_features_in_ = len(feature_names_in_)
+        self.n_estimators = n_estimators
+        # Nodo raíz de cada árbol (varios árboles pueden compartir nodos)
+        self.raices = raices
+        # Por nodo. Las hojas apuntan a sí mismas, así que recorrer de más no las mueve.
+        self.caracteristica = caracteristica
+        self.umbral = umbral
+        self.nan_izquierda = nan_izquierda
+        self.hijos = hijos   # (n_nodos, 2): izquierdo, derecho
+        # Fila de `valores` de cada hoja (-1 en los nodos internos)
+        self.hoja = hoja
+        self.valores = valores
+        self.profundidad = profundidad
+
+    def _entrada(self, X) -> np.ndarray:
+        # Igual que sklearn: los árboles comparan la entrada convertida a float32
+        if hasattr(X, "columns"):
+            return X[list(self.feature_names_in_)].to_numpy(dtype=np.float32)
+        return np.asarray(X, dtype=np.float32)
+
+    def apply(self, X) -> np.ndarray:
+        """Nodo hoja alcanzado en cada árbol: matriz (n_arboles, n_filas)."""
+        X = self._entrada(X)
+        hijos = self.hijos.astype(np.intp).ravel()
+        raices = self.raices.astype(np.intp)[:, None]
+        resultado = np.empty((self.n_estimators, X.shape[0]), dtype=np.intp)
+        for inicio in range(0, X.shape[0], _BLOQUE):
+            bloque = X[inicio:inicio + _BLOQUE]
+            # Todas las decisiones de una vez (fila x nodo); recorrer es solo buscar en la tabla
+            x = bloque[:, self.caracteristica]
+            izquierda = x <= self.umbral
+            faltantes = np.isnan(x)
+            if faltantes.any():
+                izquierda |= faltantes & self.nan_izquierda
+            derecha = (~izquierda).view(np.uint8)
+            filas = np.arange(len(bloque))
+            nodos = np.repeat(raices, len(bloque), axis=1)
+            for _ in range(self.profundidad):
+                nodos = hijos.take(2 * nodos + derecha[filas, nodos])
+            resultado[:, inicio:inicio + _BLOQUE] = nodos
+        return resultado
+
+    def predict_proba(self, X) -> np.ndarray:
+        hojas = self.hoja[self.apply(X)]
+        # Se suma árbol por árbol, en el mismo orden que ForestClassifier.predict_proba,
+        # para que las probabilidades sean idénticas bit a bit
+        proba = self.valores.take(hojas, axis=0).sum(axis=0)
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.raices, self.caracteristica, self.umbral, self.nan_izquierda,
+                                      self.hijos, self.hoja, self.valores))
+
+
+# ==============================================================================
+# COMPACTACIÓN
+# ==============================================================================
+def _entero_minimo(maximo: int):
+    for dtype in (np.int8, np.int16, np.int32):
+        if maximo <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def compactar(bosque) -> Tuple[BosqueCompacto, Dict[str, Any]]:
+    """Convierte un RandomForestClassifier entrenado. Devuelve el bosque compacto y estadísticas."""
+    n_caracteristicas = bosque.n_features_in_
+    umbrales = np.concatenate([e.tree_.threshold[e.tree_.feature >= 0] for e in bosque.estimators_])
+    umbral_f32 = bool(np.all(umbrales.astype(np.float32).astype(np.float64) == umbrales))
+
+    nodos: List[tuple] = []          # (caracteristica, umbral, nan_izq, izq, der, hoja)
+    canonicos: Dict[tuple, int] = {}
+    filas_valores: List[np.ndarray] = []
+    indice_valor: Dict[bytes, int] = {}
+    estadisticas = {"divisiones_muertas": 0, "ramas_inalcanzables": 0}
+
+    def nodo(clave: tuple, datos_hoja: int = -1) -> int:
+        if clave not in canonicos:
+            canonicos[clave] = len(nodos)
+            if datos_hoja >= 0:
+                nodos.append((0, 0.0, False, len(nodos), len(nodos), datos_hoja))
+            else:
+                _, caracteristica, umbral, nan_izq, izq, der = clave
+                nodos.append((caracteristica, umbral, nan_izq, izq, der, -1))
+        return canonicos[clave]
+
+    def hoja(valor: np.ndarray) -> int:
+        clave = valor.tobytes()
+        if clave not in indice_valor:
+            indice_valor[clave] = len(filas_valores)
+            filas_valores.append(valor)
+        return nodo(("hoja", indice_valor[clave]), indice_valor[clave])
+
+    def convertir(arbol, i: int, limites: tuple) -> int:
+        # limites[j] = (inferior, superior, nan_posible) para los valores de x_j que llegan aquí
+        izq, der = arbol.children_left[i], arbol.children_right[i]
+        if izq < 0:
+            return hoja(arbol.value[i, 0, :bosque.n_classes_].astype(np.float64))
+        j, umbral = int(arbol.feature[i]), float(arbol.threshold[i])
+        nan_izq = bool(arbol.missing_go_to_left[i])
+        inferior, superior, nan_posible = limites[j]
+        llega_izq = inferior < umbral or (nan_posible and nan_izq)
+        llega_der = umbral < superior or (nan_posible and not nan_izq)
+        if not (llega_izq and llega_der):
+            estadisticas["ramas_inalcanzables"] += 1
+            return convertir(arbol, izq if llega_izq else der, limites)
+
+        limites_izq = limites[:j] + ((inferior, min(superior, umbral), nan_posible and nan_izq),) + limites[j + 1:]
+        limites_der = limites[:j] + ((max(inferior, umbral), superior, nan_posible and not nan_izq),) + limites[j + 1:]
+        hijo_izq = convertir(arbol, izq, limites_izq)
+        hijo_der = convertir(arbol, der, limites_der)
+        if hijo_izq == hijo_der:
+            estadisticas["divisiones_muertas"] += 1
+            return hijo_izq
+        return nodo(("division", j, umbral, nan_izq, hijo_izq, hijo_der))
+
+    sin_limites = ((-np.inf, np.inf, True),) * n_caracteristicas
+    raices = [convertir(e.tree_, 0, sin_limites) for e in bosque.estimators_]
+
+    caracteristica, umbral, nan_izq, izquierdo, derecho, hojas = zip(*nodos)
+    indice = _entero_minimo(len(nodos))
+
+    # Profundidad del grafo compartido: cuántos pasos hacen falta para llegar a una hoja desde cualquier raíz
+    profundidad_nodo = [0] * len(nodos)
+    for k, (_, _, _, izq, der, h) in enumerate(nodos):   # los hijos siempre se crean antes que el padre
+        if h < 0:
+            profundidad_nodo[k] = 1 + max(profundidad_nodo[izq], profundidad_nodo[der])
+
+    compacto = BosqueCompacto(
+        classes_=bosque.classes_,
+        feature_names_in_=np.asarray(getattr(bosque, "feature_names_in_", [f"x{j}" for j in range(n_caracteristicas)]),
+                                     dtype=object),
+        n_estimators=len(bosque.estimators_),
+        raices=np.array(raices, dtype=indice),
+        caracteristica=np.array(caracteristica, dtype=_entero_minimo(n_caracteristicas)),
+        umbral=np.array(umbral, dtype=np.float32 if umbral_f32 else np.float64),
+        nan_izquierda=np.array(nan_izq, dtype=bool),
+        hijos=np.array([izquierdo, derecho], dtype=indice).T.copy(),
+        hoja=np.array(hojas, dtype=_entero_minimo(len(filas_valores))),
+        valores=np.array(filas_valores, dtype=np.float64),
+        profundidad=max(profundidad_nodo[r] for r in raices),
+    )
+    estadisticas.update({
+        "nodos_originales": int(sum(e.tree_.node_count for e in bosque.estimators_)),
+        "nodos_compactos": len(nodos),
+        "hojas_originales": int(sum(e.tree_.n_leaves for e in bosque.estimators_)),
+        "hojas_distintas": len(filas_valores),
+        "umbral_dtype": str(compacto.umbral.dtype),
+        "indice_dtype": str(compacto.hijos.dtype),
+    })
+    return compacto, estadisticas
+
+
+# ==============================================================================
+# REPORTE DE PARIDAD
+# ==============================================================================
+def generar_corpus(bosque, n: int, semilla: int = 0) -> pd.DataFrame:
+    """
+    Filas de prueba: cada valor sale de la escala 1 a 7, de los umbrales del
+    bosque y de sus vecinos inmediatos en float32 (los casos límite de <=),
+    con un 5% de respuestas faltantes (NaN).
+    """
+    rng = np.random.default_rng(semilla)
+    columnas = []
+    for j in range(bosque.n_features_in_):
+        umbrales = np.concatenate([e.tree_.threshold[e.tree_.feature == j] for e in bosque.estimators_])
+        u32 = umbrales.astype(np.float32)
+        candidatos = np.unique(np.concatenate([
+            np.arange(1, 8, dtype=np.float32), u32,
+            np.nextafter(u32, np.float32(-np.inf)), np.nextafter(u32, np.float32(np.inf)),
+        ])).astype(np.float64)
+        columna = rng.choice(candidatos, size=n)
+        columna[rng.random(n) < 0.05] = np.nan
+        columnas.append(columna)
+    nombres = getattr(bosque, "feature_names_in_", [f"x{j}" for j in range(bosque.n_features_in_)])
+    return pd.DataFrame(np.column_stack(columnas), columns=list(nombres))
+
+def _latencia_ms(funcion, X, repeticiones: int = 5) -> float:
+    funcion(X)
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(X)
+        tiempos.append(time.perf_counter() - inicio)
+    return round(min(tiempos) * 1000, 3)
+
+def comparar(bosque, compacto: BosqueCompacto, explainer=None, filas: int = 20000,
+             filas_shap: int = 2000, semilla: int = 0) -> Dict[str, Any]:
+    """
+    Compara el bosque original con el compacto sobre un corpus generado.
+    `identicas` es True solo si predict_proba coincide bit a bit en todas las
+    filas. Con `explainer`, verifica que sus valores SHAP sigan sumando las
+    probabilidades del bosque compacto (base + suma de SHAP).
+    """
+    corpus = generar_corpus(bosque, filas, semilla)
+    proba_original = bosque.predict_proba(corpus)
+    proba_compacta = compacto.predict_proba(corpus)
+    diferencia = np.abs(proba_original - proba_compacta)
+    reporte: Dict[str, Any] = {
+        "filas": filas,
+        "identicas": bool(np.array_equal(proba_original, proba_compacta)),
+        "filas_con_diferencias": int(np.count_nonzero(diferencia.max(axis=1))),
+        "diferencia_proba_max": float(diferencia.max()),
+        "predicciones_distintas": int(np.count_nonzero(bosque.predict(corpus) != compacto.predict(corpus))),
+    }
+
+    if explainer is not None:
+        muestra = corpus.iloc[:filas_shap]
+        explicacion = explainer(muestra)
+        reconstruida = explicacion.base_values + explicacion.values.sum(axis=1)
+        reporte["shap"] = {
+            "filas": len(muestra),
+            "desviacion_aditividad_max": float(np.abs(reconstruida - proba_compacta[:filas_shap]).max()),
+        }
+
+    reporte["tamano"] = {
+        "original_pickle_bytes": len(pickle.dumps(bosque, protocol=pickle.HIGHEST_PROTOCOL)),
+        "compacto_pickle_bytes": len(pickle.dumps(compacto, protocol=pickle.HIGHEST_PROTOCOL)),
+        "compacto_arreglos_bytes": compacto.nbytes(),
+    }
+    reporte["latencia_ms"] = {
+        f"{nombre}_{n}_filas": _latencia_ms(modelo.predict_proba, corpus.iloc[:n])
+        for n in (1, 4096) for nombre, modelo in (("original", bosque), ("compacto", compacto))
+    }
+    return reporte
@@ -1,39 +1,124 @@
-import joblib
-import os
-
-# --- Definimos las rutas a los artefactos ---
-# Usamos rutas absolutas para mayor robustez.
-_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(_BASE_DIR, "modelo_rf.joblib")
-ENCODER_PATH = os.path.join(_BASE_DIR, "label_encoder.joblib")
-EXPLAINER_PATH = os.path.join(_BASE_DIR, "shap_explainer.joblib")
-
-# --- Variables globales para almacenar los modelos en caché ---
-# Las inicializamos como None. Solo las cargaremos una vez.
-_model = None
-_label_encoder = None
-_explainer = None
-
-def get_model_components():
-    """
-    Función de carga perezosa (Lazy Loading).
-    Carga los artefactos de ML desde el disco la primera vez que se llama
-    y los almacena en caché en memoria para las llamadas posteriores.
-    """
-    global _model, _label_encoder, _explainer
-
-    # Si los modelos no han sido cargados todavía...
-    if _model is None or _label_encoder is None or _explainer is None:
-        print("Cargando artefactos de Machine Learning por primera vez...")
-        try:
-            _model = joblib.load(MODEL_PATH)
-            _label_encoder = joblib.load(ENCODER_PATH)
-            _explainer = joblib.load(EXPLAINER_PATH)
-            print("Artefactos cargados y cacheados exitosamente.")
-        except Exception as e:
-            print(f"Error crítico al cargar los artefactos de ML: {e}")
-            # Si falla, nos aseguramos de que todo quede en None para evitar estados parciales
-            _model, _label_encoder, _explainer = None, None, None
-            raise RuntimeError(f"No se pudieron cargar los artefactos de ML: {e}")
-
-    return _model, _label_encoder, _explainer
\ No newline at end of file
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from app.ml import registry
+
+
+class ModeloActivo(NamedTuple):
+    """Artefactos de una versión ya cargados en memoria."""
+    version: str
+    rutas: Dict[str, str]
+    model: Any
+    label_encoder: Any
+    explainer: Any
+
+
+# --- Versión cargada en este worker ---
+# Una sola referencia: cambiar de versión es reasignarla, así que una solicitud
+# en curso termina con los artefactos que tomó y nunca ve una mezcla de versiones.
+_activo: Optional[ModeloActivo] = None
+_lock = threading.Lock()
+
+
+def _cargar(version: str, rutas: Dict[str, str]) -> ModeloActivo:
+    # joblib (y al deserializar, sklearn y shap) se importan aquí y no al arrancar el worker
+    import joblib
+
+    print(f"Cargando artefactos de Machine Learning (versión {version})...")
+    try:
+        modelo = ModeloActivo(
+            version=version,
+            rutas=rutas,
+            model=joblib.load(rutas["modelo"]),
+            label_encoder=joblib.load(rutas["label_encoder"]),
+            explainer=joblib.load(rutas["explainer"]),
+        )
+    except Exception as e:
+        print(f"Error crítico al cargar los artefactos de ML: {e}")
+        raise RuntimeError(f"No se pudieron cargar los artefactos de ML: {e}")
+    print("Artefactos cargados y cacheados exitosamente.")
+    return modelo
+
+def get_modelo_activo() -> ModeloActivo:
+    """
+    Función de carga perezosa (Lazy Loading): la primera llamada carga la
+    versión activa del registro; las siguientes devuelven la ya cargada.
+    """
+    global _activo
+
+    activo = _activo
+    if activo is None:
+        with _lock:
+            if _activo is None:
+                _activo = _cargar(*registry.version_activa())
+            activo = _activo
+    return activo
+
+def modelo_cargado() -> Optional[ModeloActivo]:
+    """La versión ya cargada en este worker, o None si aún no se cargó (no la carga)."""
+    return _activo
+
+def get_model_components() -> Tuple[Any, Any, Any]:
+    activo = get_modelo_activo()
+    return activo.model, activo.label_encoder, activo.explainer
+
+def get_model_version() -> str:
+    """
+    Id de la versión cargada (hash de sus artefactos). Se guarda en cada
+    diagnóstico y forma parte de la clave de las cachés que dependen del modelo.
+    """
+    return get_modelo_activo().version
+
+
+# ==============================================================================
+# CAMBIO DE VERSIÓN SIN REINICIAR
+# La nueva versión se carga mientras las solicitudes siguen usando la actual,
+# y solo entonces se publica; si la carga falla, la actual se queda.
+# ==============================================================================
+def _publicar(modelo: ModeloActivo):
+    global _activo
+    with _lock:
+        _activo = modelo
+
+def sincronizar() -> Optional[str]:
+    """Carga la versión activa del manifiesto si no es la cargada. Devuelve la nueva versión."""
+    if _activo is None:
+        # Carga inicial: con el lock, para no cargar dos veces si llega una solicitud a la vez
+        return get_modelo_activo().version
+    version, rutas = registry.version_activa()
+    if _activo.version == version:
+        return None
+    _publicar(_cargar(version, rutas))
+    return version
+
+def activar(version: str):
+    """
+    Verifica que `version` cargue, la marca como activa en el manifiesto y la
+    publica en este worker. Los demás workers la toman en su siguiente sondeo.
+    """
+    if version not in (registry.leer_manifest() or {}).get("versiones", {}):
+        raise KeyError(f"La versión {version} no está registrada")
+    modelo = _cargar(version, registry.rutas(version))
+    registry.activar(version)
+    _publicar(modelo)
+
+def iniciar_monitor(intervalo: int):
+    """
+    Hilo en segundo plano que carga la versión activa al arrancar el worker
+    (sin bloquear las primeras solicitudes) y luego revisa el manifiesto cada
+    `intervalo` segundos. Con intervalo 0 solo hace la carga inicial.
+    """
+    def ciclo():
+        while True:
+            try:
+                nueva = sincronizar()
+                if nueva:
+                    print(f"Modelo activo: versión {nueva}")
+            except Exception as e:
+                print(f"No se pudo cargar la versión activa del modelo: {e}")
+            if intervalo <= 0:
+                return
+            time.sleep(intervalo)
+
+    threading.Thread(target=ciclo, name="monitor-modelo", daemon=True).start()
@@ -0,0 +1,123 @@
+# ==============================================================================
+# Registro de Versiones del Modelo
+# Cada versión es una carpeta con los tres artefactos (modelo, codificador de
+# etiquetas y explicador SHAP) y manifest.json indica cuál está activa:
+#
+#   registry/
+#     manifest.json            {"activa": "41209cd70a80", "versiones": {...}}
+#     41209cd70a80/            modelo_rf.joblib, label_encoder.joblib, shap_explainer.joblib
+#
+# El id de versión es el hash de los artefactos, así que registrar dos veces
+# los mismos archivos no duplica nada. Si no existe manifest.json se usan los
+# archivos sueltos de app/ml (instalaciones anteriores al registro).
+# ==============================================================================
+
+import datetime
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ARCHIVOS = {
+    "modelo": "modelo_rf.joblib",
+    "label_encoder": "label_encoder.joblib",
+    "explainer": "shap_explainer.joblib",
+}
+
+
+def directorio() -> str:
+    return settings.MODEL_REGISTRY_DIR or os.path.join(_BASE_DIR, "registry")
+
+def _ruta_manifest() -> str:
+    return os.path.join(directorio(), "manifest.json")
+
+def huella(carpeta: str) -> str:
+    """Hash SHA-256 (12 caracteres) de los tres artefactos de una carpeta."""
+    digest = hashlib.sha256()
+    for nombre in ARCHIVOS.values():
+        with open(os.path.join(carpeta, nombre), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+# ==============================================================================
+# MANIFIESTO
+# ==============================================================================
+def leer_manifest() -> Optional[Dict[str, Any]]:
+    try:
+        with open(_ruta_manifest(), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _escribir_manifest(manifest: Dict[str, Any]):
+    """Escritura atómica: los workers que lo leen nunca ven un archivo a medias."""
+    os.makedirs(directorio(), exist_ok=True)
+    temporal = _ruta_manifest() + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temporal, _ruta_manifest())
+
+def version_activa() -> Tuple[str, Dict[str, str]]:
+    """Id de la versión activa y rutas de sus artefactos."""
+    manifest = leer_manifest()
+    if manifest is None:
+        return huella(_BASE_DIR), {clave: os.path.join(_BASE_DIR, nombre) for clave, nombre in ARCHIVOS.items()}
+    return manifest["activa"], rutas(manifest["activa"])
+
+def rutas(version: str) -> Dict[str, str]:
+    carpeta = os.path.join(directorio(), version)
+    return {clave: os.path.join(carpeta, nombre) for clave, nombre in ARCHIVOS.items()}
+
+
+# ==============================================================================
+# ADMINISTRACIÓN
+# ==============================================================================
+def registrar(origen: str, descripcion: str = "", metricas: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Copia los artefactos de la carpeta `origen` al registro como una nueva
+    versión (sin activarla) y devuelve su id.
+    """
+    version = huella(origen)
+    destino = os.path.join(directorio(), version)
+    if not os.path.isdir(destino):
+        temporal = destino + ".tmp"
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        for nombre in ARCHIVOS.values():
+            shutil.copy2(os.path.join(origen, nombre), os.path.join(temporal, nombre))
+        os.replace(temporal, destino)
+
+    manifest = leer_manifest() or {"activa": None, "versiones": {}}
+    if version not in manifest["versiones"]:
+        manifest["versiones"][version] = {
+            "registrada": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+            "descripcion": descripcion,
+            "metricas": metricas or {},
+        }
+    if manifest["activa"] is None:
+        # La primera versión registrada pasa a ser la activa
+        manifest["activa"] = version
+    _escribir_manifest(manifest)
+    return version
+
+def activar(version: str):
+    """Marca `version` como activa. Los workers la cargan en su siguiente sondeo."""
+    manifest = leer_manifest()
+    if manifest is None or version not in manifest["versiones"]:
+        raise KeyError(f"La versión {version} no está registrada")
+    manifest["activa"] = version
+    manifest["versiones"][version]["activada"] = datetime.datetime.utcnow().isoformat(timespec="seconds")
+    _escribir_manifest(manifest)
+
+def listar() -> Dict[str, Any]:
+    manifest = leer_manifest()
+    if manifest is None:
+        version, _ = version_activa()
+        return {"activa": version, "versiones": {version: {"descripcion": "Artefactos sueltos de app/ml (sin registro)"}}}
+    return manifest
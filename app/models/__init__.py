@@ -1,3 +1,6 @@
 from .user import Usuario
 from .question import Pregunta, Recomendacion
-from .diagnosis import Diagnostico, Respuesta, DiagnosticoSHAP
\ No newline at end of file
+from .diagnosis import Diagnostico, Respuesta, DiagnosticoSHAP
+from .report import ReporteMaterializado
+from .analytics import ResumenNivelMensual, ResumenDominioMensual, ResumenDriverMensual
+from .idempotency import ClaveIdempotencia
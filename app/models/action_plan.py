@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Date, Float, ForeignKey
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.database import Base
@@ -26,6 +26,9 @@ class TareaPlan(Base):
     fecha_limite = Column(Date, nullable=True)
     fecha_completada = Column(DateTime, nullable=True)
     progreso = Column(Integer, default=0, nullable=False)
+    # Calculadas al crear el plan: subida esperada del nivel y orden por impacto (1 = primero)
+    ganancia_esperada = Column(Float, nullable=True)
+    prioridad = Column(Integer, nullable=True)
 
     # Relaciones
     plan = relationship("PlanAccion", back_populates="tareas")
@@ -0,0 +1,42 @@
+# ==============================================================================
+# Modelos de Base de Datos para la Analítica de Cohortes
+# Tablas de resumen por mes que se mantienen de forma incremental al crear y
+# podar diagnósticos. Su tamaño depende del número de meses, no del de
+# diagnósticos, así que consultarlas cuesta lo mismo con 1k que con 1M filas.
+# ==============================================================================
+
+from sqlalchemy import Column, Integer, String, Float
+from app.db.database import Base
+
+class ResumenNivelMensual(Base):
+    """Cantidad de diagnósticos por mes y nivel de madurez predicho."""
+    __tablename__ = "Analitica_Niveles_Mes"
+
+    anio = Column(Integer, primary_key=True)
+    mes = Column(Integer, primary_key=True)
+    nivel = Column(String(50), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+
+class ResumenDominioMensual(Base):
+    """
+    Suma y cantidad de puntajes por mes y dominio (los 7 de MAPA_DOMINIOS más
+    las capacidades digital y de liderazgo). El promedio es suma / conteo.
+    """
+    __tablename__ = "Analitica_Dominios_Mes"
+
+    anio = Column(Integer, primary_key=True)
+    mes = Column(Integer, primary_key=True)
+    dominio = Column(String(100), primary_key=True)
+    suma = Column(Float, nullable=False, default=0.0)
+    conteo = Column(Integer, nullable=False, default=0)
+
+
+class ResumenDriverMensual(Base):
+    """Cantidad de veces que cada pregunta fue driver clave (debilidad) por mes."""
+    __tablename__ = "Analitica_Drivers_Mes"
+
+    anio = Column(Integer, primary_key=True)
+    mes = Column(Integer, primary_key=True)
+    id_pregunta = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
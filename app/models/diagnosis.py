@@ -23,6 +23,9 @@ class Diagnostico(Base):
     puntaje_cap_digital = Column(DECIMAL(5, 2), nullable=False)
     puntaje_cap_liderazgo = Column(DECIMAL(5, 2), nullable=False)
     nivel_madurez_predicho = Column(String(50), nullable=False)
+    # Versión del modelo (app.ml.registry) que produjo el nivel y los valores SHAP.
+    # NULL en los diagnósticos anteriores al registro.
+    version_modelo = Column(String(64), nullable=True)
 
     usuario = relationship("Usuario", back_populates="diagnosticos")
     respuestas = relationship("Respuesta", back_populates="diagnostico", cascade="all, delete-orphan")
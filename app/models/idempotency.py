@@ -0,0 +1,23 @@
+# ==============================================================================
+# Modelo de Base de Datos para Claves de Idempotencia
+# Respuestas guardadas por (usuario, Idempotency-Key) cuando no hay Redis:
+# la tabla la comparten todos los workers
+# ==============================================================================
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from app.db.database import Base
+
+class ClaveIdempotencia(Base):
+    """
+    Una clave en curso (estado 'en_curso', sin respuesta) o terminada
+    (estado 'lista', con la respuesta en JSON). Las filas con `expira` en el
+    pasado ya no cuentan y se borran al reclamar otra clave del mismo usuario.
+    """
+    __tablename__ = "Claves_Idempotencia"
+
+    id_usuario = Column(Integer, ForeignKey("Usuarios.id_usuario", ondelete="CASCADE"), primary_key=True)
+    clave = Column(String(255), primary_key=True)
+    huella = Column(String(64), nullable=False)
+    estado = Column(String(20), nullable=False)
+    respuesta = Column(Text, nullable=True)
+    expira = Column(DateTime, nullable=False)
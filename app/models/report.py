@@ -0,0 +1,22 @@
+# ==============================================================================
+# Modelo de Base de Datos para Reportes Materializados
+# Guarda el JSON ya renderizado del reporte de un diagnóstico para que las
+# lecturas repetidas sean una única consulta por clave
+# ==============================================================================
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from app.db.database import Base
+import datetime
+
+class ReporteMaterializado(Base):
+    """
+    Reporte de diagnóstico renderizado. La columna `version` combina la versión
+    del modelo de ML y la del catálogo de preguntas/recomendaciones con las que
+    se generó; si alguna cambia, el reporte se considera obsoleto y se regenera.
+    """
+    __tablename__ = "Reportes_Materializados"
+
+    id_diagnostico = Column(Integer, ForeignKey("Diagnosticos.id_diagnostico", ondelete="CASCADE"), primary_key=True)
+    version = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)
+    fecha_generacion = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Dict, Optional
 from datetime import datetime, date
 
@@ -7,6 +7,20 @@ class TareaUpdate(BaseModel):
     fecha_limite: Optional[date] = None
     progreso: int
 
+# --- Actualización de varias tareas a la vez (PATCH /{id_plan}/tareas) ---
+class TareaUpdateLote(TareaUpdate):
+    id_tarea: int
+
+class TareasUpdateLote(BaseModel):
+    tareas: List[TareaUpdateLote] = Field(..., min_length=1)
+
+    @field_validator('tareas')
+    @classmethod
+    def validar_tareas_unicas(cls, v: List[TareaUpdateLote]) -> List[TareaUpdateLote]:
+        if len({t.id_tarea for t in v}) != len(v):
+            raise ValueError('Cada tarea puede aparecer una sola vez en la actualización.')
+        return v
+
 class TareaResponse(BaseModel):
     id_tarea: int
     id_pregunta: int
@@ -16,6 +30,8 @@ class TareaResponse(BaseModel):
     fecha_limite: Optional[date]
     fecha_completada: Optional[datetime]
     progreso: int
+    ganancia_esperada: Optional[float] = None
+    prioridad: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional, Union
+from datetime import datetime
 
 class FactorImpacto(BaseModel):
     pregunta_id: str
@@ -16,10 +17,81 @@ class ReporteDiagnostico(BaseModel):
     fecha_diagnostico: str
     nivel_madurez_predicho: str
     potencial_avance: float
+    # Versión del modelo que produjo el nivel y los factores SHAP (None si es anterior al registro)
+    version_modelo: Optional[str] = None
 
     # --- Módulo 2: Análisis de Factores (SHAP) ---
     areas_mejora_prioritarias: List[FactorImpacto]
     fortalezas_a_mantener: List[FactorImpacto]
     
     # --- Módulo 3: Desglose Gráfico ---
-    desglose_dominios: Dict[str, float]
\ No newline at end of file
+    desglose_dominios: Dict[str, float]
+    puntaje_cap_digital: Optional[float] = None
+    puntaje_cap_liderazgo: Optional[float] = None
+
+    # --- Módulo 4: Comparación con otras empresas ---
+    # Percentil (0-100) por dominio y capacidad. Se calcula al leer el reporte,
+    # no se guarda con el reporte materializado.
+    percentiles: Optional[Dict[str, float]] = None
+
+
+# --- Comparación de la evolución entre diagnósticos ---
+
+class DiagnosticoComparado(BaseModel):
+    id_diagnostico: int
+    fecha_diagnostico: datetime
+    nivel_madurez_predicho: str
+    puntaje_cap_digital: float
+    puntaje_cap_liderazgo: float
+    desglose_dominios: Dict[str, Optional[float]]
+    respuestas_normalizadas: Dict[str, Optional[float]] # Q1..Q20 en escala 1 a 7 (None si no es válida)
+    valores_shap: Dict[str, Optional[float]]
+    drivers_clave: List[str]
+
+class DeltaPregunta(BaseModel):
+    pregunta_id: str
+    valor_anterior: Optional[float]
+    valor_nuevo: Optional[float]
+    delta: Optional[float]
+    delta_shap: Optional[float]
+
+class DeltaDiagnosticos(BaseModel):
+    id_diagnostico_anterior: int
+    id_diagnostico_nuevo: int
+    nivel_anterior: str
+    nivel_nuevo: str
+    delta_cap_digital: float
+    delta_cap_liderazgo: float
+    dominios: Dict[str, Optional[float]]
+    preguntas: List[DeltaPregunta]
+
+class ComparacionDiagnosticos(BaseModel):
+    # Del más antiguo al más reciente, listo para el gráfico de evolución
+    diagnosticos: List[DiagnosticoComparado]
+    # Cambios entre cada diagnóstico y el anterior
+    deltas: List[DeltaDiagnosticos]
+    # Cambio acumulado entre el primero y el último (None si hay menos de dos)
+    delta_total: Optional[DeltaDiagnosticos] = None
+
+
+# --- Ruta al siguiente nivel (contrafactual) ---
+
+class CambioSugerido(BaseModel):
+    pregunta_id: str
+    respuesta_actual: Optional[Union[str, int]]   # En la escala original del cuestionario
+    respuesta_sugerida: Union[str, int]
+    valor_actual: Optional[float]                 # En la escala normalizada 1 a 7
+    valor_sugerido: float
+
+class RutaSiguienteNivel(BaseModel):
+    id_diagnostico: int
+    version_modelo: str
+    nivel_actual: Optional[str]
+    nivel_objetivo: Optional[str]                 # None si ya está en el nivel más alto
+    alcanzado: bool                               # False: `cambios` es la mejor aproximación encontrada
+    probabilidad_objetivo: Optional[float]        # % de llegar al nivel objetivo o superior con los cambios
+    cambios: List[CambioSugerido]
+    costo: float                                  # Suma de lo que sube cada respuesta en la escala normalizada
+    motivo_fin: Optional[str]
+    evaluaciones: int
+    duracion_ms: float
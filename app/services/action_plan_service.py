@@ -1,14 +1,30 @@
+from __future__ import annotations
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
+from typing import List, Optional, Tuple
 import copy
+import itertools
 
 from app.models.action_plan import PlanAccion, TareaPlan
 from app.models.diagnosis import Diagnostico, DiagnosticoSHAP
-from app.models.question import Recomendacion
+from app.models.question import Pregunta, Recomendacion
+from app.core import pubsub
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.ml.loader import get_model_version, get_modelo_activo
 from app.services.diagnosis_service import process_diagnosis
-from app.schemas.action_plan_schema import TareaUpdate
-from app.services.diagnosis_service import _normalize_row, process_diagnosis
-import pandas as pd
+from app.schemas.action_plan_schema import DashboardTransformacionResponse, TareaUpdate, TareaUpdateLote
+from app.services.diagnosis_service import ORDEN_NIVELES, _normalize_row, normalizar_respuesta, process_diagnosis
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+pd = importar_perezoso("pandas")
+
+_PREGUNTAS = [f"Q{i}" for i in range(1, 21)]
 
 def _obtener_respuesta_ideal(id_pregunta: int) -> any:
     """Devuelve la respuesta perfecta para simular que el usuario mejoró en esta área."""
@@ -23,6 +39,48 @@ def _obtener_respuesta_ideal(id_pregunta: int) -> any:
     else:
         return 7 # Escalas del 1 al 7, el ideal es 7
 
+# =========================================================================
+# PRIORIDAD DE LAS TAREAS (ganancia marginal)
+# Cada debilidad se lleva a su respuesta ideal, sola y de a pares, y todas
+# esas variantes se puntúan en una sola llamada al modelo. La ganancia es
+# cuánto sube el nivel esperado (suma de probabilidad x posición en
+# ORDEN_NIVELES). Con los pares se estima cuánto aporta cada tarea cuando
+# las anteriores ya están hechas, y así se eligen en orden.
+# =========================================================================
+def _rankear_tareas(fila_norm: pd.DataFrame, preguntas: List[int]) -> List[Tuple[int, float]]:
+    """Devuelve (id_pregunta, ganancia marginal) en orden de prioridad."""
+    activo = get_modelo_activo()
+    posicion_clase = np.array([ORDEN_NIVELES.index(c) if c in ORDEN_NIVELES else 0 for c in activo.label_encoder.classes_])
+
+    n = len(preguntas)
+    pares = list(itertools.combinations(range(n), 2))
+    # Fila 0: diagnóstico actual; luego una fila por pregunta y una por par
+    matriz = np.tile(fila_norm[_PREGUNTAS].to_numpy(dtype=float)[0], (1 + n + len(pares), 1))
+    for i, id_pregunta in enumerate(preguntas):
+        ideal = normalizar_respuesta(id_pregunta, _obtener_respuesta_ideal(id_pregunta))
+        matriz[1 + i, id_pregunta - 1] = ideal
+        for j, par in enumerate(pares):
+            if i in par:
+                matriz[1 + n + j, id_pregunta - 1] = ideal
+
+    proba = activo.model.predict_proba(pd.DataFrame(matriz, columns=_PREGUNTAS))
+    nivel_esperado = proba @ posicion_clase
+    individual = nivel_esperado[1:1 + n] - nivel_esperado[0]
+    # Lo que un par gana de más (o de menos) que la suma de sus dos tareas por separado
+    interaccion = np.zeros((n, n))
+    for j, (a, b) in enumerate(pares):
+        interaccion[a, b] = interaccion[b, a] = nivel_esperado[1 + n + j] - nivel_esperado[0] - individual[a] - individual[b]
+
+    ranking, hechas, pendientes = [], [], list(range(n))
+    while pendientes:
+        marginal = {i: individual[i] + interaccion[i, hechas].sum() for i in pendientes}
+        # A igual ganancia se respeta el orden de entrada (la debilidad SHAP más fuerte primero)
+        elegida = max(pendientes, key=lambda i: (marginal[i], -i))
+        ranking.append((preguntas[elegida], round(float(marginal[elegida]), 4)))
+        hechas.append(elegida)
+        pendientes.remove(elegida)
+    return ranking
+
 def crear_o_obtener_plan(db: Session, id_diagnostico: int):
     """Genera un plan de acción basado en las debilidades del diagnóstico."""
     plan_existente = db.query(PlanAccion).filter(PlanAccion.id_diagnostico == id_diagnostico).first()
@@ -38,72 +96,124 @@ def crear_o_obtener_plan(db: Session, id_diagnostico: int):
     drivers = db.query(DiagnosticoSHAP).filter(
         DiagnosticoSHAP.id_diagnostico == id_diagnostico,
         DiagnosticoSHAP.es_driver_clave == True
-    ).all()
+    ).order_by(DiagnosticoSHAP.valor_shap, DiagnosticoSHAP.id_pregunta).all()
 
-    for driver in drivers:
-        tarea = TareaPlan(id_plan=nuevo_plan.id_plan, id_pregunta=driver.id_pregunta)
-        db.add(tarea)
+    if drivers:
+        base = _obtener_analisis_base(db, id_diagnostico)
+        ranking = _rankear_tareas(base["fila_norm"], [d.id_pregunta for d in drivers])
+        for prioridad, (id_pregunta, ganancia) in enumerate(ranking, start=1):
+            db.add(TareaPlan(
+                id_plan=nuevo_plan.id_plan, id_pregunta=id_pregunta,
+                ganancia_esperada=ganancia, prioridad=prioridad
+            ))
     
     db.commit()
     db.refresh(nuevo_plan)
     return nuevo_plan
 
+# =========================================================================
+# CACHÉ DEL MOTOR DE SIMULACIÓN
+# Las respuestas de un diagnóstico no cambian, así que su análisis actual se
+# calcula una sola vez. La proyección solo depende de esas respuestas y del
+# vector de progreso de las tareas: mientras nadie actualice una tarea,
+# consultar el dashboard solo cuesta leer el plan y sus tareas.
+# =========================================================================
+_cache_dashboard = LRUCache(maxsize=settings.DASHBOARD_CACHE_SIZE)
+
+def _obtener_analisis_base(db: Session, id_diagnostico: int) -> dict:
+    """Análisis actual y fila normalizada del diagnóstico (cacheados por versión del modelo)."""
+    def calcular():
+        diagnostico = db.query(Diagnostico).filter(Diagnostico.id_diagnostico == id_diagnostico).first()
+        respuestas_originales = {f"Q{r.id_pregunta}": r.valor_respuesta_cruda for r in diagnostico.respuestas}
+        return {
+            "analisis": process_diagnosis(respuestas_crudas_dict=respuestas_originales),
+            # Respuestas normalizadas originales (en escala 1 a 7)
+            "fila_norm": _normalize_row(respuestas_originales),
+        }
+    return _cache_dashboard.get_or_compute(("base", id_diagnostico, get_model_version()), calcular)
+
+def _proyectar(base: dict, vector_progreso: tuple) -> dict:
+    fila_norm_proyectada = base["fila_norm"].copy()
+
+    # Por cada tarea, calculamos la mejora proporcional según su progreso (%)
+    for id_pregunta, progreso in vector_progreso:
+        if progreso > 0:
+            q_col = f"Q{id_pregunta}"
+            val_actual = fila_norm_proyectada.at[0, q_col]
+            val_ideal = 7.0 # El valor máximo/ideal siempre es 7 en nuestra escala normalizada
+
+            # Si actual es 3, y progreso es 50%. Sube la mitad del camino hacia el 7.
+            nuevo_val = val_actual + ((val_ideal - val_actual) * (progreso / 100.0))
+            fila_norm_proyectada.at[0, q_col] = nuevo_val
+
+    # Corremos el modelo con los valores matemáticamente proyectados
+    return process_diagnosis(fila_normalizada_df=fila_norm_proyectada)
+
+def invalidar_cache_dashboard():
+    """Vacía la caché del dashboard de este worker (p. ej. tras cambiar el modelo)."""
+    _cache_dashboard.clear()
+
 def obtener_datos_dashboard(db: Session, id_plan: int):
     """EL MOTOR DE SIMULACIÓN: Obtiene el plan, las tareas y proyecta el futuro."""
     plan = db.query(PlanAccion).filter(PlanAccion.id_plan == id_plan).first()
-    diagnostico = db.query(Diagnostico).filter(Diagnostico.id_diagnostico == plan.id_diagnostico).first()
+    if not plan:
+        return None
+
+    # 1. Formateamos las tareas para el frontend (To-Do List).
+    # Las tareas, su recomendación de DEBILIDAD y el subdominio se leen en una sola consulta.
+    filas = db.query(TareaPlan, Recomendacion.texto_recomendacion, Pregunta.subdominio, Recomendacion.id_recomendacion).outerjoin(
+        Recomendacion, and_(
+            Recomendacion.id_pregunta == TareaPlan.id_pregunta,
+            Recomendacion.tipo_feedback == 'DEBILIDAD'
+        )
+    ).outerjoin(
+        Pregunta, Pregunta.id_pregunta == Recomendacion.id_pregunta
+    ).filter(
+        TareaPlan.id_plan == id_plan
+    ).order_by(
+        # Por impacto; las tareas de planes anteriores a la prioridad van al final en su orden original
+        case((TareaPlan.prioridad.is_(None), 1), else_=0), TareaPlan.prioridad,
+        TareaPlan.id_tarea, Recomendacion.id_recomendacion
+    ).all()
 
-    # 1. Formateamos las tareas para el frontend (To-Do List)
     tareas_formateadas = []
     tareas_completadas_ids =[]
-    
-    for t in plan.tareas:
-        # Obtenemos la recomendación de la BD
-        rec = db.query(Recomendacion).filter(
-            Recomendacion.id_pregunta == t.id_pregunta, 
-            Recomendacion.tipo_feedback == 'DEBILIDAD'
-        ).first()
-        
+    vistas = set()
+
+    for t, texto_recomendacion, subdominio, id_rec in filas:
+        # Si una pregunta tiene varias recomendaciones de DEBILIDAD nos quedamos con la primera
+        if t.id_tarea in vistas:
+            continue
+        vistas.add(t.id_tarea)
+
         tareas_formateadas.append({
             "id_tarea": t.id_tarea,
             "id_pregunta": t.id_pregunta,
-            "titulo": rec.pregunta.subdominio if rec else f"Mejora en Q{t.id_pregunta}",
-            "recomendacion": rec.texto_recomendacion if rec else "Acción requerida.",
+            "titulo": subdominio if id_rec is not None else f"Mejora en Q{t.id_pregunta}",
+            "recomendacion": texto_recomendacion if id_rec is not None else "Acción requerida.",
             "estado": t.estado,
             "fecha_limite": t.fecha_limite,
             "fecha_completada": t.fecha_completada,
-            "progreso": t.progreso
+            "progreso": t.progreso,
+            "ganancia_esperada": t.ganancia_esperada,
+            "prioridad": t.prioridad
         })
         if t.estado == 'Completada':
             tareas_completadas_ids.append(t.id_pregunta)
 
-    porcentaje = int((len(tareas_completadas_ids) / len(plan.tareas)) * 100) if plan.tareas else 0
+    porcentaje = int((len(tareas_completadas_ids) / len(tareas_formateadas)) * 100) if tareas_formateadas else 0
 
     # =========================================================================
     # 2. EL MOTOR DE SIMULACIÓN (Interpolación Dinámica)
     # =========================================================================
-    
-    respuestas_originales = {f"Q{r.id_pregunta}": r.valor_respuesta_cruda for r in diagnostico.respuestas}
-    
-    # Análisis actual 
-    analisis_actual = process_diagnosis(respuestas_crudas_dict=respuestas_originales)
-    
-    # Extraemos las respuestas normalizadas originales (en escala 1 a 7)
-    fila_norm_proyectada = _normalize_row(respuestas_originales)
-    
-    # Por cada tarea, calculamos la mejora proporcional según su progreso (%)
-    for t in plan.tareas:
-        if t.progreso > 0:
-            q_col = f"Q{t.id_pregunta}"
-            val_actual = fila_norm_proyectada.at[0, q_col]
-            val_ideal = 7.0 # El valor máximo/ideal siempre es 7 en nuestra escala normalizada
-            
-            # Si actual es 3, y progreso es 50%. Sube la mitad del camino hacia el 7.
-            nuevo_val = val_actual + ((val_ideal - val_actual) * (t.progreso / 100.0))
-            fila_norm_proyectada.at[0, q_col] = nuevo_val
+    base = _obtener_analisis_base(db, plan.id_diagnostico)
+    analisis_actual = base["analisis"]
 
-    # Corremos el modelo con los valores matemáticamente proyectados
-    analisis_proyectado = process_diagnosis(fila_normalizada_df=fila_norm_proyectada)
+    vector_progreso = tuple(sorted((t["id_pregunta"], t["progreso"]) for t in tareas_formateadas))
+    analisis_proyectado = _cache_dashboard.get_or_compute(
+        ("proyeccion", plan.id_plan, get_model_version(), vector_progreso),
+        lambda: _proyectar(base, vector_progreso)
+    )
 
     # 4. Ensamblamos la Super-Respuesta JSON
     return {
@@ -127,22 +237,123 @@ def obtener_datos_dashboard(db: Session, id_plan: int):
         "dominios_proyectados": analisis_proyectado["desglose_dominios"]
     }
 
-def actualizar_tarea(db: Session, id_tarea: int, update_data: TareaUpdate):
-    """Marca una tarea como completada y guarda la fecha."""
-    tarea = db.query(TareaPlan).filter(TareaPlan.id_tarea == id_tarea).first()
-    if not tarea:
+async def actualizar_tarea_async(db: AsyncSession, id_tarea: int, id_usuario: int,
+                                 update_data: TareaUpdate) -> Optional[Tuple[TareaPlan, bool]]:
+    """
+    Actualiza el estado, el progreso y la fecha límite de una tarea. Devuelve
+    la tarea y si cambió el progreso del plan (progreso o estado de la tarea),
+    o None si no existe o su plan no es del usuario.
+    """
+    tarea = await db.get(TareaPlan, id_tarea)
+    if not tarea or not await plan_pertenece_async(db, tarea.id_plan, id_usuario):
         return None
-    
-    tarea.estado = update_data.estado
-    tarea.progreso = update_data.progreso
+
+    cambio = _aplicar_actualizacion(tarea, update_data)
+    await db.commit()
+    return tarea, cambio
+
+def _aplicar_actualizacion(tarea: TareaPlan, update_data: TareaUpdate) -> bool:
+    """Aplica la actualización y devuelve si cambió el progreso o el estado."""
+    valores = _valores_actualizados(tarea.fecha_limite, tarea.fecha_completada, update_data)
+    cambio = (tarea.estado, tarea.progreso) != (valores["estado"], valores["progreso"])
+    for columna, valor in valores.items():
+        setattr(tarea, columna, valor)
+    return cambio
+
+def _valores_actualizados(fecha_limite, fecha_completada, update_data: TareaUpdate) -> dict:
+    """Nuevos valores de las columnas editables de una tarea."""
     if update_data.fecha_limite:
-        tarea.fecha_limite = update_data.fecha_limite
-        
-    if tarea.estado == 'Completada' and not tarea.fecha_completada:
-        tarea.fecha_completada = datetime.now(timezone.utc)
-    elif tarea.estado == 'Pendiente':
-        tarea.fecha_completada = None # Si la desmarca
+        fecha_limite = update_data.fecha_limite
 
+    if update_data.estado == 'Completada' and not fecha_completada:
+        fecha_completada = datetime.now(timezone.utc)
+    elif update_data.estado == 'Pendiente':
+        fecha_completada = None # Si la desmarca
+    return {
+        "estado": update_data.estado,
+        "progreso": update_data.progreso,
+        "fecha_limite": fecha_limite,
+        "fecha_completada": fecha_completada,
+    }
+
+def actualizar_tareas_lote(db: Session, id_plan: int, id_usuario: int,
+                           actualizaciones: List[TareaUpdateLote]) -> Optional[Tuple[dict, bool]]:
+    """
+    Aplica varias actualizaciones de tareas del plan en una sola transacción
+    (un UPDATE por clave primaria para todas) y devuelve el dashboard
+    proyectado, serializado, y si cambió el progreso del plan. Devuelve None
+    si el plan no existe o no es del usuario; lanza ValueError si alguna
+    tarea no pertenece al plan.
+    """
+    if db.scalar(_consulta_plan_de_usuario(id_plan, id_usuario)) is None:
+        return None
+
+    ids = [a.id_tarea for a in actualizaciones]
+    actuales = {fila.id_tarea: fila for fila in db.execute(
+        select(TareaPlan.id_tarea, TareaPlan.estado, TareaPlan.progreso,
+               TareaPlan.fecha_limite, TareaPlan.fecha_completada)
+        .where(TareaPlan.id_plan == id_plan, TareaPlan.id_tarea.in_(ids))
+    )}
+    ajenas = [id_tarea for id_tarea in ids if id_tarea not in actuales]
+    if ajenas:
+        raise ValueError(f"Tareas no encontradas en el plan {id_plan}: {', '.join(map(str, ajenas))}")
+
+    filas, cambio = [], False
+    for actualizacion in actualizaciones:
+        actual = actuales[actualizacion.id_tarea]
+        valores = _valores_actualizados(actual.fecha_limite, actual.fecha_completada, actualizacion)
+        cambio = cambio or (actual.estado, actual.progreso) != (valores["estado"], valores["progreso"])
+        filas.append({"id_tarea": actualizacion.id_tarea, **valores})
+    db.execute(update(TareaPlan), filas)
     db.commit()
-    db.refresh(tarea)
-    return tarea
\ No newline at end of file
+
+    # Una sola proyección (y llamada al modelo) para todas las tareas actualizadas
+    return dashboard_serializado(db, id_plan), cambio
+
+
+# =========================================================================
+# DASHBOARD EN VIVO (SSE)
+# Cuando una actualización cambia el progreso, el worker que la recibió
+# recalcula la proyección una sola vez y la publica en el canal del plan;
+# cada stream abierto (en cualquier worker) solo la reenvía.
+# =========================================================================
+def canal_plan(id_plan: int) -> str:
+    return f"plan:{id_plan}"
+
+def _consulta_plan_de_usuario(id_plan: int, id_usuario: int):
+    return select(PlanAccion.id_plan).join(
+        Diagnostico, Diagnostico.id_diagnostico == PlanAccion.id_diagnostico
+    ).where(PlanAccion.id_plan == id_plan, Diagnostico.id_usuario == id_usuario)
+
+def plan_pertenece(db: Session, id_plan: int, id_usuario: int) -> bool:
+    """Si el plan existe y su diagnóstico es del usuario."""
+    return db.scalar(_consulta_plan_de_usuario(id_plan, id_usuario)) is not None
+
+async def plan_pertenece_async(db: AsyncSession, id_plan: int, id_usuario: int) -> bool:
+    """Versión asíncrona de plan_pertenece."""
+    return await db.scalar(_consulta_plan_de_usuario(id_plan, id_usuario)) is not None
+
+def dashboard_serializado(db: Session, id_plan: int) -> Optional[dict]:
+    """El dashboard del plan como JSON (la misma forma que responde GET /dashboard)."""
+    datos = obtener_datos_dashboard(db, id_plan=id_plan)
+    if datos is None:
+        return None
+    return DashboardTransformacionResponse.model_validate(datos).model_dump(mode="json")
+
+async def publicar_dashboard(id_plan: int):
+    """
+    Tarea en segundo plano tras una actualización que cambió el progreso:
+    recalcula el dashboard (en el threadpool, con la primaria) y lo publica.
+    """
+    def calcular():
+        db = SessionLocal()
+        try:
+            return dashboard_serializado(db, id_plan)
+        finally:
+            db.close()
+    try:
+        datos = await run_in_threadpool(calcular)
+        if datos is not None:
+            await pubsub.publicar(canal_plan(id_plan), datos)
+    except Exception as e:
+        print(f"No se pudo publicar el dashboard del plan {id_plan}: {e}")
@@ -0,0 +1,91 @@
+# ==============================================================================
+# Servicio de Agregación de Puntajes
+# Los 7 dominios y las 2 capacidades son promedios de grupos de preguntas.
+# Los mapas se compilan una vez en matrices de pertenencia (20 x 7 y 20 x 2)
+# y los puntajes de una o N filas de respuestas salen de un solo producto
+# matricial, ignorando las respuestas faltantes (NaN) como hace pandas en
+# mean(axis=1): suma de las válidas / cantidad de válidas.
+#
+# Lo usan el diagnóstico (y con él el dashboard del plan de acción), la
+# comparación de diagnósticos, los percentiles y la analítica de cohortes.
+# ==============================================================================
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Dict, List
+
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+
+PREGUNTAS = [f'Q{i}' for i in range(1, 21)]
+
+# --- Mapeo de Preguntas a Dominios ---
+MAPA_DOMINIOS = {
+    'Contacto con el Cliente': [f'Q{i}' for i in range(1, 5)],
+    'Operaciones': [f'Q{i}' for i in range(5, 9)],
+    'Modelos de Negocio': [f'Q{i}' for i in range(9, 11)],
+    'Visión': [f'Q{i}' for i in range(11, 13)],
+    'Compromiso (Engagement)': [f'Q{i}' for i in range(13, 16)],
+    'Gobernanza (Gobierno Digital)': [f'Q{i}' for i in range(16, 19)],
+    'Capacidades Tecnológicas (Liderazgo de TI)': [f'Q{i}' for i in range(19, 21)]
+}
+
+# --- Mapeo de Preguntas a Capacidades ---
+CAPACIDAD_DIGITAL = "Capacidad Digital"
+CAPACIDAD_LIDERAZGO = "Capacidad de Liderazgo"
+MAPA_CAPACIDADES = {
+    CAPACIDAD_DIGITAL: [f'Q{i}' for i in range(1, 11)],
+    CAPACIDAD_LIDERAZGO: [f'Q{i}' for i in range(11, 21)],
+}
+
+# Orden de las columnas que devuelve agregar(): los 7 dominios y las 2 capacidades
+METRICAS = list(MAPA_DOMINIOS) + list(MAPA_CAPACIDADES)
+N_DOMINIOS = len(MAPA_DOMINIOS)
+
+
+def dominio_por_pregunta() -> Dict[int, str]:
+    """Dominio de cada pregunta, por id_pregunta."""
+    return {int(q[1:]): dominio for dominio, preguntas in MAPA_DOMINIOS.items() for q in preguntas}
+
+
+# ==============================================================================
+# MATRICES DE PERTENENCIA
+# ==============================================================================
+def _matriz_pertenencia(mapa: Dict[str, List[str]]) -> np.ndarray:
+    matriz = np.zeros((len(PREGUNTAS), len(mapa)))
+    for columna, preguntas in enumerate(mapa.values()):
+        matriz[[PREGUNTAS.index(q) for q in preguntas], columna] = 1.0
+    return matriz
+
+@lru_cache(maxsize=None)
+def matriz_metricas() -> np.ndarray:
+    """Matriz 20 x 9: columnas de dominios (20 x 7) seguidas de las de capacidades (20 x 2)."""
+    matriz = np.hstack([_matriz_pertenencia(MAPA_DOMINIOS), _matriz_pertenencia(MAPA_CAPACIDADES)])
+    matriz.setflags(write=False)
+    return matriz
+
+
+# ==============================================================================
+# PUNTAJES
+# ==============================================================================
+def agregar(respuestas, decimales: int = 2) -> np.ndarray:
+    """
+    Puntajes (n, 9) en el orden de METRICAS, redondeados a `decimales`.
+    `respuestas` es una fila (20,), una matriz (n, 20) o un DataFrame con las
+    columnas Q1..Q20; NaN es una respuesta faltante y una métrica sin
+    respuestas válidas queda en NaN.
+    """
+    if hasattr(respuestas, "columns"):
+        respuestas = respuestas[PREGUNTAS].to_numpy(dtype=float)
+    respuestas = np.atleast_2d(np.asarray(respuestas, dtype=float))
+    matriz = matriz_metricas()
+    validas = ~np.isnan(respuestas)
+    sumas = np.where(validas, respuestas, 0.0) @ matriz
+    conteos = validas.astype(float) @ matriz
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.round(np.where(conteos > 0, sumas / conteos, np.nan), decimales)
+
+def desglose(puntajes: np.ndarray) -> Dict[str, float]:
+    """Diccionario {dominio: puntaje} de una fila devuelta por agregar()."""
+    return dict(zip(MAPA_DOMINIOS, puntajes[:N_DOMINIOS]))
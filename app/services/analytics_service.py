@@ -0,0 +1,273 @@
+# ==============================================================================
+# Servicio de Analítica de Cohortes
+# Mantiene las tablas de resumen mensuales (niveles, dominios y drivers clave)
+# y las consulta para el panel de administración. Las agregaciones se hacen
+# en SQL: nunca se cargan filas ORM de diagnósticos en memoria.
+# ==============================================================================
+
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import Float, and_, bindparam, case, cast, delete, extract, func, insert, or_, select, true, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.analytics import ResumenDominioMensual, ResumenDriverMensual, ResumenNivelMensual
+from app.models.diagnosis import Diagnostico, DiagnosticoSHAP, Respuesta
+from app.services import aggregation_service
+
+# Métricas adicionales a los 7 dominios (se toman de las columnas del diagnóstico)
+CAPACIDAD_DIGITAL = aggregation_service.CAPACIDAD_DIGITAL
+CAPACIDAD_LIDERAZGO = aggregation_service.CAPACIDAD_LIDERAZGO
+
+
+# ==============================================================================
+# AGREGACIONES EN SQL
+# Cada consulta recibe opcionalmente los ids de diagnóstico a agregar; sin
+# ids agregan la tabla completa (reconstrucción).
+# ==============================================================================
+@lru_cache(maxsize=None)
+def _consultas(filtrar_ids: bool) -> Dict[str, Any]:
+    """
+    Construye una sola vez las consultas de agregación (construirlas en cada
+    diagnóstico costaba más que ejecutarlas). Con `filtrar_ids` llevan un
+    parámetro expansible :ids con los diagnósticos a agregar.
+    """
+    ids = bindparam("ids", expanding=True)
+    anio, mes = extract("year", Diagnostico.fecha_diagnostico), extract("month", Diagnostico.fecha_diagnostico)
+
+    niveles = select(anio, mes, Diagnostico.nivel_madurez_predicho, func.count()).group_by(
+        anio, mes, Diagnostico.nivel_madurez_predicho
+    )
+
+    # Dominio de cada respuesta según MAPA_DOMINIOS. Un valor normalizado 0 es una
+    # respuesta inválida y no cuenta (igual que el NaN de _normalize_row).
+    dominio_de = aggregation_service.dominio_por_pregunta()
+    respuestas = select(
+        Respuesta.id_diagnostico,
+        case(dominio_de, value=Respuesta.id_pregunta).label("dominio"),
+        case((Respuesta.valor_normalizado > 0, cast(Respuesta.valor_normalizado, Float))).label("valor"),
+    )
+    if filtrar_ids:
+        respuestas = respuestas.where(Respuesta.id_diagnostico.in_(ids))
+    respuestas = respuestas.subquery()
+
+    # Puntaje de cada diagnóstico en cada dominio (promedio de sus preguntas)
+    por_diagnostico = select(
+        respuestas.c.id_diagnostico, respuestas.c.dominio, func.avg(respuestas.c.valor).label("puntaje")
+    ).group_by(respuestas.c.id_diagnostico, respuestas.c.dominio).subquery()
+
+    dominios = select(
+        anio, mes, por_diagnostico.c.dominio, func.sum(por_diagnostico.c.puntaje), func.count(por_diagnostico.c.puntaje)
+    ).join(
+        por_diagnostico, por_diagnostico.c.id_diagnostico == Diagnostico.id_diagnostico
+    ).group_by(anio, mes, por_diagnostico.c.dominio)
+
+    capacidades = select(
+        anio, mes,
+        func.sum(cast(Diagnostico.puntaje_cap_digital, Float)),
+        func.sum(cast(Diagnostico.puntaje_cap_liderazgo, Float)),
+        func.count(),
+    ).group_by(anio, mes)
+
+    drivers = select(anio, mes, DiagnosticoSHAP.id_pregunta, func.count()).join(
+        Diagnostico, Diagnostico.id_diagnostico == DiagnosticoSHAP.id_diagnostico
+    ).where(DiagnosticoSHAP.es_driver_clave == True).group_by(anio, mes, DiagnosticoSHAP.id_pregunta)
+
+    if filtrar_ids:
+        niveles = niveles.where(Diagnostico.id_diagnostico.in_(ids))
+        capacidades = capacidades.where(Diagnostico.id_diagnostico.in_(ids))
+        drivers = drivers.where(DiagnosticoSHAP.id_diagnostico.in_(ids))
+    return {"niveles": niveles, "dominios": dominios, "capacidades": capacidades, "drivers": drivers}
+
+def _ejecutar(db: Session, nombre: str, ids: Optional[List[int]]) -> List[tuple]:
+    if ids is None:
+        return db.execute(_consultas(False)[nombre]).all()
+    return db.execute(_consultas(True)[nombre], {"ids": ids}).all()
+
+def _agregar_niveles(db: Session, ids: Optional[List[int]]) -> List[tuple]:
+    return _ejecutar(db, "niveles", ids)
+
+def _agregar_dominios(db: Session, ids: Optional[List[int]]) -> List[tuple]:
+    filas = [f for f in _ejecutar(db, "dominios", ids) if f[2] is not None]
+    for a, m, suma_digital, suma_liderazgo, conteo in _ejecutar(db, "capacidades", ids):
+        filas.append((a, m, CAPACIDAD_DIGITAL, suma_digital, conteo))
+        filas.append((a, m, CAPACIDAD_LIDERAZGO, suma_liderazgo, conteo))
+    return filas
+
+def _agregar_drivers(db: Session, ids: Optional[List[int]]) -> List[tuple]:
+    return _ejecutar(db, "drivers", ids)
+
+
+# ==============================================================================
+# MANTENIMIENTO INCREMENTAL
+# ==============================================================================
+@lru_cache(maxsize=None)
+def _sentencia_incremento(tabla, claves: tuple, incrementos: tuple):
+    t = tabla.__table__
+    return update(t).where(*(t.c[k] == bindparam(f"k_{k}") for k in claves)).values(
+        {c: t.c[c] + bindparam(f"d_{c}") for c in incrementos}
+    )
+
+def _sumar(db: Session, tabla, claves: List[str], incrementos: List[str], filas: List[tuple]):
+    """
+    Suma los incrementos de cada fila a la tabla de resumen (UPDATE col = col + n,
+    atómico frente a otros workers). Primero se crean con valor 0 las filas que
+    aún no existen; luego se aplican todos los incrementos en un solo executemany.
+    """
+    if not filas:
+        return
+    t = tabla.__table__
+    n = len(claves)
+    meses = {(f[0], f[1]) for f in filas}
+    existentes = set(db.execute(
+        select(*(t.c[k] for k in claves)).where(
+            or_(*(and_(t.c.anio == anio, t.c.mes == mes) for anio, mes in meses))
+        )
+    ).all())
+
+    nuevas = [dict(zip(claves, f[:n]), **{c: 0 for c in incrementos})
+              for f in filas if tuple(f[:n]) not in existentes]
+    if nuevas:
+        try:
+            # Otro worker puede crear la misma fila a la vez: el savepoint evita perder la transacción
+            with db.begin_nested():
+                db.execute(insert(t), nuevas)
+        except IntegrityError:
+            for fila in nuevas:
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(t), fila)
+                except IntegrityError:
+                    pass
+
+    db.execute(_sentencia_incremento(tabla, tuple(claves), tuple(incrementos)), [
+        {**{f"k_{k}": v for k, v in zip(claves, f[:n])}, **{f"d_{c}": v for c, v in zip(incrementos, f[n:])}}
+        for f in filas
+    ])
+
+def _aplicar(db: Session, ids: List[int], signo: int):
+    if not ids:
+        return
+    _sumar(db, ResumenNivelMensual, ["anio", "mes", "nivel"], ["total"], [
+        (int(anio), int(mes), nivel, signo * total)
+        for anio, mes, nivel, total in _agregar_niveles(db, ids)
+    ])
+    _sumar(db, ResumenDominioMensual, ["anio", "mes", "dominio"], ["suma", "conteo"], [
+        (int(anio), int(mes), dominio, signo * float(suma or 0.0), signo * conteo)
+        for anio, mes, dominio, suma, conteo in _agregar_dominios(db, ids)
+    ])
+    _sumar(db, ResumenDriverMensual, ["anio", "mes", "id_pregunta"], ["total"], [
+        (int(anio), int(mes), id_pregunta, signo * total)
+        for anio, mes, id_pregunta, total in _agregar_drivers(db, ids)
+    ])
+
+    if signo < 0:
+        # Filas que quedaron vacías después de descontar
+        db.execute(delete(ResumenNivelMensual).where(ResumenNivelMensual.total <= 0))
+        db.execute(delete(ResumenDominioMensual).where(ResumenDominioMensual.conteo <= 0))
+        db.execute(delete(ResumenDriverMensual).where(ResumenDriverMensual.total <= 0))
+
+def registrar_diagnosticos(db: Session, ids_diagnostico: Iterable[int]):
+    """
+    Suma a los resúmenes los diagnósticos indicados. Debe llamarse dentro de la
+    misma transacción que los inserta (después de flush), sin hacer commit.
+    """
+    db.flush()
+    _aplicar(db, list(ids_diagnostico), +1)
+
+def descontar_diagnosticos(db: Session, ids_diagnostico: Iterable[int]):
+    """
+    Resta de los resúmenes los diagnósticos indicados. Debe llamarse ANTES de
+    borrarlos y dentro de la misma transacción, sin hacer commit.
+    """
+    _aplicar(db, list(ids_diagnostico), -1)
+
+def reconstruir(db: Session) -> Dict[str, int]:
+    """Recalcula las tablas de resumen desde cero a partir de todos los diagnósticos."""
+    db.execute(delete(ResumenNivelMensual))
+    db.execute(delete(ResumenDominioMensual))
+    db.execute(delete(ResumenDriverMensual))
+
+    niveles = [{"anio": int(a), "mes": int(m), "nivel": n, "total": t}
+               for a, m, n, t in _agregar_niveles(db, None)]
+    dominios = [{"anio": int(a), "mes": int(m), "dominio": d, "suma": float(s or 0.0), "conteo": c}
+                for a, m, d, s, c in _agregar_dominios(db, None)]
+    drivers = [{"anio": int(a), "mes": int(m), "id_pregunta": q, "total": t}
+               for a, m, q, t in _agregar_drivers(db, None)]
+    for tabla, filas in ((ResumenNivelMensual, niveles), (ResumenDominioMensual, dominios),
+                         (ResumenDriverMensual, drivers)):
+        if filas:
+            db.execute(insert(tabla), filas)
+    db.commit()
+    return {"niveles": len(niveles), "dominios": len(dominios), "drivers": len(drivers)}
+
+
+# ==============================================================================
+# CONSULTAS DEL PANEL
+# Los periodos se expresan como "AAAA-MM" y el rango es inclusivo.
+# ==============================================================================
+def _periodo(anio: int, mes: int) -> str:
+    return f"{anio:04d}-{mes:02d}"
+
+def _filtro_periodo(tabla, desde: Optional[str], hasta: Optional[str]):
+    clave = tabla.anio * 100 + tabla.mes
+    condiciones = []
+    if desde:
+        condiciones.append(clave >= int(desde.replace("-", "")))
+    if hasta:
+        condiciones.append(clave <= int(hasta.replace("-", "")))
+    return and_(true(), *condiciones)
+
+def niveles_por_mes(db: Session, desde: Optional[str] = None, hasta: Optional[str] = None) -> Dict[str, Any]:
+    filas = db.query(ResumenNivelMensual).filter(
+        _filtro_periodo(ResumenNivelMensual, desde, hasta)
+    ).order_by(ResumenNivelMensual.anio, ResumenNivelMensual.mes).all()
+
+    meses: Dict[str, Dict[str, int]] = {}
+    totales: Dict[str, int] = {}
+    for f in filas:
+        meses.setdefault(_periodo(f.anio, f.mes), {})[f.nivel] = f.total
+        totales[f.nivel] = totales.get(f.nivel, 0) + f.total
+    return {
+        "meses": [{"periodo": p, "niveles": n, "total": sum(n.values())} for p, n in meses.items()],
+        "totales": totales,
+        "total": sum(totales.values()),
+    }
+
+def dominios_por_mes(db: Session, desde: Optional[str] = None, hasta: Optional[str] = None) -> Dict[str, Any]:
+    filas = db.query(ResumenDominioMensual).filter(
+        _filtro_periodo(ResumenDominioMensual, desde, hasta)
+    ).order_by(ResumenDominioMensual.anio, ResumenDominioMensual.mes).all()
+
+    meses: Dict[str, Dict[str, float]] = {}
+    acumulado: Dict[str, List[float]] = {}
+    for f in filas:
+        meses.setdefault(_periodo(f.anio, f.mes), {})[f.dominio] = round(f.suma / f.conteo, 2)
+        suma_conteo = acumulado.setdefault(f.dominio, [0.0, 0])
+        suma_conteo[0] += f.suma
+        suma_conteo[1] += f.conteo
+    return {
+        "meses": [{"periodo": p, "promedios": d} for p, d in meses.items()],
+        "promedios": {d: round(s / c, 2) for d, (s, c) in acumulado.items() if c},
+    }
+
+def drivers_frecuentes(db: Session, desde: Optional[str] = None, hasta: Optional[str] = None,
+                       limite: int = 10) -> Dict[str, Any]:
+    total = func.sum(ResumenDriverMensual.total)
+    ranking = db.query(ResumenDriverMensual.id_pregunta, total).filter(
+        _filtro_periodo(ResumenDriverMensual, desde, hasta)
+    ).group_by(ResumenDriverMensual.id_pregunta).order_by(total.desc(), ResumenDriverMensual.id_pregunta).limit(limite).all()
+
+    # Porcentaje sobre los diagnósticos del mismo rango
+    n_diagnosticos = db.query(func.sum(ResumenNivelMensual.total)).filter(
+        _filtro_periodo(ResumenNivelMensual, desde, hasta)
+    ).scalar() or 0
+    return {
+        "diagnosticos": int(n_diagnosticos),
+        "ranking": [{
+            "pregunta_id": f"Q{id_pregunta}",
+            "veces_driver": int(veces),
+            "porcentaje_diagnosticos": round(100 * veces / n_diagnosticos, 2) if n_diagnosticos else 0.0,
+        } for id_pregunta, veces in ranking],
+    }
@@ -3,12 +3,13 @@
 # Proporciona funciones para autenticación, gestión de contraseñas y usuarios
 # ==============================================================================
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import bcrypt
-from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional
-from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
 from pydantic import EmailStr
 from app.models.user import Usuario
 from app.schemas.user_schema import UsuarioCreate
@@ -65,6 +66,12 @@ def get_user_by_email(db: Session, email: str) -> Optional[Usuario]:
     """Busca y devuelve un usuario por su correo electrónico."""
     return db.query(Usuario).filter(Usuario.correo_electronico == email).first()
 
+async def get_user_by_email_async(db: AsyncSession, email: str) -> Optional[Usuario]:
+    """Versión asíncrona de get_user_by_email."""
+    return (await db.execute(
+        select(Usuario).where(Usuario.correo_electronico == email).limit(1)
+    )).scalars().first()
+
 def create_user(db: Session, user: UsuarioCreate) -> Usuario:
     """Crea un nuevo usuario en la base de datos."""
     hashed_password = get_password_hash(user.contrasena)
@@ -96,6 +103,13 @@ def update_user(db: Session, db_user: Usuario, user_update: UsuarioUpdate) -> Us
     
     return db_user
 
+async def update_user_async(db: AsyncSession, db_user: Usuario, user_update: UsuarioUpdate) -> Usuario:
+    """Versión asíncrona de update_user (db_user debe venir de la misma sesión)."""
+    for key, value in user_update.model_dump(exclude_unset=True).items():
+        setattr(db_user, key, value)
+    await db.commit()
+    return db_user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Crea un nuevo token de acceso JWT."""
     to_encode = data.copy()
@@ -106,11 +120,14 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     
     to_encode.update({"exp": expire})
+    # jose (y su criptografía) se importa al primer uso, no al arrancar el worker
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 def decode_access_token(token: str):
     # decodificar el token
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
@@ -120,18 +137,27 @@ def decode_access_token(token: str):
     except JWTError:
         return None
     
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.MAIL_USERNAME,
-    MAIL_PASSWORD=settings.MAIL_PASSWORD,
-    MAIL_FROM=settings.MAIL_FROM,
-    MAIL_PORT=settings.MAIL_PORT,
-    MAIL_SERVER=settings.MAIL_SERVER,
-    MAIL_STARTTLS=settings.MAIL_STARTTLS,
-    MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
-    USE_CREDENTIALS=True
-)
+@lru_cache(maxsize=1)
+def _config_correo():
+    """
+    Configuración del servidor de correo. fastapi_mail (y httpx) solo se
+    importan la primera vez que se envía un correo, no al arrancar el worker.
+    """
+    from fastapi_mail import ConnectionConfig
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.MAIL_USERNAME,
+        MAIL_PASSWORD=settings.MAIL_PASSWORD,
+        MAIL_FROM=settings.MAIL_FROM,
+        MAIL_PORT=settings.MAIL_PORT,
+        MAIL_SERVER=settings.MAIL_SERVER,
+        MAIL_STARTTLS=settings.MAIL_STARTTLS,
+        MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
+        USE_CREDENTIALS=True
+    )
 
 async def send_password_reset_email(email: EmailStr, token: str):
+    from fastapi_mail import FastMail, MessageSchema, MessageType
+
     frontend_reset_url = f"{settings.FRONTEND_URL}/reset-password?token={token}"
     
     html_content = f"""
@@ -154,5 +180,5 @@ async def send_password_reset_email(email: EmailStr, token: str):
         subtype=MessageType.html
     )
 
-    fm = FastMail(conf)
+    fm = FastMail(_config_correo())
     await fm.send_message(message)
\ No newline at end of file
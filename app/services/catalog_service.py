@@ -0,0 +1,51 @@
+# ==============================================================================
+# Servicio del Catálogo de Preguntas y Recomendaciones
+# Calcula una versión (huella) del catálogo para invalidar los datos derivados
+# de él, como los reportes materializados
+# ==============================================================================
+
+import hashlib
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.question import Pregunta, Recomendacion
+
+_lock = threading.Lock()
+_version_cache = {"version": None, "expira": 0.0}
+
+
+def _calcular_version(db: Session) -> str:
+    digest = hashlib.sha256()
+    preguntas = db.query(
+        Pregunta.id_pregunta, Pregunta.texto_pregunta, Pregunta.seccion,
+        Pregunta.dominio, Pregunta.subdominio, Pregunta.tipo_pregunta
+    ).order_by(Pregunta.id_pregunta).all()
+    recomendaciones = db.query(
+        Recomendacion.id_recomendacion, Recomendacion.id_pregunta, Recomendacion.tipo_feedback,
+        Recomendacion.texto_explicacion, Recomendacion.texto_recomendacion
+    ).order_by(Recomendacion.id_recomendacion).all()
+    for fila in preguntas + recomendaciones:
+        digest.update(repr(tuple(fila)).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+def get_catalog_version(db: Session) -> str:
+    """
+    Devuelve la huella del catálogo. Se recalcula como máximo una vez cada
+    CATALOG_VERSION_TTL segundos por worker, así que un cambio en el catálogo
+    tarda a lo sumo ese tiempo en invalidar los reportes materializados.
+    """
+    ahora = time.monotonic()
+    if _version_cache["version"] is None or ahora >= _version_cache["expira"]:
+        version = _calcular_version(db)
+        with _lock:
+            _version_cache["version"] = version
+            _version_cache["expira"] = ahora + settings.CATALOG_VERSION_TTL
+    return _version_cache["version"]
+
+def reset_catalog_version():
+    """Fuerza a recalcular la huella del catálogo en la próxima lectura."""
+    with _lock:
+        _version_cache["version"] = None
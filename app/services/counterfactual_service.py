@@ -0,0 +1,237 @@
+# ==============================================================================
+# Servicio de Ruta al Siguiente Nivel (contrafactuales)
+# Busca el conjunto de mejoras de respuestas más pequeño que hace que el
+# modelo prediga el siguiente nivel de ORDEN_NIVELES. Es una búsqueda en haz
+# (beam search): en cada paso se agrega una pregunta más al conjunto de
+# cambios, se evalúan todos los candidatos del paso con predict_proba en
+# bloques de miles de filas y se conservan los más prometedores.
+#
+# Solo se sugieren valores válidos de la escala de cada pregunta (Si/No,
+# Q6 de 4 niveles, Q18 de 3 niveles, resto de 1 a 7) y nunca se empeora una
+# respuesta. El costo de un cambio es lo que sube en la escala normalizada.
+# ==============================================================================
+
+from __future__ import annotations
+
+import time
+from typing import Any, Dict
+
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+pd = importar_perezoso("pandas")
+from sqlalchemy.orm import Session
+
+from app.core.cache import LRUCache
+from app.ml.loader import get_modelo_activo
+from app.models.diagnosis import Respuesta
+from app.services import diagnosis_service
+
+_PREGUNTAS = [f"Q{i}" for i in range(1, 21)]
+# Filas por llamada a predict_proba: acota la memoria y permite revisar el tiempo entre bloques
+_BLOQUE = 4096
+
+_cache_rutas = LRUCache(maxsize=256)
+# Hasta dónde llega la búsqueda con este límite depende de la carga del servidor
+MOTIVO_TIEMPO = "presupuesto de tiempo agotado"
+
+
+# ==============================================================================
+# ESCALAS
+# ==============================================================================
+def _escala(id_pregunta: int) -> Dict[int, Any]:
+    """Valor normalizado -> respuesta cruda, para los valores válidos de la pregunta."""
+    if id_pregunta in diagnosis_service.PREGUNTAS_SI_NO:
+        return {v: k for k, v in diagnosis_service.MAPA_SI_NO.items()}
+    if id_pregunta == 6:
+        return {v: k for k, v in diagnosis_service.MAPA_Q6.items()}
+    if id_pregunta == 18:
+        return {v: k for k, v in diagnosis_service.MAPA_Q18.items()}
+    return {v: v for v in range(1, 8)}
+
+def _movimientos():
+    """Todos los (pregunta, valor) posibles como arreglos paralelos (índice de columna 0..19)."""
+    preguntas, valores = [], []
+    for q in range(1, 21):
+        for valor in sorted(_escala(q)):
+            preguntas.append(q - 1)
+            valores.append(float(valor))
+    return np.array(preguntas), np.array(valores)
+
+
+# ==============================================================================
+# BÚSQUEDA
+# ==============================================================================
+def buscar_siguiente_nivel(fila: np.ndarray, max_cambios: int = 5, ancho_haz: int = 64,
+                           max_evaluaciones: int = 50000, tiempo_max_s: float = 1.5) -> Dict[str, Any]:
+    """
+    `fila` son las 20 respuestas normalizadas (NaN = sin respuesta válida).
+    Devuelve el nivel actual y el objetivo, y los cambios del conjunto más
+    barato encontrado: primero el que cambia menos preguntas y, entre esos,
+    el que menos sube en total. Si se agota un presupuesto (evaluaciones o
+    tiempo) antes de llegar, devuelve la mejor aproximación con alcanzado=False.
+    Si el tiempo se agota a mitad de un paso y aun así se llega, motivo_fin
+    queda en MOTIVO_TIEMPO: quizá había un conjunto más barato sin evaluar.
+    """
+    inicio = time.perf_counter()
+    activo = get_modelo_activo()
+    orden = diagnosis_service.ORDEN_NIVELES
+    # Posición en ORDEN_NIVELES de cada columna de predict_proba
+    orden_clase = np.array([orden.index(c) if c in orden else -1 for c in activo.label_encoder.classes_])
+
+    evaluaciones = 0
+    def evaluar(matriz: np.ndarray):
+        nonlocal evaluaciones
+        evaluaciones += len(matriz)
+        proba = activo.model.predict_proba(pd.DataFrame(matriz, columns=_PREGUNTAS))
+        return orden_clase[proba.argmax(axis=1)], proba
+
+    fila = np.asarray(fila, dtype=float).reshape(1, 20)
+    nivel_actual, proba = evaluar(fila)
+    nivel_actual = int(nivel_actual[0])
+    resultado = {
+        "nivel_actual": orden[nivel_actual] if nivel_actual >= 0 else None,
+        "nivel_objetivo": None,
+        "alcanzado": False,
+        "probabilidad_objetivo": None,
+        "cambios": [],
+        "costo": 0.0,
+        "motivo_fin": None,
+    }
+    if nivel_actual < 0 or nivel_actual == len(orden) - 1:
+        resultado["motivo_fin"] = "ya está en el nivel más alto"
+        return _cerrar(resultado, evaluaciones, inicio)
+
+    objetivo = nivel_actual + 1
+    columnas_objetivo = orden_clase >= objetivo
+    resultado["nivel_objetivo"] = orden[objetivo]
+
+    mov_preguntas, mov_valores = _movimientos()
+    # Una respuesta inválida (NaN) cuenta como el valor más bajo para el costo
+    base = np.nan_to_num(fila[0], nan=1.0)
+    haz = fila.copy()                             # (k, 20) candidatos conservados
+    haz_costo = np.zeros(1)
+    haz_cambiadas = np.zeros((1, 20), dtype=bool)
+    mejor = None                                   # (probabilidad, vector, costo) de la mejor aproximación
+
+    for _ in range(max_cambios):
+        # --- Expansión: cada candidato del haz + una pregunta más mejorada ---
+        actuales = np.nan_to_num(haz, nan=0.0)[:, mov_preguntas]
+        validos = (mov_valores > actuales) & ~haz_cambiadas[:, mov_preguntas]
+        padre, movimiento = np.nonzero(validos)
+        if len(padre) == 0:
+            resultado["motivo_fin"] = "no quedan respuestas por mejorar"
+            break
+        q, valor = mov_preguntas[movimiento], mov_valores[movimiento]
+        hijos = haz[padre].copy()
+        hijos[np.arange(len(padre)), q] = valor
+        # Cada pregunta cambia a lo sumo una vez, así que en el padre aún tiene su valor original
+        costo = haz_costo[padre] + valor - base[q]
+        cambiadas = haz_cambiadas[padre].copy()
+        cambiadas[np.arange(len(padre)), q] = True
+
+        # El mismo vector se alcanza en distinto orden: se deja el más barato
+        orden_costo = np.argsort(costo, kind="stable")
+        _, unicos = np.unique(np.nan_to_num(hijos[orden_costo], nan=-1.0), axis=0, return_index=True)
+        seleccion = orden_costo[np.sort(unicos)]
+
+        restante = max_evaluaciones - evaluaciones
+        if restante <= 0:
+            resultado["motivo_fin"] = "presupuesto de evaluaciones agotado"
+            break
+        if len(seleccion) > restante:
+            seleccion = seleccion[np.argsort(costo[seleccion], kind="stable")[:restante]]
+            resultado["motivo_fin"] = "presupuesto de evaluaciones agotado"
+        hijos, costo, cambiadas = hijos[seleccion], costo[seleccion], cambiadas[seleccion]
+
+        # --- Evaluación vectorizada por bloques, con presupuesto de tiempo ---
+        niveles, probabilidades = [], []
+        for desde in range(0, len(hijos), _BLOQUE):
+            nivel, proba = evaluar(hijos[desde:desde + _BLOQUE])
+            niveles.append(nivel)
+            probabilidades.append(proba[:, columnas_objetivo].sum(axis=1))
+            if time.perf_counter() - inicio > tiempo_max_s:
+                resultado["motivo_fin"] = MOTIVO_TIEMPO
+                break
+        evaluados = sum(len(n) for n in niveles)
+        hijos, costo, cambiadas = hijos[:evaluados], costo[:evaluados], cambiadas[:evaluados]
+        niveles, probabilidades = np.concatenate(niveles), np.concatenate(probabilidades)
+
+        alcanzan = np.nonzero(niveles >= objetivo)[0]
+        if len(alcanzan):
+            # Menor costo; a igual costo, el que llega con más probabilidad
+            elegido = alcanzan[np.lexsort((-probabilidades[alcanzan], costo[alcanzan]))[0]]
+            motivo = MOTIVO_TIEMPO if resultado["motivo_fin"] == MOTIVO_TIEMPO else None
+            resultado.update(alcanzado=True, motivo_fin=motivo)
+            return _cerrar(_describir(resultado, fila[0], hijos[elegido], costo[elegido], probabilidades[elegido]),
+                           evaluaciones, inicio)
+
+        candidato = int(np.argmax(probabilidades))
+        if mejor is None or probabilidades[candidato] > mejor[0]:
+            mejor = (probabilidades[candidato], hijos[candidato], costo[candidato])
+        if resultado["motivo_fin"]:
+            break
+
+        # --- Poda: se conservan los `ancho_haz` más cercanos al nivel objetivo ---
+        conservar = np.lexsort((costo, -probabilidades))[:ancho_haz]
+        haz, haz_costo, haz_cambiadas = hijos[conservar], costo[conservar], cambiadas[conservar]
+    else:
+        resultado["motivo_fin"] = f"no se alcanza con {max_cambios} cambios o menos"
+
+    if mejor is not None:
+        _describir(resultado, fila[0], mejor[1], mejor[2], mejor[0])
+    return _cerrar(resultado, evaluaciones, inicio)
+
+def _describir(resultado: Dict[str, Any], actual: np.ndarray, propuesta: np.ndarray, costo: float,
+               probabilidad: float) -> Dict[str, Any]:
+    """Traduce el vector propuesto a cambios de respuesta en la escala original de cada pregunta."""
+    cambios = []
+    cambiadas = ~np.isnan(propuesta) & (np.isnan(actual) | (actual != propuesta))
+    for i in np.nonzero(cambiadas)[0]:
+        q = int(i) + 1
+        escala = _escala(q)
+        valor_actual = None if np.isnan(actual[i]) else float(actual[i])
+        cambios.append({
+            "pregunta_id": f"Q{q}",
+            "respuesta_actual": None if valor_actual is None else escala.get(int(valor_actual)),
+            "respuesta_sugerida": escala[int(propuesta[i])],
+            "valor_actual": valor_actual,
+            "valor_sugerido": float(propuesta[i]),
+        })
+    resultado.update(cambios=cambios, costo=round(float(costo), 2),
+                     probabilidad_objetivo=round(float(probabilidad) * 100, 2))
+    return resultado
+
+def _cerrar(resultado: Dict[str, Any], evaluaciones: int, inicio: float) -> Dict[str, Any]:
+    resultado["evaluaciones"] = evaluaciones
+    resultado["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    return resultado
+
+
+# ==============================================================================
+# POR DIAGNÓSTICO
+# ==============================================================================
+def ruta_siguiente_nivel(db: Session, id_diagnostico: int, max_cambios: int = 5) -> Dict[str, Any]:
+    """
+    Ruta al siguiente nivel desde las respuestas guardadas del diagnóstico.
+    Las respuestas no cambian, así que el resultado se cachea por versión del
+    modelo; salvo si lo cortó el límite de tiempo, que depende de la carga del
+    momento y no debe fijar una respuesta peor para toda la versión.
+    """
+    version = get_modelo_activo().version
+    def calcular():
+        fila = np.full(20, np.nan)
+        for id_pregunta, valor in db.query(Respuesta.id_pregunta, Respuesta.valor_normalizado).filter(
+            Respuesta.id_diagnostico == id_diagnostico
+        ):
+            # Un 0 guardado es una respuesta inválida: el modelo la recibió como NaN
+            if valor:
+                fila[id_pregunta - 1] = valor
+        return buscar_siguiente_nivel(fila, max_cambios=max_cambios)
+
+    clave = ("ruta", id_diagnostico, version, max_cambios)
+    resultado = _cache_rutas.get(clave)
+    if resultado is None:
+        resultado = calcular()
+        if resultado["motivo_fin"] != MOTIVO_TIEMPO:
+            _cache_rutas.set(clave, resultado)
+    return {"id_diagnostico": id_diagnostico, "version_modelo": version, **resultado}
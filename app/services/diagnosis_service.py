@@ -4,36 +4,38 @@
 # utilizando modelos de machine learning y análisis SHAP
 # ==============================================================================
 
+from __future__ import annotations
+
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, func, insert, select
 from typing import List, Dict, Any
-import pandas as pd
-import numpy as np
+from app.core.lazy import importar_perezoso
+pd = importar_perezoso("pandas")
+np = importar_perezoso("numpy")
 
 from app.models.diagnosis import Diagnostico, Respuesta, DiagnosticoSHAP
+from app.models.report import ReporteMaterializado
 from app.schemas.diagnosis_schema import RespuestaCreate
-from app.ml.loader import get_model_components
+from app.ml.loader import get_modelo_activo
+from app.services import analytics_service, percentile_service
+from app.services.aggregation_service import MAPA_DOMINIOS, agregar, desglose  # noqa: F401
+
 
-# --- Mapeo de Preguntas a Dominios ---
-MAPA_DOMINIOS = {
-    'Contacto con el Cliente': [f'Q{i}' for i in range(1, 5)],
-    'Operaciones': [f'Q{i}' for i in range(5, 9)],
-    'Modelos de Negocio': [f'Q{i}' for i in range(9, 11)],
-    'Visión': [f'Q{i}' for i in range(11, 13)],
-    'Compromiso (Engagement)': [f'Q{i}' for i in range(13, 16)],
-    'Gobernanza (Gobierno Digital)': [f'Q{i}' for i in range(16, 19)],
-    'Capacidades Tecnológicas (Liderazgo de TI)': [f'Q{i}' for i in range(19, 21)]
-}
+# Niveles de madurez de menor a mayor
+ORDEN_NIVELES = ['Principiante Digital', 'Conservador Digital', 'Fashionista', 'Maestro Digital']
+
+# --- Codificación de las respuestas (escala normalizada 1 a 7) ---
+PREGUNTAS_SI_NO = [1, 3, 7, 10, 13, 15, 17]
+MAPA_SI_NO = {'No': 1, 'Si': 7}
+MAPA_Q6 = {1: 1, 2: 3, 3: 5, 4: 7}
+MAPA_Q18 = {1: 1, 2: 4, 3: 7}
 
 
 # --- Funciones Helper Privadas ---
 
 def _normalize_row(respuestas_dict: Dict[str, Any]) -> pd.DataFrame:
     """Normaliza un diccionario de respuestas crudas a una escala numérica en un DataFrame."""
-    map_si_no = {'No': 1, 'Si': 7}
-    map_b2 = {1: 1, 2: 3, 3: 5, 4: 7}
-    map_f3 = {1: 1, 2: 4, 3: 7}
-    
     fila_normalizada = {}
     for pregunta_id in range(1, 21):
         pregunta_key = f'Q{pregunta_id}'
@@ -46,12 +48,12 @@ def _normalize_row(respuestas_dict: Dict[str, Any]) -> pd.DataFrame:
             respuesta_int = None
 
         try:
-            if pregunta_id in [1, 3, 7, 10, 13, 15, 17]:
-                valor_normalizado = map_si_no.get(str(respuesta).strip())
+            if pregunta_id in PREGUNTAS_SI_NO:
+                valor_normalizado = MAPA_SI_NO.get(str(respuesta).strip())
             elif pregunta_id == 6 and respuesta_int is not None:
-                valor_normalizado = map_b2.get(respuesta_int)
+                valor_normalizado = MAPA_Q6.get(respuesta_int)
             elif pregunta_id == 18 and respuesta_int is not None:
-                valor_normalizado = map_f3.get(respuesta_int)
+                valor_normalizado = MAPA_Q18.get(respuesta_int)
             elif respuesta_int is not None:
                 valor_normalizado = respuesta_int
         except Exception:
@@ -61,106 +63,157 @@ def _normalize_row(respuestas_dict: Dict[str, Any]) -> pd.DataFrame:
         
     return pd.DataFrame([fila_normalizada])
 
-def _calculate_domain_scores(fila_normalizada_df: pd.DataFrame) -> Dict[str, float]:
-    """Calcula el puntaje promedio para cada uno de los 7 dominios."""
-    puntajes_dominios = {}
-    for dominio, preguntas in MAPA_DOMINIOS.items():
-        puntaje = fila_normalizada_df[preguntas].mean(axis=1).iloc[0]
-        puntajes_dominios[dominio] = round(puntaje, 2)
-    return puntajes_dominios
+def normalizar_respuesta(pregunta_id: int, respuesta: Any) -> int:
+    """
+    Versión estricta de la codificación de _normalize_row para una respuesta:
+    devuelve el valor normalizado (1 a 7) o lanza ValueError con el motivo.
+    """
+    texto = "" if respuesta is None else str(respuesta).strip()
+    if not texto:
+        raise ValueError(f"Q{pregunta_id}: sin respuesta")
+    if pregunta_id in PREGUNTAS_SI_NO:
+        if texto not in MAPA_SI_NO:
+            raise ValueError(f"Q{pregunta_id}: se esperaba 'Si' o 'No' y se recibió '{texto}'")
+        return MAPA_SI_NO[texto]
+    try:
+        valor = int(texto)
+    except ValueError:
+        raise ValueError(f"Q{pregunta_id}: se esperaba un número entero y se recibió '{texto}'")
+    escala = MAPA_Q6 if pregunta_id == 6 else MAPA_Q18 if pregunta_id == 18 else {v: v for v in range(1, 8)}
+    if valor not in escala:
+        raise ValueError(f"Q{pregunta_id}: {valor} está fuera de la escala (1 a {max(escala)})")
+    return escala[valor]
 
 
 # --- Servicios Públicos ---
 
 def process_diagnosis(respuestas_crudas_dict: Dict[str, Any] = None, fila_normalizada_df: pd.DataFrame = None) -> Dict[str, Any]:
-    
-    model, label_encoder, explainer = get_model_components()
-    if not all([model, label_encoder, explainer]):
-        raise RuntimeError("Los componentes de ML no están disponibles.")
-
+    """
+    Analiza un diagnóstico: process_diagnosis_batch con una sola fila.
+    Recibe las respuestas crudas o, si ya se tiene, la fila normalizada.
+    """
     # Si NO nos pasan el dataframe ya normalizado, lo calculamos (comportamiento normal)
     if fila_normalizada_df is None:
         fila_normalizada_df = _normalize_row(respuestas_crudas_dict)
+    return process_diagnosis_batch(fila_normalizada_df)[0]
 
-    # --- Predicción y Potencial ---
-    prediccion_encoded = model.predict(fila_normalizada_df)[0]
-    prediccion_probabilidades = model.predict_proba(fila_normalizada_df)[0]
-    nivel_predicho = label_encoder.inverse_transform([prediccion_encoded])[0]
+def process_diagnosis_batch(filas_normalizadas_df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Recibe N filas ya normalizadas (columnas Q1..Q20) y ejecuta el modelo y
+    SHAP una sola vez para todas. Devuelve, por fila, el nivel predicho, el
+    potencial de avance, los puntajes por dominio y capacidad, los valores
+    SHAP de "Maestro Digital" y las 3 debilidades con mayor impacto negativo.
+    """
+    # Se toma la versión activa una sola vez: si cambia durante la solicitud, esta termina con la anterior
+    activo = get_modelo_activo()
+    model, label_encoder, explainer = activo.model, activo.label_encoder, activo.explainer
+    if not all([model, label_encoder, explainer]):
+        raise RuntimeError("Los componentes de ML no están disponibles.")
 
-    orden_niveles = ['Principiante Digital', 'Conservador Digital', 'Fashionista', 'Maestro Digital']
-    potencial_avance = 0.0
-    try:
-        idx_actual = orden_niveles.index(nivel_predicho)
-        if idx_actual < len(orden_niveles) - 1:
-            siguiente_nivel = orden_niveles[idx_actual + 1]
-            idx_siguiente = np.where(label_encoder.classes_ == siguiente_nivel)[0][0]
-            potencial_avance = prediccion_probabilidades[idx_siguiente]
-    except (ValueError, IndexError):
-        pass
-
-    # =========================================================================
-    # LÓGICA DE SHAP UNIFICADA Y CORREGIDA
-    # =========================================================================
-    
-    shap_explanation_obj = explainer(fila_normalizada_df)
+    if filas_normalizadas_df.empty:
+        return []
 
-    try:
-        # Usamos los SHAP de "Maestro Digital" como la ÚNICA fuente de verdad para el análisis
-        clase_objetivo_idx = np.where(label_encoder.classes_ == 'Maestro Digital')[0][0]
-    except IndexError:
-        clase_objetivo_idx = -1
-
-    shap_values_analisis = shap_explanation_obj.values[:, :, clase_objetivo_idx].flatten()
-
-    # Este DataFrame ahora es nuestra única fuente para SHAP
-    df_shap_analisis = pd.DataFrame({
-        'pregunta_id': [f'Q{i}' for i in range(1, 21)],
-        'shap_value': shap_values_analisis
-    })
-    
-    # Identificamos las debilidades (drivers) desde esta única fuente
-    debilidades = df_shap_analisis[df_shap_analisis['shap_value'] < 0].copy().sort_values('shap_value', ascending=True).head(3)
-    
-    if not debilidades.empty:
-        total_impacto_negativo = abs(debilidades['shap_value']).sum()
-        if total_impacto_negativo > 0:
-            debilidades['peso_impacto'] = (abs(debilidades['shap_value']) / total_impacto_negativo) * 100
-        else:
-            debilidades['peso_impacto'] = 0
-    else:
-        debilidades['peso_impacto'] = 0
-
-    # --- Resto de la función ---
-    desglose_dominios = _calculate_domain_scores(fila_normalizada_df)
-    puntaje_cap_digital = fila_normalizada_df.loc[:, 'Q1':'Q10'].mean(axis=1).iloc[0]
-    puntaje_cap_liderazgo = fila_normalizada_df.loc[:, 'Q11':'Q20'].mean(axis=1).iloc[0]
-
-    return {
-        "nivel_madurez_predicho": nivel_predicho,
-        "potencial_avance": round(potencial_avance * 100, 2),
-        "puntaje_cap_digital": round(puntaje_cap_digital, 2),
-        "puntaje_cap_liderazgo": round(puntaje_cap_liderazgo, 2),
-        "areas_mejora_prioritarias": debilidades.to_dict('records'),
-        "desglose_dominios": desglose_dominios,
-        # Devolvemos los mismos valores SHAP que usamos para el análisis
-        "shap_values": df_shap_analisis.to_dict('records')
-    }
+    predicciones_encoded = model.predict(filas_normalizadas_df)
+    probabilidades = model.predict_proba(filas_normalizadas_df)
+    niveles_predichos = label_encoder.inverse_transform(predicciones_encoded)
 
-def create_and_process_diagnosis(db: Session, user_id: int, respuestas_schema: List[RespuestaCreate]) -> Diagnostico:
+    idx_clase = {nivel: i for i, nivel in enumerate(label_encoder.classes_)}
+
+    shap_values = explainer(filas_normalizadas_df).values
+    clase_objetivo_idx = idx_clase.get('Maestro Digital', -1)
+    shap_analisis = shap_values[:, :, clase_objetivo_idx]
+
+    preguntas = [f'Q{i}' for i in range(1, 21)]
+    puntajes = agregar(filas_normalizadas_df)
+
+    resultados = []
+    for fila, nivel_predicho in enumerate(niveles_predichos):
+        potencial_avance = 0.0
+        if nivel_predicho in ORDEN_NIVELES:
+            idx_actual = ORDEN_NIVELES.index(nivel_predicho)
+            if idx_actual < len(ORDEN_NIVELES) - 1:
+                siguiente_idx = idx_clase.get(ORDEN_NIVELES[idx_actual + 1])
+                if siguiente_idx is not None:
+                    potencial_avance = probabilidades[fila, siguiente_idx]
+
+        valores = shap_analisis[fila]
+        # Debilidades (drivers): las 3 contribuciones negativas más fuertes
+        negativos = [i for i in np.argsort(valores, kind='stable') if valores[i] < 0][:3]
+        total_impacto_negativo = float(np.abs(valores[negativos]).sum()) if negativos else 0.0
+        debilidades = [{
+            'pregunta_id': preguntas[i],
+            'shap_value': valores[i],
+            'peso_impacto': (abs(valores[i]) / total_impacto_negativo) * 100 if total_impacto_negativo > 0 else 0,
+        } for i in negativos]
+
+        resultados.append({
+            "nivel_madurez_predicho": nivel_predicho,
+            "potencial_avance": round(potencial_avance * 100, 2),
+            "puntaje_cap_digital": puntajes[fila, -2],
+            "puntaje_cap_liderazgo": puntajes[fila, -1],
+            "areas_mejora_prioritarias": debilidades,
+            "desglose_dominios": desglose(puntajes[fila]),
+            "shap_values": [{'pregunta_id': q, 'shap_value': valores[i]} for i, q in enumerate(preguntas)],
+            "version_modelo": activo.version,
+        })
+    return resultados
+
+def _eliminar_diagnosticos(db: Session, ids_a_eliminar: List[int]):
+    """Elimina diagnósticos junto con sus datos derivados (reportes, analítica y percentiles)."""
+    if not ids_a_eliminar:
+        return
+    puntajes_eliminados = percentile_service.puntajes_de_diagnosticos(db, ids_a_eliminar)
+    analytics_service.descontar_diagnosticos(db, ids_a_eliminar)
+    db.query(ReporteMaterializado).filter(
+        ReporteMaterializado.id_diagnostico.in_(ids_a_eliminar)
+    ).delete(synchronize_session=False)
+    db.query(Diagnostico).filter(Diagnostico.id_diagnostico.in_(ids_a_eliminar)).delete(synchronize_session=False)
+    with percentile_service.escritura():
+        db.commit()
+        percentile_service.descontar(puntajes_eliminados)
+
+def _podar_historial(db: Session, user_id: int, conservar: int) -> List[int]:
     """
-    Servicio principal que guarda, procesa y limpia el historial de diagnósticos.
+    Elimina los diagnósticos más antiguos del usuario dejando solo los
+    `conservar` más recientes, junto con los datos derivados de ellos.
+    Devuelve los ids eliminados.
     """
-    # Lógica de limpieza del historial
     diagnosticos_existentes = db.query(Diagnostico.id_diagnostico).filter(
         Diagnostico.id_usuario == user_id
     ).order_by(
         Diagnostico.fecha_diagnostico.desc()
-    ).offset(2).all()
+    ).offset(conservar).all()
 
-    if diagnosticos_existentes:
-        ids_a_eliminar = [d.id_diagnostico for d in diagnosticos_existentes]
-        db.query(Diagnostico).filter(Diagnostico.id_diagnostico.in_(ids_a_eliminar)).delete(synchronize_session=False)
-        db.commit()
+    ids_a_eliminar = [d.id_diagnostico for d in diagnosticos_existentes]
+    _eliminar_diagnosticos(db, ids_a_eliminar)
+    return ids_a_eliminar
+
+def podar_historiales(db: Session, user_ids: List[int], conservar: int = 3) -> List[int]:
+    """
+    Igual que _podar_historial pero para muchos usuarios con una sola consulta
+    (ROW_NUMBER por usuario). Se usa en las cargas masivas.
+    """
+    if not user_ids:
+        return []
+    orden = func.row_number().over(
+        partition_by=Diagnostico.id_usuario,
+        order_by=(Diagnostico.fecha_diagnostico.desc(), Diagnostico.id_diagnostico.desc())
+    ).label("orden")
+    numerados = db.query(Diagnostico.id_diagnostico, orden).filter(
+        Diagnostico.id_usuario.in_(set(user_ids))
+    ).subquery()
+    ids_a_eliminar = [fila.id_diagnostico for fila in db.query(numerados.c.id_diagnostico).filter(
+        numerados.c.orden > conservar
+    )]
+    _eliminar_diagnosticos(db, ids_a_eliminar)
+    return ids_a_eliminar
+
+def create_and_process_diagnosis(db: Session, user_id: int, respuestas_schema: List[RespuestaCreate]) -> Diagnostico:
+    """
+    Servicio principal que guarda, procesa y limpia el historial de diagnósticos.
+    """
+    # Lógica de limpieza del historial
+    _podar_historial(db, user_id, conservar=2)
 
     # 1. Preparar los datos y normalizarlos UNA SOLA VEZ
     respuestas_dict = {f"Q{i}": None for i in range(1, 21)}
@@ -177,21 +230,22 @@ def create_and_process_diagnosis(db: Session, user_id: int, respuestas_schema: L
     db.add(db_diagnostico)
     db.flush() 
     
-    # 3. Guardar las respuestas crudas JUNTO con su valor normalizado
+    # 3. Guardar las respuestas crudas JUNTO con su valor normalizado (un solo INSERT)
+    filas_respuestas = []
     for resp in respuestas_schema:
         # Buscamos el valor normalizado que ya calculamos
         valor_norm = valores_normalizados_dict.get(f'Q{resp.id_pregunta}')
-        
+
         # SQLAlchemy maneja NaN como NULL, lo convertimos a un entero seguro (ej. 0) si falla.
         valor_norm_int = int(valor_norm) if pd.notna(valor_norm) else 0
 
-        db_respuesta = Respuesta(
-            id_diagnostico=db_diagnostico.id_diagnostico, 
-            id_pregunta=resp.id_pregunta, 
-            valor_respuesta_cruda=str(resp.valor_respuesta_cruda), 
-            valor_normalizado=valor_norm_int # <-- Usamos el valor real
-        )
-        db.add(db_respuesta)
+        filas_respuestas.append({
+            "id_diagnostico": db_diagnostico.id_diagnostico,
+            "id_pregunta": resp.id_pregunta,
+            "valor_respuesta_cruda": str(resp.valor_respuesta_cruda),
+            "valor_normalizado": valor_norm_int,  # <-- Usamos el valor real
+        })
+    db.execute(insert(Respuesta), filas_respuestas)
 
     # 4. Llamar a la lógica de ML (le pasamos el diccionario original, ya que internamente normaliza)
     analisis = process_diagnosis(respuestas_dict)
@@ -200,19 +254,23 @@ def create_and_process_diagnosis(db: Session, user_id: int, respuestas_schema: L
     db_diagnostico.nivel_madurez_predicho = analisis["nivel_madurez_predicho"]
     db_diagnostico.puntaje_cap_digital = analisis["puntaje_cap_digital"]
     db_diagnostico.puntaje_cap_liderazgo = analisis["puntaje_cap_liderazgo"]
+    db_diagnostico.version_modelo = analisis["version_modelo"]
 
-    # 6. Guardar los resultados de SHAP
+    # 6. Guardar los resultados de SHAP (un solo INSERT)
     debilidades_ids = {d["pregunta_id"] for d in analisis["areas_mejora_prioritarias"]}
-    for shap_data in analisis["shap_values"]:
-        db_shap = DiagnosticoSHAP(
-            id_diagnostico=db_diagnostico.id_diagnostico,
-            id_pregunta=int(shap_data["pregunta_id"][1:]),
-            valor_shap=shap_data["shap_value"],
-            es_driver_clave=(shap_data["pregunta_id"] in debilidades_ids)
-        )
-        db.add(db_shap)
-
-    db.commit()
+    db.execute(insert(DiagnosticoSHAP), [{
+        "id_diagnostico": db_diagnostico.id_diagnostico,
+        "id_pregunta": int(shap_data["pregunta_id"][1:]),
+        "valor_shap": float(shap_data["shap_value"]),
+        "es_driver_clave": shap_data["pregunta_id"] in debilidades_ids,
+    } for shap_data in analisis["shap_values"]])
+
+    # 7. Sumar el diagnóstico a los resúmenes de analítica (misma transacción)
+    analytics_service.registrar_diagnosticos(db, [db_diagnostico.id_diagnostico])
+
+    with percentile_service.escritura():
+        db.commit()
+        percentile_service.registrar(percentile_service.puntajes_de_analisis(analisis))
     db.refresh(db_diagnostico)
     
     return db_diagnostico
@@ -226,4 +284,14 @@ def get_user_diagnoses(db: Session, user_id: int) -> List[Diagnostico]:
         Diagnostico.id_usuario == user_id
     ).order_by(
         desc(Diagnostico.fecha_diagnostico)
-    ).limit(3).all()
\ No newline at end of file
+    ).limit(3).all()
+
+async def get_user_diagnoses_async(db: AsyncSession, user_id: int) -> List[Diagnostico]:
+    """Versión asíncrona de get_user_diagnoses."""
+    return (await db.execute(
+        select(Diagnostico).where(
+            Diagnostico.id_usuario == user_id
+        ).order_by(
+            desc(Diagnostico.fecha_diagnostico)
+        ).limit(3)
+    )).scalars().all()
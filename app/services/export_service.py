@@ -0,0 +1,169 @@
+# ==============================================================================
+# Servicio de Exportación de Diagnósticos
+# Vuelca Diagnosticos + Respuestas + Diagnostico_SHAP a CSV o Parquet con una
+# fila por diagnóstico. Lee con un cursor del lado del servidor (yield_per) y
+# pivota por bloques, así que la memoria no depende del tamaño de las tablas.
+# ==============================================================================
+
+from __future__ import annotations
+
+import datetime
+import io
+from typing import Iterator, List, Optional
+
+from app.core.lazy import importar_perezoso
+pd = importar_perezoso("pandas")
+from sqlalchemy import and_, select
+
+from app.db.database import SessionLocal
+from app.models.diagnosis import Diagnostico, DiagnosticoSHAP, Respuesta
+
+FORMATOS = ("csv", "parquet")
+
+_CABECERA = ["id_diagnostico", "id_usuario", "fecha_diagnostico", "nivel_madurez_predicho",
+             "puntaje_cap_digital", "puntaje_cap_liderazgo"]
+# Por pregunta: respuesta cruda, valor normalizado (0 = respuesta inválida),
+# valor SHAP de la clase "Maestro Digital" y si fue driver clave
+_SUFIJOS = {"cruda": "cruda", "normalizado": "norm", "shap": "shap", "driver": "driver"}
+COLUMNAS = _CABECERA + [f"Q{q}_{s}" for s in _SUFIJOS.values() for q in range(1, 21)]
+
+
+class ParquetNoDisponible(RuntimeError):
+    """pyarrow no se pudo importar (está en requirements.txt, pero se importa recién al exportar)."""
+
+
+def _consulta(desde: Optional[datetime.date], hasta: Optional[datetime.date]):
+    consulta = select(
+        Diagnostico.id_diagnostico, Diagnostico.id_usuario, Diagnostico.fecha_diagnostico,
+        Diagnostico.nivel_madurez_predicho, Diagnostico.puntaje_cap_digital, Diagnostico.puntaje_cap_liderazgo,
+        Respuesta.id_pregunta, Respuesta.valor_respuesta_cruda.label("cruda"),
+        Respuesta.valor_normalizado.label("normalizado"),
+        DiagnosticoSHAP.valor_shap.label("shap"), DiagnosticoSHAP.es_driver_clave.label("driver"),
+    ).join(
+        Respuesta, Respuesta.id_diagnostico == Diagnostico.id_diagnostico
+    ).outerjoin(
+        DiagnosticoSHAP, and_(
+            DiagnosticoSHAP.id_diagnostico == Diagnostico.id_diagnostico,
+            DiagnosticoSHAP.id_pregunta == Respuesta.id_pregunta
+        )
+    ).order_by(Diagnostico.id_diagnostico, Respuesta.id_pregunta)
+    if desde:
+        consulta = consulta.where(Diagnostico.fecha_diagnostico >= desde)
+    if hasta:
+        consulta = consulta.where(Diagnostico.fecha_diagnostico < hasta + datetime.timedelta(days=1))
+    return consulta
+
+def _pivotar(filas: List[tuple]) -> pd.DataFrame:
+    """Convierte filas (diagnóstico, pregunta) en una fila ancha por diagnóstico."""
+    df = pd.DataFrame(filas, columns=_CABECERA + ["id_pregunta"] + list(_SUFIJOS))
+    cabecera = df.groupby("id_diagnostico", sort=False)[_CABECERA[1:]].first()
+
+    ancho = df.set_index(["id_diagnostico", "id_pregunta"])[list(_SUFIJOS)].unstack("id_pregunta")
+    ancho.columns = [f"Q{q}_{_SUFIJOS[valor]}" for valor, q in ancho.columns]
+
+    resultado = cabecera.join(ancho).reset_index().reindex(columns=COLUMNAS)
+    for columna in ["puntaje_cap_digital", "puntaje_cap_liderazgo"] + [c for c in COLUMNAS if c.endswith("_shap")]:
+        resultado[columna] = resultado[columna].astype(float)
+    for columna in [c for c in COLUMNAS if c.endswith(("_norm", "_driver"))]:
+        resultado[columna] = resultado[columna].astype("Int64")
+    return resultado
+
+def iterar_bloques(desde: Optional[datetime.date] = None, hasta: Optional[datetime.date] = None,
+                   lote: int = 1000) -> Iterator[pd.DataFrame]:
+    """
+    Genera DataFrames de hasta `lote` diagnósticos (una fila por diagnóstico).
+    Abre su propia sesión porque se consume después de que el endpoint retorna.
+    """
+    db = SessionLocal()
+    try:
+        resultado = db.execute(
+            _consulta(desde, hasta).execution_options(stream_results=True, yield_per=lote * 20)
+        )
+        pendientes: List[tuple] = []
+        for particion in resultado.partitions():
+            pendientes.extend(particion)
+            # El último diagnóstico puede seguir en la siguiente partición: se guarda para después
+            ultimo = pendientes[-1][0]
+            corte = len(pendientes)
+            while corte > 0 and pendientes[corte - 1][0] == ultimo:
+                corte -= 1
+            if corte:
+                yield _pivotar(pendientes[:corte])
+                pendientes = pendientes[corte:]
+        if pendientes:
+            yield _pivotar(pendientes)
+    finally:
+        db.close()
+
+
+# ==============================================================================
+# FORMATOS DE SALIDA
+# ==============================================================================
+def _csv(bloques: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    yield (",".join(COLUMNAS) + "\n").encode("utf-8")
+    for bloque in bloques:
+        yield bloque.to_csv(index=False, header=False, date_format="%Y-%m-%dT%H:%M:%S").encode("utf-8")
+
+class _Sumidero(io.RawIOBase):
+    """Archivo de solo escritura que acumula bytes hasta que se recogen."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+        self._posicion = 0
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def recoger(self) -> bytes:
+        datos, self._partes = b"".join(self._partes), []
+        return datos
+
+def _parquet(bloques: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ParquetNoDisponible("La exportación a Parquet requiere pyarrow (pip install pyarrow).")
+
+    sumidero = _Sumidero()
+    escritor = None
+    for bloque in bloques:
+        tabla = pa.Table.from_pandas(bloque, preserve_index=False)
+        if escritor is None:
+            escritor = pq.ParquetWriter(sumidero, tabla.schema)
+        # Cada bloque es un row group; sus bytes se envían en cuanto se escriben
+        escritor.write_table(tabla.cast(escritor.schema))
+        yield sumidero.recoger()
+    if escritor is None:
+        # Sin diagnósticos: archivo válido con el esquema y cero filas
+        escritor = pq.ParquetWriter(sumidero, pa.Table.from_pandas(_pivotar([]), preserve_index=False).schema)
+    escritor.close()
+    yield sumidero.recoger()
+
+def exportar(formato: str = "csv", desde: Optional[datetime.date] = None, hasta: Optional[datetime.date] = None,
+             lote: int = 1000) -> Iterator[bytes]:
+    """
+    Generador de bytes del archivo de exportación. Para Parquet verifica que
+    pyarrow esté instalado antes de empezar a emitir (ParquetNoDisponible).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato no soportado: {formato}")
+    bloques = iterar_bloques(desde=desde, hasta=hasta, lote=lote)
+    if formato == "csv":
+        return _csv(bloques)
+    generador = _parquet(bloques)
+    primero = next(generador, b"")  # dispara la importación de pyarrow ahora y no a mitad de la respuesta
+    return _encadenar(primero, generador)
+
+def _encadenar(primero: bytes, resto: Iterator[bytes]) -> Iterator[bytes]:
+    yield primero
+    yield from resto
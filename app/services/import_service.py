@@ -0,0 +1,204 @@
+# ==============================================================================
+# Servicio de Importación de Diagnósticos
+# Carga cuestionarios levantados en papel u hojas de cálculo desde un CSV con
+# una fila por empresa (ruc, Q1..Q20 y opcionalmente fecha). Lee el archivo
+# como flujo, valida cada respuesta con las mismas escalas de _normalize_row,
+# puntúa por lotes de tamaño fijo y guarda cada lote en su propia transacción.
+# ==============================================================================
+
+from __future__ import annotations
+
+import csv
+import datetime
+import io
+import time
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+pd = importar_perezoso("pandas")
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.diagnosis import Diagnostico, DiagnosticoSHAP, Respuesta
+from app.models.user import Usuario
+from app.services import analytics_service, diagnosis_service, percentile_service
+
+PREGUNTAS = [f"Q{i}" for i in range(1, 21)]
+COLUMNAS_OBLIGATORIAS = ["ruc"] + PREGUNTAS
+
+
+class ArchivoInvalido(ValueError):
+    """El archivo no se puede importar (cabecera incompleta, codificación, etc.)."""
+
+
+# ==============================================================================
+# LECTURA Y VALIDACIÓN
+# ==============================================================================
+def _lector(archivo: BinaryIO) -> Tuple[csv.DictReader, Dict[str, str]]:
+    """
+    Abre el CSV como texto (UTF-8 con o sin BOM), detecta si el separador es
+    ',' o ';' (Excel en español usa ';') y mapea la cabecera sin distinguir
+    mayúsculas. Devuelve el lector y el mapa columna normalizada -> original.
+    """
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    try:
+        primera = texto.readline()
+    except UnicodeDecodeError:
+        raise ArchivoInvalido("El archivo debe estar codificado en UTF-8.")
+    if not primera.strip():
+        raise ArchivoInvalido("El archivo está vacío.")
+    separador = ";" if primera.count(";") > primera.count(",") else ","
+    cabecera = next(csv.reader([primera], delimiter=separador))
+
+    columnas = {c.strip().lower(): c for c in cabecera}
+    columnas.update({c.strip().upper(): c for c in cabecera if c.strip().upper() in PREGUNTAS})
+    faltantes = [c for c in COLUMNAS_OBLIGATORIAS if c not in columnas]
+    if faltantes:
+        raise ArchivoInvalido(f"Faltan columnas obligatorias: {', '.join(faltantes)}")
+    return csv.DictReader(texto, fieldnames=cabecera, delimiter=separador), columnas
+
+def _validar_fila(fila: Dict[str, Any], columnas: Dict[str, str]) -> Tuple[Dict[str, Any], List[str]]:
+    """Devuelve los datos normalizados de la fila y la lista de errores encontrados."""
+    errores = []
+    ruc = (fila.get(columnas["ruc"]) or "").strip()
+    if not ruc:
+        errores.append("ruc: vacío")
+
+    normalizadas, crudas = {}, {}
+    for i, pregunta in enumerate(PREGUNTAS, start=1):
+        crudas[pregunta] = (fila.get(columnas[pregunta]) or "").strip()
+        try:
+            normalizadas[pregunta] = diagnosis_service.normalizar_respuesta(i, crudas[pregunta])
+        except ValueError as e:
+            errores.append(str(e))
+
+    fecha = None
+    texto_fecha = (fila.get(columnas["fecha"]) or "").strip() if "fecha" in columnas else ""
+    if texto_fecha:
+        try:
+            fecha = datetime.datetime.fromisoformat(texto_fecha)
+        except ValueError:
+            errores.append(f"fecha: se esperaba AAAA-MM-DD y se recibió '{texto_fecha}'")
+    return {"ruc": ruc, "crudas": crudas, "normalizadas": normalizadas, "fecha": fecha}, errores
+
+def _lotes(lector: csv.DictReader, tamano: int) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    """Agrupa las filas en lotes de `tamano`, con su número de línea (la cabecera es la 1)."""
+    lote = []
+    for numero, fila in enumerate(lector, start=2):
+        lote.append((numero, fila))
+        if len(lote) == tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# ==============================================================================
+# GUARDADO POR LOTES
+# ==============================================================================
+def _guardar_lote(db: Session, filas: List[Dict[str, Any]]) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """
+    Puntúa las filas válidas con una sola llamada al modelo e inserta
+    diagnósticos, respuestas y valores SHAP con inserciones masivas.
+    No hace commit. Devuelve los ids de diagnóstico creados y sus análisis.
+    """
+    normalizadas = pd.DataFrame([f["normalizadas"] for f in filas], columns=PREGUNTAS)
+    analisis = diagnosis_service.process_diagnosis_batch(normalizadas)
+
+    ahora = datetime.datetime.utcnow()
+    ids_diag = db.execute(
+        insert(Diagnostico).returning(Diagnostico.id_diagnostico, sort_by_parameter_order=True),
+        [{
+            "id_usuario": f["id_usuario"],
+            "fecha_diagnostico": f["fecha"] or ahora,
+            "puntaje_cap_digital": float(a["puntaje_cap_digital"]),
+            "puntaje_cap_liderazgo": float(a["puntaje_cap_liderazgo"]),
+            "nivel_madurez_predicho": a["nivel_madurez_predicho"],
+            "version_modelo": a["version_modelo"],
+        } for f, a in zip(filas, analisis)]
+    ).scalars().all()
+
+    filas_resp, filas_shap = [], []
+    for id_diag, f, a in zip(ids_diag, filas, analisis):
+        for i, pregunta in enumerate(PREGUNTAS, start=1):
+            filas_resp.append({
+                "id_diagnostico": id_diag, "id_pregunta": i,
+                "valor_respuesta_cruda": f["crudas"][pregunta],
+                "valor_normalizado": f["normalizadas"][pregunta],
+            })
+        debilidades = {d["pregunta_id"] for d in a["areas_mejora_prioritarias"]}
+        for s in a["shap_values"]:
+            filas_shap.append({
+                "id_diagnostico": id_diag, "id_pregunta": int(s["pregunta_id"][1:]),
+                "valor_shap": float(s["shap_value"]),
+                "es_driver_clave": s["pregunta_id"] in debilidades,
+            })
+    db.execute(insert(Respuesta), filas_resp)
+    db.execute(insert(DiagnosticoSHAP), filas_shap)
+    analytics_service.registrar_diagnosticos(db, ids_diag)
+    return ids_diag, analisis
+
+def importar(db: Session, archivo: BinaryIO, lote: int = 500, conservar: int = 3,
+             log: bool = False) -> Dict[str, Any]:
+    """
+    Importa un CSV de cuestionarios. Cada lote se valida, se puntúa y se guarda
+    en su propia transacción; si el guardado falla, solo ese lote se revierte y
+    sus filas se reportan con el error. Al final de cada lote se poda el
+    historial de las empresas afectadas a los `conservar` más recientes.
+    Devuelve el resumen con el detalle de errores por fila.
+    """
+    inicio = time.perf_counter()
+    lector, columnas = _lector(archivo)
+    total, importadas, errores = 0, 0, []
+
+    for numero_lote, filas in enumerate(_lotes(lector, lote), start=1):
+        total += len(filas)
+        validas: List[Tuple[int, Dict[str, Any]]] = []
+        for numero, fila in filas:
+            datos, errores_fila = _validar_fila(fila, columnas)
+            if errores_fila:
+                errores.append({"fila": numero, "ruc": datos["ruc"], "errores": errores_fila})
+            else:
+                validas.append((numero, datos))
+
+        # Resolución de RUCs en una sola consulta por lote
+        rucs = {datos["ruc"] for _, datos in validas}
+        usuarios = dict(db.query(Usuario.ruc, Usuario.id_usuario).filter(Usuario.ruc.in_(rucs))) if rucs else {}
+        por_guardar = []
+        for numero, datos in validas:
+            if datos["ruc"] not in usuarios:
+                errores.append({"fila": numero, "ruc": datos["ruc"], "errores": ["ruc: no corresponde a ninguna empresa registrada"]})
+                continue
+            datos["id_usuario"] = usuarios[datos["ruc"]]
+            por_guardar.append((numero, datos))
+        if not por_guardar:
+            continue
+
+        try:
+            _, analisis = _guardar_lote(db, [datos for _, datos in por_guardar])
+            puntajes = np.vstack([percentile_service.puntajes_de_analisis(a) for a in analisis])
+            with percentile_service.escritura():
+                db.commit()
+                percentile_service.registrar(puntajes)
+        except Exception as e:
+            db.rollback()
+            print(f"Error al guardar el lote {numero_lote} de la importación: {e}")
+            errores.extend({"fila": numero, "ruc": datos["ruc"], "errores": [f"no se pudo guardar el lote: {e}"]}
+                           for numero, datos in por_guardar)
+            continue
+        importadas += len(por_guardar)
+        ids_usuario = [datos["id_usuario"] for _, datos in por_guardar]
+        podados = diagnosis_service.podar_historiales(db, ids_usuario, conservar=conservar)
+        if log:
+            print(f"  lote {numero_lote}: {total} filas leídas, {importadas} importadas, "
+                  f"{len(podados)} diagnósticos antiguos podados")
+
+    errores.sort(key=lambda e: e["fila"])
+    return {
+        "filas": total,
+        "importadas": importadas,
+        "con_errores": len(errores),
+        "errores": errores,
+        "duracion_s": round(time.perf_counter() - inicio, 2),
+    }
@@ -0,0 +1,185 @@
+# ==============================================================================
+# Servicio de Percentiles entre Pares
+# Mantiene un histograma compartido por cada dominio de MAPA_DOMINIOS y por
+# las capacidades digital y de liderazgo, para responder "en qué percentil
+# estoy" sin recorrer los puntajes de todas las empresas.
+#
+# Si el archivo del histograma no existía (contenedor nuevo, despliegue) o
+# deja de cuadrar con los datos, se reconstruye en un hilo en segundo plano
+# desde los diagnósticos guardados. La reconstrucción retiene el lock del
+# histograma de principio a fin, y quien cambia diagnósticos hace el commit y
+# el registrar/descontar dentro de escritura(), bajo el mismo lock: así cada
+# cambio queda antes de la lectura de la base (y el reemplazo lo incluye una
+# vez) o después del reemplazo, nunca a medias.
+# ==============================================================================
+
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.sketches import HistogramaCompartido
+from app.db.database import SessionLocal
+from app.models.diagnosis import Diagnostico, Respuesta
+from app.services import aggregation_service
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_lock = threading.Lock()
+_histograma = None
+_reconstruccion: Optional[threading.Thread] = None
+
+
+def metricas() -> List[str]:
+    """Orden fijo de las filas del histograma: los 7 dominios y las 2 capacidades."""
+    return list(aggregation_service.METRICAS)
+
+def directorio() -> str:
+    """SKETCH_DIR; si es relativo, respecto de la raíz del proyecto y no del directorio de trabajo."""
+    return os.path.join(_RAIZ, settings.SKETCH_DIR)
+
+def _get_histograma() -> HistogramaCompartido:
+    global _histograma
+    if _histograma is None:
+        with _lock:
+            if _histograma is None:
+                _histograma = HistogramaCompartido(
+                    os.path.join(directorio(), "percentiles_v1.bin"), metricas=len(metricas()),
+                    al_desfasar=_reconstruir_en_segundo_plano
+                )
+    return _histograma
+
+
+# ==============================================================================
+# PUNTAJES POR DIAGNÓSTICO
+# ==============================================================================
+def puntajes_de_analisis(analisis: Dict[str, Any]) -> np.ndarray:
+    """Vector de métricas a partir del resultado de process_diagnosis."""
+    dominios = analisis["desglose_dominios"]
+    valores = [dominios.get(d) for d in aggregation_service.MAPA_DOMINIOS]
+    valores += [analisis["puntaje_cap_digital"], analisis["puntaje_cap_liderazgo"]]
+    return np.array([np.nan if v is None else float(v) for v in valores])
+
+def puntajes_de_diagnosticos(db: Session, ids_diagnostico: List[int]) -> np.ndarray:
+    """
+    Matriz (n, métricas) recalculada desde las respuestas guardadas. Un valor
+    normalizado 0 es una respuesta inválida y se trata como NaN, igual que en
+    process_diagnosis, así que los puntajes coinciden con los del análisis.
+    """
+    if not ids_diagnostico:
+        return np.empty((0, len(metricas())))
+    posicion = {id_diag: i for i, id_diag in enumerate(ids_diagnostico)}
+    matriz = np.full((len(ids_diagnostico), 20), np.nan)
+    for id_diag, id_pregunta, valor in db.query(
+        Respuesta.id_diagnostico, Respuesta.id_pregunta, Respuesta.valor_normalizado
+    ).filter(Respuesta.id_diagnostico.in_(ids_diagnostico)):
+        if valor:
+            matriz[posicion[id_diag], id_pregunta - 1] = valor
+
+    # Los dominios salen de las respuestas; las capacidades, de lo guardado en el diagnóstico
+    dominios = aggregation_service.agregar(matriz)[:, :aggregation_service.N_DOMINIOS]
+
+    capacidades = np.full((len(ids_diagnostico), 2), np.nan)
+    for id_diag, digital, liderazgo in db.query(
+        Diagnostico.id_diagnostico, Diagnostico.puntaje_cap_digital, Diagnostico.puntaje_cap_liderazgo
+    ).filter(Diagnostico.id_diagnostico.in_(ids_diagnostico)):
+        capacidades[posicion[id_diag]] = [float(digital), float(liderazgo)]
+    return np.column_stack([dominios, capacidades])
+
+
+# ==============================================================================
+# MANTENIMIENTO INCREMENTAL
+# Se llama después del commit, dentro de escritura(): si la transacción falla,
+# el histograma no cambia. Un fallo al escribir el histograma (o al tomar su
+# lock) no debe tumbar la solicitud.
+# ==============================================================================
+@contextlib.contextmanager
+def escritura():
+    """Bloque para `db.commit()` seguido de registrar/descontar; excluye a la reconstrucción."""
+    with contextlib.ExitStack() as pila:
+        try:
+            pila.enter_context(_get_histograma().exclusivo())
+        except Exception as e:
+            print(f"No se pudo tomar el lock del histograma de percentiles: {e}")
+        yield
+
+def registrar(puntajes: np.ndarray):
+    try:
+        _get_histograma().agregar(puntajes, signo=+1)
+    except Exception as e:
+        print(f"No se pudo actualizar el histograma de percentiles: {e}")
+
+def descontar(puntajes: np.ndarray):
+    try:
+        _get_histograma().agregar(puntajes, signo=-1)
+    except Exception as e:
+        print(f"No se pudo actualizar el histograma de percentiles: {e}")
+
+def _reconstruir_en_segundo_plano(motivo: str):
+    """Una sola reconstrucción a la vez por worker, sin bloquear la solicitud que la detectó."""
+    global _reconstruccion
+    with _lock:
+        if _reconstruccion is not None and _reconstruccion.is_alive():
+            return
+        print(f"Se reconstruye el histograma de percentiles desde la base de datos ({motivo}).")
+        _reconstruccion = threading.Thread(target=_reconstruir_desde_db, name="digipath-percentiles", daemon=True)
+        _reconstruccion.start()
+
+def _reconstruir_desde_db():
+    db = SessionLocal()
+    try:
+        resumen = reconstruir(db)
+        print(f"Histograma de percentiles reconstruido: {resumen['diagnosticos']} diagnósticos.")
+    except Exception as e:
+        print(f"No se pudo reconstruir el histograma de percentiles: {e}")
+    finally:
+        db.close()
+
+def reconstruir(db: Session, lote: int = 5000, log: bool = False) -> Dict[str, int]:
+    """
+    Recalcula el histograma desde todos los diagnósticos, por lotes de ids.
+    Mientras dura, las solicitudes que guardan o eliminan diagnósticos esperan
+    en escritura(): sus cambios entran completos en la lectura o se suman
+    después del reemplazo.
+    """
+    histograma = _get_histograma()
+    with histograma.exclusivo():
+        conteos = np.zeros((histograma.metricas, histograma.bins), dtype=np.int64)
+        ultimo_id, total = 0, 0
+        while True:
+            ids = [fila.id_diagnostico for fila in db.query(Diagnostico.id_diagnostico).filter(
+                Diagnostico.id_diagnostico > ultimo_id
+            ).order_by(Diagnostico.id_diagnostico).limit(lote)]
+            if not ids:
+                break
+            conteos += histograma.contar(puntajes_de_diagnosticos(db, ids))
+            ultimo_id, total = ids[-1], total + len(ids)
+            if log:
+                print(f"  {total} diagnósticos procesados")
+        histograma.reemplazar(conteos)
+    return {"diagnosticos": total}
+
+
+# ==============================================================================
+# CONSULTA
+# ==============================================================================
+def percentiles(puntajes: Dict[str, Optional[float]]) -> Dict[str, float]:
+    """
+    Posición percentil de cada métrica presente en `puntajes` (nombre de la
+    métrica -> puntaje). Las métricas sin datos se omiten.
+    """
+    nombres = metricas()
+    valores = np.array([np.nan if puntajes.get(m) is None else float(puntajes[m]) for m in nombres])
+    posiciones = _get_histograma().percentiles(valores)
+    return {m: p for m, p in zip(nombres, posiciones) if p is not None}
+
+def estado() -> Dict[str, Any]:
+    histograma = _get_histograma()
+    return {"archivo": histograma.ruta, "observaciones": dict(zip(metricas(), histograma.totales().tolist()))}
@@ -4,16 +4,33 @@
 # factores de impacto y recomendaciones personalizadas
 # ==============================================================================
 
-from sqlalchemy.orm import Session
+from __future__ import annotations
+
+from sqlalchemy import and_, desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
-from typing import List, Dict, Any
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional, Iterable
+import datetime
+import json
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+pd = importar_perezoso("pandas")
 
-from app.models.diagnosis import Diagnostico as DiagnosticoModel, DiagnosticoSHAP
+from app.db.database import SessionLocal
+from app.ml.loader import get_model_version
+from app.models.diagnosis import Diagnostico as DiagnosticoModel, DiagnosticoSHAP, Respuesta
 from app.models.question import Recomendacion
-from app.schemas.report_schema import FactorImpacto
+from app.models.report import ReporteMaterializado
+from app.schemas.report_schema import FactorImpacto, ReporteDiagnostico
+from app.services import analytics_service, percentile_service
+from app.services.aggregation_service import MAPA_DOMINIOS, N_DOMINIOS, agregar
+from app.services.catalog_service import get_catalog_version
 
 # Reutilizamos la lógica de ML del servicio de diagnóstico
-from app.services.diagnosis_service import process_diagnosis 
+from app.services.diagnosis_service import process_diagnosis
 
 def _get_factores_de_impacto(db: Session, db_shap_valores: List[DiagnosticoSHAP], tipo: str, respuestas_dict: dict) -> List[FactorImpacto]:
     """Helper para buscar textos de recomendación y formatear los factores de impacto."""
@@ -22,12 +39,19 @@ def _get_factores_de_impacto(db: Session, db_shap_valores: List[DiagnosticoSHAP]
     total_impacto_abs = sum(abs(s.valor_shap) for s in db_shap_valores)
     if total_impacto_abs == 0: total_impacto_abs = 1
 
-    for shap_val in db_shap_valores:
-        # Buscamos en nuestra "base de conocimiento" la recomendación asociada
-        db_rec = db.query(Recomendacion).filter(
-            Recomendacion.id_pregunta == shap_val.id_pregunta,
+    # Buscamos en nuestra "base de conocimiento" las recomendaciones asociadas, con su
+    # pregunta, en una sola consulta (y no dos por factor)
+    recomendaciones = {}
+    if db_shap_valores:
+        consulta = db.query(Recomendacion).options(joinedload(Recomendacion.pregunta)).filter(
+            Recomendacion.id_pregunta.in_({s.id_pregunta for s in db_shap_valores}),
             Recomendacion.tipo_feedback == tipo
-        ).first()
+        ).order_by(Recomendacion.id_recomendacion)
+        for rec in consulta:
+            recomendaciones.setdefault(rec.id_pregunta, rec)
+
+    for shap_val in db_shap_valores:
+        db_rec = recomendaciones.get(shap_val.id_pregunta)
 
         if db_rec:
             respuesta_dada = respuestas_dict.get(f"Q{shap_val.id_pregunta}", "No registrada")
@@ -66,10 +90,7 @@ def generate_full_report(db: Session, db_diagnostico: DiagnosticoModel) -> Dict[
     areas_mejora = _get_factores_de_impacto(db, debilidades_shap, 'DEBILIDAD', respuestas_crudas_dict)
     fortalezas = _get_factores_de_impacto(db, fortalezas_shap, 'FORTALEZA', respuestas_crudas_dict)
 
-    analisis_ml = process_diagnosis(respuestas_crudas_dict)
-
     # 5. Reutilizar la lógica de ML para calcular métricas no guardadas
-    respuestas_crudas_dict = {f"Q{r.id_pregunta}": r.valor_respuesta_cruda for r in db_diagnostico.respuestas}
     analisis_ml = process_diagnosis(respuestas_crudas_dict)
 
     # 6. Ensamblar el JSON final para el frontend
@@ -77,10 +98,241 @@ def generate_full_report(db: Session, db_diagnostico: DiagnosticoModel) -> Dict[
         "id_diagnostico": db_diagnostico.id_diagnostico,
         "fecha_diagnostico": db_diagnostico.fecha_diagnostico.isoformat(),
         "nivel_madurez_predicho": db_diagnostico.nivel_madurez_predicho,
+        "version_modelo": db_diagnostico.version_modelo,
         "potencial_avance": analisis_ml["potencial_avance"],
         "areas_mejora_prioritarias": areas_mejora,
         "fortalezas_a_mantener": fortalezas,
-        "desglose_dominios": analisis_ml["desglose_dominios"]
+        "desglose_dominios": analisis_ml["desglose_dominios"],
+        "puntaje_cap_digital": float(db_diagnostico.puntaje_cap_digital),
+        "puntaje_cap_liderazgo": float(db_diagnostico.puntaje_cap_liderazgo)
     }
     
-    return reporte_final
\ No newline at end of file
+    return reporte_final
+
+
+# ==============================================================================
+# REPORTES MATERIALIZADOS
+# Un diagnóstico y sus valores SHAP no cambian después de creados, así que el
+# reporte se renderiza una sola vez y se guarda por (diagnóstico, versión).
+# ==============================================================================
+
+# Se incrementa cuando cambia la forma del reporte guardado, para regenerar los antiguos
+_FORMATO_REPORTE = 3
+
+def _version_reporte(db: Session) -> str:
+    """Versión con la que se materializan los reportes: formato + modelo de ML + catálogo."""
+    return _formato_version(get_model_version(), get_catalog_version(db))
+
+def _formato_version(version_modelo: str, version_catalogo: str) -> str:
+    return f"{_FORMATO_REPORTE}:{version_modelo}:{version_catalogo}"
+
+def obtener_reporte_materializado(db: Session, id_diagnostico: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Lectura por clave del reporte ya renderizado. Verifica en la misma consulta
+    que el diagnóstico pertenezca al usuario. Devuelve None si no existe o si
+    fue generado con otra versión del modelo o del catálogo.
+    """
+    payload = db.query(ReporteMaterializado.payload).join(
+        DiagnosticoModel, DiagnosticoModel.id_diagnostico == ReporteMaterializado.id_diagnostico
+    ).filter(
+        ReporteMaterializado.id_diagnostico == id_diagnostico,
+        ReporteMaterializado.version == _version_reporte(db),
+        DiagnosticoModel.id_usuario == user_id
+    ).scalar()
+    return json.loads(payload) if payload is not None else None
+
+async def obtener_reporte_materializado_async(db: AsyncSession, id_diagnostico: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """Versión asíncrona de obtener_reporte_materializado."""
+    # La primera carga del modelo (si aún no terminó) no debe bloquear el event loop
+    version_modelo = await run_in_threadpool(get_model_version)
+    # Normalmente sale de la caché; al vencer el TTL la huella se recalcula con consultas asíncronas
+    version_catalogo = await db.run_sync(get_catalog_version)
+    payload = (await db.execute(
+        select(ReporteMaterializado.payload).join(
+            DiagnosticoModel, DiagnosticoModel.id_diagnostico == ReporteMaterializado.id_diagnostico
+        ).where(
+            ReporteMaterializado.id_diagnostico == id_diagnostico,
+            ReporteMaterializado.version == _formato_version(version_modelo, version_catalogo),
+            DiagnosticoModel.id_usuario == user_id
+        )
+    )).scalar()
+    return json.loads(payload) if payload is not None else None
+
+def materializar_reporte(db: Session, db_diagnostico: DiagnosticoModel) -> Dict[str, Any]:
+    """Genera el reporte completo, lo guarda (o reemplaza) y devuelve su JSON."""
+    version = _version_reporte(db)
+    reporte = ReporteDiagnostico(**generate_full_report(db=db, db_diagnostico=db_diagnostico))
+    payload = reporte.model_dump(mode="json", exclude={"percentiles"})
+
+    existente = db.get(ReporteMaterializado, db_diagnostico.id_diagnostico)
+    if existente:
+        existente.version = version
+        existente.payload = json.dumps(payload)
+        existente.fecha_generacion = datetime.datetime.utcnow()
+    else:
+        db.add(ReporteMaterializado(
+            id_diagnostico=db_diagnostico.id_diagnostico,
+            version=version,
+            payload=json.dumps(payload)
+        ))
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otra solicitud (o la tarea en segundo plano) lo guardó primero; el contenido es el mismo.
+        db.rollback()
+    return payload
+
+def materializar_reporte_de_usuario(id_diagnostico: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Genera y guarda el reporte de un diagnóstico del usuario con su propia
+    sesión síncrona, para ejecutarse en el threadpool (run_in_threadpool):
+    ejecutar el modelo y renderizar el reporte es trabajo de CPU que no debe
+    correr en el event loop. Devuelve None si el diagnóstico no existe o no
+    pertenece al usuario.
+    """
+    db = SessionLocal()
+    try:
+        db_diagnostico = db.query(DiagnosticoModel).filter(
+            DiagnosticoModel.id_diagnostico == id_diagnostico,
+            DiagnosticoModel.id_usuario == user_id
+        ).first()
+        if not db_diagnostico:
+            return None
+        return materializar_reporte(db=db, db_diagnostico=db_diagnostico)
+    finally:
+        db.close()
+
+def agregar_percentiles(reporte: Dict[str, Any]) -> Dict[str, Any]:
+    """Añade al reporte su posición percentil frente al resto de empresas."""
+    puntajes = dict(reporte.get("desglose_dominios") or {})
+    puntajes[analytics_service.CAPACIDAD_DIGITAL] = reporte.get("puntaje_cap_digital")
+    puntajes[analytics_service.CAPACIDAD_LIDERAZGO] = reporte.get("puntaje_cap_liderazgo")
+    reporte["percentiles"] = percentile_service.percentiles(puntajes)
+    return reporte
+
+def materializar_reporte_en_segundo_plano(id_diagnostico: int):
+    """
+    Tarea en segundo plano que se encola tras crear un diagnóstico, para que
+    la primera vista del reporte ya sea una lectura por clave.
+    """
+    db = SessionLocal()
+    try:
+        db_diagnostico = db.get(DiagnosticoModel, id_diagnostico)
+        if db_diagnostico:
+            materializar_reporte(db, db_diagnostico)
+    except Exception as e:
+        print(f"No se pudo materializar el reporte del diagnóstico {id_diagnostico}: {e}")
+    finally:
+        db.close()
+
+def invalidar_reportes(db: Session, ids_diagnostico: Optional[Iterable[int]] = None) -> int:
+    """
+    Elimina reportes materializados: los de los diagnósticos indicados o,
+    si no se indican, todos (p. ej. tras editar el catálogo). No hace commit.
+    """
+    query = db.query(ReporteMaterializado)
+    if ids_diagnostico is not None:
+        query = query.filter(ReporteMaterializado.id_diagnostico.in_(list(ids_diagnostico)))
+    return query.delete(synchronize_session=False)
+
+
+# ==============================================================================
+# COMPARACIÓN DE DIAGNÓSTICOS
+# Evolución entre los diagnósticos conservados del usuario. Todo sale de los
+# datos ya guardados (respuestas normalizadas y SHAP): no se vuelve a ejecutar
+# el modelo, y los puntajes de todas las filas se calculan de una vez.
+# ==============================================================================
+
+_PREGUNTAS = [f"Q{i}" for i in range(1, 21)]
+
+def _opcional(valor, decimales: int = 2) -> Optional[float]:
+    return None if pd.isna(valor) else round(float(valor), decimales)
+
+def _delta(cabecera: pd.DataFrame, dominios: pd.DataFrame, respuestas: pd.DataFrame,
+           shap: pd.DataFrame, anterior: int, nuevo: int) -> Dict[str, Any]:
+    delta_respuestas = respuestas.loc[nuevo] - respuestas.loc[anterior]
+    delta_shap = shap.loc[nuevo] - shap.loc[anterior]
+    delta_dominios = dominios.loc[nuevo] - dominios.loc[anterior]
+    return {
+        "id_diagnostico_anterior": int(anterior),
+        "id_diagnostico_nuevo": int(nuevo),
+        "nivel_anterior": cabecera.at[anterior, "nivel"],
+        "nivel_nuevo": cabecera.at[nuevo, "nivel"],
+        "delta_cap_digital": round(cabecera.at[nuevo, "digital"] - cabecera.at[anterior, "digital"], 2),
+        "delta_cap_liderazgo": round(cabecera.at[nuevo, "liderazgo"] - cabecera.at[anterior, "liderazgo"], 2),
+        "dominios": {d: _opcional(v) for d, v in delta_dominios.items()},
+        "preguntas": [{
+            "pregunta_id": q,
+            "valor_anterior": _opcional(respuestas.at[anterior, q]),
+            "valor_nuevo": _opcional(respuestas.at[nuevo, q]),
+            "delta": _opcional(delta_respuestas[q]),
+            "delta_shap": _opcional(delta_shap[q], 6),
+        } for q in _PREGUNTAS],
+    }
+
+def comparar_diagnosticos(db: Session, user_id: int, limite: int = 3) -> Dict[str, Any]:
+    """
+    Compara los últimos `limite` diagnósticos del usuario (los mismos que
+    devuelve get_user_diagnoses). Diagnósticos, respuestas y SHAP se leen en
+    una sola consulta y se pivotan a matrices diagnóstico x pregunta.
+    """
+    recientes = select(DiagnosticoModel.id_diagnostico).where(
+        DiagnosticoModel.id_usuario == user_id
+    ).order_by(desc(DiagnosticoModel.fecha_diagnostico)).limit(limite).subquery()
+
+    filas = db.query(
+        DiagnosticoModel.id_diagnostico, DiagnosticoModel.fecha_diagnostico,
+        DiagnosticoModel.nivel_madurez_predicho, DiagnosticoModel.puntaje_cap_digital,
+        DiagnosticoModel.puntaje_cap_liderazgo, Respuesta.id_pregunta, Respuesta.valor_normalizado,
+        DiagnosticoSHAP.valor_shap, DiagnosticoSHAP.es_driver_clave
+    ).join(
+        recientes, recientes.c.id_diagnostico == DiagnosticoModel.id_diagnostico
+    ).outerjoin(
+        Respuesta, Respuesta.id_diagnostico == DiagnosticoModel.id_diagnostico
+    ).outerjoin(
+        DiagnosticoSHAP, and_(
+            DiagnosticoSHAP.id_diagnostico == DiagnosticoModel.id_diagnostico,
+            DiagnosticoSHAP.id_pregunta == Respuesta.id_pregunta
+        )
+    ).all()
+
+    if not filas:
+        return {"diagnosticos": [], "deltas": [], "delta_total": None}
+
+    df = pd.DataFrame(filas, columns=[
+        "id", "fecha", "nivel", "digital", "liderazgo", "id_pregunta", "valor", "shap", "driver"
+    ])
+    cabecera = df.drop_duplicates("id").sort_values(["fecha", "id"]).set_index("id")
+    cabecera = cabecera.astype({"digital": float, "liderazgo": float})
+    orden = cabecera.index
+
+    # Matrices diagnóstico x pregunta (Q1..Q20). Un 0 guardado significa respuesta inválida.
+    df = df.dropna(subset=["id_pregunta"]).astype({"id_pregunta": int})
+    df["pregunta"] = "Q" + df["id_pregunta"].astype(str)
+    por_pregunta = df.groupby(["id", "pregunta"])
+    respuestas = por_pregunta["valor"].first().unstack().reindex(index=orden, columns=_PREGUNTAS)
+    respuestas = respuestas.astype(float).replace(0.0, np.nan)
+    shap = por_pregunta["shap"].first().unstack().reindex(index=orden, columns=_PREGUNTAS).astype(float)
+    drivers = por_pregunta["driver"].first().unstack().reindex(index=orden, columns=_PREGUNTAS)
+
+    dominios = pd.DataFrame(
+        agregar(respuestas)[:, :N_DOMINIOS], index=orden, columns=list(MAPA_DOMINIOS)
+    )
+
+    diagnosticos = [{
+        "id_diagnostico": int(id_diag),
+        "fecha_diagnostico": cabecera.at[id_diag, "fecha"],
+        "nivel_madurez_predicho": cabecera.at[id_diag, "nivel"],
+        "puntaje_cap_digital": cabecera.at[id_diag, "digital"],
+        "puntaje_cap_liderazgo": cabecera.at[id_diag, "liderazgo"],
+        "desglose_dominios": {d: _opcional(v) for d, v in dominios.loc[id_diag].items()},
+        "respuestas_normalizadas": {q: _opcional(v) for q, v in respuestas.loc[id_diag].items()},
+        "valores_shap": {q: _opcional(v, 6) for q, v in shap.loc[id_diag].items()},
+        "drivers_clave": [q for q, es_driver in drivers.loc[id_diag].items() if es_driver == 1],
+    } for id_diag in orden]
+
+    deltas = [_delta(cabecera, dominios, respuestas, shap, anterior, nuevo)
+              for anterior, nuevo in zip(orden[:-1], orden[1:])]
+    delta_total = _delta(cabecera, dominios, respuestas, shap, orden[0], orden[-1]) if len(orden) > 1 else None
+
+    return {"diagnosticos": diagnosticos, "deltas": deltas, "delta_total": delta_total}
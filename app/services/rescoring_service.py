@@ -0,0 +1,217 @@
+# ==============================================================================
+# Servicio de Re-puntuación de Diagnósticos
+# Cuando se reemplazan los artefactos de ML (modelo_rf / shap_explainer), los
+# niveles predichos y valores SHAP guardados siguen siendo los del modelo
+# anterior. Este servicio los recalcula desde las respuestas normalizadas ya
+# guardadas: lee por lotes con paginación por clave (id_diagnostico), puntúa
+# en un pool de procesos, escribe los resultados con operaciones masivas y
+# guarda un punto de control tras cada lote para poder reanudar.
+# ==============================================================================
+
+from __future__ import annotations
+
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.lazy import importar_perezoso
+np = importar_perezoso("numpy")
+pd = importar_perezoso("pandas")
+from sqlalchemy import delete, func, insert, or_, update
+from sqlalchemy.orm import Session
+
+from app.ml.loader import get_model_components, get_model_version
+from app.models.diagnosis import Diagnostico, DiagnosticoSHAP, Respuesta
+from app.services import analytics_service, diagnosis_service, report_service
+
+_PREGUNTAS = [f"Q{i}" for i in range(1, 21)]
+
+
+# ==============================================================================
+# PUNTUACIÓN (se ejecuta en los procesos del pool)
+# ==============================================================================
+def _inicializar_worker():
+    """
+    Carga los artefactos una vez por proceso. Con el contexto 'fork' el
+    proceso hereda el modelo ya cargado por el padre (páginas compartidas
+    copy-on-write) y esta llamada no vuelve a leer el disco.
+    """
+    get_model_components()
+
+def _puntuar(matriz: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray, List[str]]:
+    """
+    Puntúa un bloque (n, 20) de respuestas normalizadas (NaN = inválida).
+    Devuelve los niveles predichos, la matriz SHAP (n, 20), la máscara de
+    drivers clave (n, 20) y la versión del modelo de cada fila, en arreglos
+    compactos para el viaje entre procesos.
+    """
+    analisis = diagnosis_service.process_diagnosis_batch(pd.DataFrame(matriz, columns=_PREGUNTAS))
+    niveles = [a["nivel_madurez_predicho"] for a in analisis]
+    shap = np.array([[s["shap_value"] for s in a["shap_values"]] for a in analisis], dtype=float)
+    drivers = np.zeros(matriz.shape, dtype=bool)
+    for fila, a in enumerate(analisis):
+        for d in a["areas_mejora_prioritarias"]:
+            drivers[fila, int(d["pregunta_id"][1:]) - 1] = True
+    return niveles, shap.reshape(matriz.shape), drivers, [a["version_modelo"] for a in analisis]
+
+
+# ==============================================================================
+# PUNTO DE CONTROL
+# ==============================================================================
+def leer_checkpoint(ruta: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+def _guardar_checkpoint(ruta: str, estado: Dict[str, Any]):
+    """Escritura atómica: un corte a mitad de escritura no deja el archivo corrupto."""
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(estado, f, indent=2)
+    os.replace(temporal, ruta)
+
+
+# ==============================================================================
+# LECTURA Y ESCRITURA POR LOTES
+# ==============================================================================
+def _leer_lote(db: Session, desde_id: int, hasta_id: int, version: str, lote: int) -> Tuple[List[int], np.ndarray]:
+    """
+    Siguiente página de diagnósticos (id > desde_id) que no fueron puntuados
+    con `version`, con sus respuestas normalizadas.
+    """
+    ids = [fila.id_diagnostico for fila in db.query(Diagnostico.id_diagnostico).filter(
+        Diagnostico.id_diagnostico > desde_id, Diagnostico.id_diagnostico <= hasta_id,
+        _pendiente(version)
+    ).order_by(Diagnostico.id_diagnostico).limit(lote)]
+    matriz = np.full((len(ids), 20), np.nan)
+    if ids:
+        posicion = {id_diag: i for i, id_diag in enumerate(ids)}
+        for id_diag, id_pregunta, valor in db.query(
+            Respuesta.id_diagnostico, Respuesta.id_pregunta, Respuesta.valor_normalizado
+        ).filter(Respuesta.id_diagnostico.between(ids[0], ids[-1])):
+            # Un 0 guardado es una respuesta inválida: el modelo la recibió como NaN
+            if valor and id_diag in posicion:
+                matriz[posicion[id_diag], id_pregunta - 1] = valor
+    return ids, matriz
+
+def _pendiente(version: str):
+    return or_(Diagnostico.version_modelo.is_(None), Diagnostico.version_modelo != version)
+
+def _escribir_lote(db: Session, ids: List[int], niveles: List[str], shap: np.ndarray,
+                   drivers: np.ndarray, versiones: List[str]) -> int:
+    """
+    Actualiza niveles, reemplaza los valores SHAP y ajusta la analítica en una
+    sola transacción. Los puntajes de dominios y capacidades solo dependen de
+    las respuestas, así que no cambian (ni el histograma de percentiles).
+    Devuelve cuántos diagnósticos cambiaron de nivel.
+    """
+    anteriores = dict(db.query(Diagnostico.id_diagnostico, Diagnostico.nivel_madurez_predicho).filter(
+        Diagnostico.id_diagnostico.in_(ids)
+    ))
+    analytics_service.descontar_diagnosticos(db, ids)
+
+    db.execute(update(Diagnostico), [
+        {"id_diagnostico": id_diag, "nivel_madurez_predicho": nivel, "version_modelo": version}
+        for id_diag, nivel, version in zip(ids, niveles, versiones)
+    ])
+    db.execute(delete(DiagnosticoSHAP).where(DiagnosticoSHAP.id_diagnostico.in_(ids)))
+    db.execute(insert(DiagnosticoSHAP), [{
+        "id_diagnostico": id_diag, "id_pregunta": q + 1,
+        "valor_shap": float(shap[fila, q]), "es_driver_clave": bool(drivers[fila, q]),
+    } for fila, id_diag in enumerate(ids) for q in range(20)])
+
+    analytics_service.registrar_diagnosticos(db, ids)
+    report_service.invalidar_reportes(db, ids)
+    db.commit()
+    return sum(anteriores.get(id_diag) != nivel for id_diag, nivel in zip(ids, niveles))
+
+
+# ==============================================================================
+# TRABAJO COMPLETO
+# ==============================================================================
+def re_puntuar(db: Session, checkpoint: str, lote: int = 2000, workers: Optional[int] = None,
+               reiniciar: bool = False, log: bool = False) -> Dict[str, Any]:
+    """
+    Re-puntúa con los artefactos actuales los diagnósticos existentes al
+    iniciar el trabajo que no tengan ya esa versión (Diagnostico.version_modelo). Si `checkpoint` existe y corresponde a la misma
+    versión del modelo, continúa desde el último lote confirmado.
+    `workers` = 0 puntúa en el propio proceso.
+    """
+    version = get_model_version()
+    estado = None if reiniciar else leer_checkpoint(checkpoint)
+    if estado and estado.get("version_modelo") != version:
+        if log:
+            print(f"El punto de control es de la versión {estado.get('version_modelo')}; "
+                  f"se empieza de nuevo con {version}.")
+        estado = None
+    if estado is None:
+        # Los diagnósticos creados después de este punto ya nacen con el modelo nuevo
+        estado = {
+            "version_modelo": version,
+            "hasta_id": db.query(func.max(Diagnostico.id_diagnostico)).scalar() or 0,
+            "ultimo_id": 0, "procesados": 0, "cambios_nivel": 0, "completado": False,
+        }
+    elif estado["completado"]:
+        if log:
+            print("El trabajo ya estaba completado para esta versión del modelo.")
+        return estado
+    else:
+        if log:
+            print(f"Reanudando desde id_diagnostico > {estado['ultimo_id']} ({estado['procesados']} ya procesados).")
+
+    pendientes = db.query(func.count(Diagnostico.id_diagnostico)).filter(
+        Diagnostico.id_diagnostico > estado["ultimo_id"], Diagnostico.id_diagnostico <= estado["hasta_id"],
+        _pendiente(version)
+    ).scalar()
+    total = estado["procesados"] + pendientes
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = None
+    if workers > 0:
+        get_model_components()  # en el padre, para que los workers 'fork' lo hereden
+        metodos = multiprocessing.get_all_start_methods()
+        contexto = multiprocessing.get_context("fork" if "fork" in metodos else "spawn")
+        pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=contexto, initializer=_inicializar_worker)
+
+    inicio_trabajo = time.perf_counter()
+    try:
+        while True:
+            inicio = time.perf_counter()
+            ids, matriz = _leer_lote(db, estado["ultimo_id"], estado["hasta_id"], version, lote)
+            if not ids:
+                break
+            if pool is None:
+                niveles, shap, drivers, versiones = _puntuar(matriz)
+            else:
+                # Un sub-bloque por worker: cada uno hace una sola llamada vectorizada al modelo
+                partes = [p for p in np.array_split(matriz, workers) if len(p)]
+                resultados = list(pool.map(_puntuar, partes))
+                niveles = [n for r in resultados for n in r[0]]
+                shap = np.vstack([r[1] for r in resultados])
+                drivers = np.vstack([r[2] for r in resultados])
+                versiones = [v for r in resultados for v in r[3]]
+
+            estado["cambios_nivel"] += _escribir_lote(db, ids, niveles, shap, drivers, versiones)
+            estado["ultimo_id"] = ids[-1]
+            estado["procesados"] += len(ids)
+            estado["actualizado"] = datetime.datetime.utcnow().isoformat(timespec="seconds")
+            _guardar_checkpoint(checkpoint, estado)
+
+            duracion = time.perf_counter() - inicio
+            if log:
+                print(f"  {estado['procesados']}/{total} diagnósticos ({len(ids) / duracion:.0f}/s en este lote, "
+                      f"hasta id {ids[-1]})")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    estado["completado"] = True
+    estado["duracion_s"] = round(time.perf_counter() - inicio_trabajo, 2)
+    _guardar_checkpoint(checkpoint, estado)
+    return estado
@@ -0,0 +1,221 @@
+# ==============================================================================
+# Suite de Microbenchmarks
+# Mide las rutas calientes de ML y de servicios contra los artefactos
+# app/ml/*.joblib y una base SQLite en memoria con el catálogo sembrado.
+#
+# Uso:
+#   python -m pytest benchmarks -q
+#
+# Variables de entorno:
+#   BENCH_ROUNDS=30            rondas medidas por benchmark
+#   BENCH_MAX_REGRESSION=0.5   regresión máxima tolerada del tiempo mínimo (50%)
+#   BENCH_SLACK_MS=0.5         margen absoluto extra (ms), para rutas de menos de 1 ms
+#   BENCH_SAVE_BASELINE=1      guarda los resultados como nueva línea base
+#
+# La línea base vive en benchmarks/baseline.json y el resultado de la última
+# ejecución en benchmarks/.results/latest.json. Se compara el tiempo mínimo
+# por llamada porque es la estadística menos sensible al ruido de la máquina.
+#
+# Para el ruido que queda (una máquina compartida más lenta en ese momento),
+# antes y después de cada benchmark se mide una carga fija de referencia
+# (mediana de 8 vueltas). Si tarda más que al grabar la línea base
+# (`_calibracion_ms`), el límite se escala en esa proporción. Los mínimos
+# guardados no cambian y el límite nunca baja.
+# ==============================================================================
+
+import json
+import os
+import statistics
+import tempfile
+import time
+
+# La configuración de la app exige estas variables; en benchmarks no se usan.
+for _clave, _valor in {
+    "DATABASE_URL": "sqlite://",
+    "SECRET_KEY": "benchmark",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "MAIL_USERNAME": "benchmark",
+    "MAIL_PASSWORD": "benchmark",
+    "MAIL_FROM": "benchmark@example.com",
+    "MAIL_PORT": "587",
+    "MAIL_SERVER": "localhost",
+    "SKETCH_DIR": os.path.join(tempfile.gettempdir(), "digipath-benchmark-sketches"),
+}.items():
+    os.environ.setdefault(_clave, _valor)
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  (registra todos los modelos en Base.metadata)
+from app.models.action_plan import PlanAccion, TareaPlan  # noqa: F401
+from app.db.database import Base
+from app.models.user import Usuario
+from app.services import action_plan_service, diagnosis_service
+from benchmarks.datos import RESPUESTAS_SCHEMA
+from loadtest.synthetic import seed_catalog
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(_DIR, "baseline.json")
+RESULTS_PATH = os.path.join(_DIR, ".results", "latest.json")
+
+_resultados = {}
+_calibraciones = []
+_CALIBRACION = "_calibracion_ms"
+
+
+# ==============================================================================
+# BASE DE DATOS EN MEMORIA
+# ==============================================================================
+@pytest.fixture(scope="session")
+def engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        seed_catalog(db)
+        db.add(Usuario(id_usuario=1, nombre_empresa="Empresa Benchmark", ruc="20123456789",
+                       correo_electronico="bench@example.com", contrasena_hash="x"))
+        db.commit()
+    return engine
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+# ==============================================================================
+# DATOS DE PRUEBA
+# ==============================================================================
+# Las respuestas de ejemplo están en benchmarks/datos.py
+@pytest.fixture
+def diagnostico(db):
+    return diagnosis_service.create_and_process_diagnosis(db, user_id=1, respuestas_schema=RESPUESTAS_SCHEMA)
+
+@pytest.fixture
+def plan(db, diagnostico):
+    plan = action_plan_service.crear_o_obtener_plan(db, id_diagnostico=diagnostico.id_diagnostico)
+    # Avance parcial para que la proyección no sea idéntica al análisis actual
+    for i, tarea in enumerate(db.query(TareaPlan).filter(TareaPlan.id_plan == plan.id_plan)):
+        tarea.progreso = 50 * (i % 3)
+    db.commit()
+    return plan
+
+
+# ==============================================================================
+# FIXTURE DE MEDICIÓN
+# ==============================================================================
+def _vueltas_calibracion(vueltas: int) -> list:
+    """Tiempos (ms) de una carga fija de CPU: la velocidad de la máquina en este momento."""
+    # ~30 ms por vuelta, como los benchmarks más largos: una vuelta de 1 ms
+    # cabe en un solo turno del planificador y no notaría la competencia por la CPU
+    tiempos = []
+    for _ in range(vueltas):
+        inicio = time.perf_counter()
+        sum(i * i for i in range(400000))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+class Benchmark:
+    """
+    Equivalente mínimo del fixture `benchmark` de pytest-benchmark:
+    `benchmark(func, *args, **kwargs)` ejecuta la función varias veces,
+    registra estadísticas por llamada y devuelve el resultado de la última.
+    Las funciones muy rápidas se agrupan en iteraciones de al menos 1 ms
+    para que la resolución del reloj no domine la medición.
+    """
+
+    def __init__(self, nombre: str, rondas: int, tolerancia: float, linea_base: dict, holgura_ms: float = 0.0):
+        self.nombre = nombre
+        self.rondas = rondas
+        self.tolerancia = tolerancia
+        self.holgura_ms = holgura_ms
+        self.linea_base = linea_base
+        self.stats = None
+
+    def __call__(self, func, *args, **kwargs):
+        # Una llamada de calentamiento y otra para calibrar las iteraciones por ronda
+        resultado = func(*args, **kwargs)
+        inicio = time.perf_counter()
+        resultado = func(*args, **kwargs)
+        primera = time.perf_counter() - inicio
+        iteraciones = max(1, int(0.001 / primera)) if primera > 0 else 1000
+
+        # La mitad de la calibración antes de medir y la otra mitad después
+        calibracion = _vueltas_calibracion(4)
+        tiempos = []
+        for _ in range(self.rondas):
+            inicio = time.perf_counter()
+            for _ in range(iteraciones):
+                resultado = func(*args, **kwargs)
+            tiempos.append((time.perf_counter() - inicio) / iteraciones)
+
+        tiempos_ms = sorted(t * 1000 for t in tiempos)
+        self.stats = {
+            "rondas": self.rondas,
+            "iteraciones": iteraciones,
+            "min_ms": round(tiempos_ms[0], 4),
+            "mediana_ms": round(statistics.median(tiempos_ms), 4),
+            "media_ms": round(statistics.fmean(tiempos_ms), 4),
+            "p95_ms": round(tiempos_ms[min(len(tiempos_ms) - 1, int(len(tiempos_ms) * 0.95))], 4),
+            "max_ms": round(tiempos_ms[-1], 4),
+        }
+        _resultados[self.nombre] = self.stats
+
+        calibracion = statistics.median(calibracion + _vueltas_calibracion(4))
+        _calibraciones.append(calibracion)
+        base = self.linea_base.get(self.nombre)
+        if base:
+            # Cuánto más lenta está la máquina que al grabar la línea base (nunca menos de 1)
+            lentitud = max(1.0, calibracion / self.linea_base.get(_CALIBRACION, calibracion))
+            limite = base["min_ms"] * lentitud * (1 + self.tolerancia) + self.holgura_ms
+            if self.stats["min_ms"] > limite:
+                pytest.fail(
+                    f"Regresión en {self.nombre}: mínimo {self.stats['min_ms']:.3f} ms "
+                    f"> {limite:.3f} ms (línea base {base['min_ms']:.3f} ms x {lentitud:.2f} "
+                    f"de lentitud + {self.tolerancia:.0%} + {self.holgura_ms} ms)"
+                )
+        return resultado
+
+@pytest.fixture(scope="session")
+def linea_base():
+    if os.environ.get("BENCH_SAVE_BASELINE") == "1" or not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+@pytest.fixture
+def benchmark(request, linea_base):
+    return Benchmark(
+        nombre=request.node.name,
+        rondas=int(os.environ.get("BENCH_ROUNDS", "30")),
+        tolerancia=float(os.environ.get("BENCH_MAX_REGRESSION", "0.5")),
+        linea_base=linea_base,
+        holgura_ms=float(os.environ.get("BENCH_SLACK_MS", "0.5")),
+    )
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _resultados:
+        return
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, "w", encoding="utf-8") as f:
+        json.dump(_resultados, f, indent=2, sort_keys=True)
+    if os.environ.get("BENCH_SAVE_BASELINE") == "1":
+        base = {}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH, encoding="utf-8") as f:
+                base = json.load(f)
+        base.update(_resultados)
+        base[_CALIBRACION] = round(statistics.median(_calibraciones), 4)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump(base, f, indent=2, sort_keys=True)
+            f.write("\n")
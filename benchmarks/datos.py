@@ -0,0 +1,15 @@
+# ==============================================================================
+# Datos de Prueba de los Benchmarks
+# Respuestas de una empresa "intermedia" que usan los benchmarks, los
+# presupuestos de consultas y los fixtures de conftest.py.
+# ==============================================================================
+
+from app.schemas.diagnosis_schema import RespuestaCreate
+
+# Respuestas crudas de una empresa "intermedia": mezcla de Si/No y escalas.
+RESPUESTAS = {
+    f"Q{i}": ("Si" if i in [1, 10, 15] else "No") if i in [1, 3, 7, 10, 13, 15, 17]
+    else (2 if i == 6 else 2 if i == 18 else (i % 5) + 2)
+    for i in range(1, 21)
+}
+RESPUESTAS_SCHEMA = [RespuestaCreate(id_pregunta=int(q[1:]), valor_respuesta_cruda=v) for q, v in RESPUESTAS.items()]
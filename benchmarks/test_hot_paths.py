@@ -0,0 +1,57 @@
+# ==============================================================================
+# Benchmarks de las rutas calientes de ML y servicios
+# ==============================================================================
+
+import pytest
+
+from app.services import action_plan_service, aggregation_service, counterfactual_service, diagnosis_service, report_service
+from app.services.diagnosis_service import _normalize_row, process_diagnosis
+from benchmarks.datos import RESPUESTAS, RESPUESTAS_SCHEMA
+
+
+@pytest.fixture(scope="module", autouse=True)
+def modelo_cargado():
+    # La primera llamada carga los artefactos desde disco; no queremos medir eso.
+    process_diagnosis(RESPUESTAS)
+
+
+def test_normalize_row(benchmark):
+    fila = benchmark(_normalize_row, RESPUESTAS)
+    assert list(fila.columns) == [f"Q{i}" for i in range(1, 21)]
+
+def test_agregar_puntajes(benchmark):
+    fila = _normalize_row(RESPUESTAS)
+    puntajes = benchmark(aggregation_service.agregar, fila)
+    assert puntajes.shape == (1, len(aggregation_service.METRICAS))
+
+def test_process_diagnosis(benchmark):
+    analisis = benchmark(process_diagnosis, RESPUESTAS)
+    assert len(analisis["shap_values"]) == 20
+
+def test_create_and_process_diagnosis(benchmark, db):
+    diagnostico = benchmark(diagnosis_service.create_and_process_diagnosis, db, 1, RESPUESTAS_SCHEMA)
+    assert diagnostico.nivel_madurez_predicho != "EN PROCESO"
+
+def test_generate_full_report(benchmark, db, diagnostico):
+    reporte = benchmark(report_service.generate_full_report, db, diagnostico)
+    assert reporte["id_diagnostico"] == diagnostico.id_diagnostico
+
+def test_obtener_datos_dashboard(benchmark, db, plan):
+    dashboard = benchmark(action_plan_service.obtener_datos_dashboard, db, plan.id_plan)
+    assert dashboard["id_plan"] == plan.id_plan
+
+def test_obtener_datos_dashboard_sin_cache(benchmark, db, plan):
+    def sin_cache():
+        action_plan_service.invalidar_cache_dashboard()
+        return action_plan_service.obtener_datos_dashboard(db, plan.id_plan)
+    dashboard = benchmark(sin_cache)
+    assert dashboard["id_plan"] == plan.id_plan
+
+def test_comparar_diagnosticos(benchmark, db, diagnostico):
+    comparacion = benchmark(report_service.comparar_diagnosticos, db, 1)
+    assert comparacion["diagnosticos"][-1]["id_diagnostico"] == diagnostico.id_diagnostico
+
+def test_buscar_siguiente_nivel(benchmark):
+    fila = _normalize_row(RESPUESTAS).to_numpy(dtype=float)[0]
+    ruta = benchmark(counterfactual_service.buscar_siguiente_nivel, fila)
+    assert ruta["alcanzado"] or ruta["nivel_objetivo"] is None
@@ -0,0 +1,63 @@
+# ==============================================================================
+# Reconstrucción del Histograma de Percentiles
+# Un diagnóstico que se guarda mientras se reconstruye el histograma debe
+# contarse exactamente una vez: ni perderse (el reemplazo pisa su suma) ni
+# duplicarse (la lectura de la base ya lo incluía). Usa una base SQLite en
+# archivo para que la reconstrucción y el guardado corran en hilos distintos.
+# ==============================================================================
+
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.sketches import HistogramaCompartido
+from app.db.database import Base
+from app.models.user import Usuario
+from app.services import diagnosis_service, percentile_service
+from benchmarks.datos import RESPUESTAS_SCHEMA
+from loadtest.synthetic import seed_catalog
+
+
+def test_diagnostico_durante_la_reconstruccion(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'percentiles.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Sesion = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Sesion() as db:
+        seed_catalog(db)
+        db.add(Usuario(id_usuario=1, nombre_empresa="Empresa Percentiles", ruc="20111111111",
+                       correo_electronico="percentiles@example.com", contrasena_hash="x"))
+        db.commit()
+
+    histograma = HistogramaCompartido(str(tmp_path / "percentiles.bin"), metricas=len(percentile_service.metricas()))
+    monkeypatch.setattr(percentile_service, "_histograma", histograma)
+    crear = lambda: diagnosis_service.create_and_process_diagnosis(Sesion(), 1, RESPUESTAS_SCHEMA)
+    crear()
+    crear()
+
+    # La reconstrucción se detiene después de leer el primer lote de la base
+    leyendo, seguir = threading.Event(), threading.Event()
+    original = percentile_service.puntajes_de_diagnosticos
+    def puntajes_lentos(db, ids):
+        puntajes = original(db, ids)
+        leyendo.set()
+        seguir.wait(10)
+        return puntajes
+    monkeypatch.setattr(percentile_service, "puntajes_de_diagnosticos", puntajes_lentos)
+
+    reconstruccion = threading.Thread(target=lambda: percentile_service.reconstruir(Sesion()))
+    reconstruccion.start()
+    assert leyendo.wait(10)
+    guardado = threading.Thread(target=crear)
+    guardado.start()
+    time.sleep(0.3)
+    # El guardado espera a que termine la reconstrucción
+    assert guardado.is_alive()
+    seguir.set()
+    reconstruccion.join(10)
+    guardado.join(10)
+
+    # Las capacidades están en todos los diagnósticos: una observación por cada uno
+    assert histograma.totales()[-2:].tolist() == [3, 3]
+    engine.dispose()
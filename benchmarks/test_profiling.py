@@ -0,0 +1,72 @@
+# ==============================================================================
+# Perfilado de una Sola Solicitud
+# Con varias solicitudes atendiéndose a la vez, el perfil de la solicitud
+# perfilada solo debe contener sus propias pilas: las de su hilo del
+# threadpool y las del event loop mientras la atiende.
+# ==============================================================================
+
+import asyncio
+import json
+import os
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.core import profiling
+from app.core.config import get_settings
+
+
+def _girar(segundos: float):
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        sum(range(1000))
+
+def funcion_perfilada():
+    _girar(0.3)
+
+def funcion_ajena():
+    _girar(0.3)
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/perfilada")
+    def perfilada():
+        funcion_perfilada()
+        return {}
+
+    @app.get("/ajena")
+    def ajena():
+        funcion_ajena()
+        return {}
+
+    app.add_middleware(profiling.ProfilingMiddleware)
+    return app
+
+def test_perfil_solo_de_la_solicitud(monkeypatch, tmp_path):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "token")
+    monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PROFILING_INTERVAL", 0.002)
+    # Las funciones de prueba no están en app/: que cuenten como código de la aplicación
+    monkeypatch.setattr(profiling, "_APP_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+    async def solicitar():
+        transporte = httpx.ASGITransport(app=_app())
+        async with httpx.AsyncClient(transport=transporte, base_url="http://prueba") as cliente:
+            return await asyncio.gather(
+                cliente.get("/perfilada", headers={"X-Profile": "token"}),
+                cliente.get("/ajena"),
+                cliente.get("/ajena"),
+            )
+
+    respuestas = asyncio.run(solicitar())
+    with open(tmp_path / respuestas[0].headers["x-profile-id"], encoding="utf-8") as f:
+        perfil = json.load(f)
+    funciones = {
+        perfil["shared"]["frames"][i]["name"]
+        for hilo in perfil["profiles"] for pila in hilo["samples"] for i in pila
+    }
+    assert "funcion_perfilada" in funciones
+    assert "funcion_ajena" not in funciones
@@ -0,0 +1,94 @@
+# ==============================================================================
+# Presupuestos de Consultas SQL
+# Cuántas consultas puede hacer cada servicio detrás de un endpoint. Una
+# carga perezosa dentro de un bucle (N+1) multiplica las consultas por el
+# número de filas y hace fallar su presupuesto. Al fallar, el mensaje lista
+# las sentencias repetidas. El envío de diagnósticos también se mide a través
+# de la app, con la cabecera X-DB-Queries de QueryTracingMiddleware.
+#
+# Si un cambio necesita más consultas a propósito, se sube su presupuesto aquí.
+# ==============================================================================
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1.api import api_router
+from app.api.v1.endpoints.auth import get_current_user
+from app.core.query_tracing import QueryTracingMiddleware, presupuesto_consultas
+from app.db.database import get_db
+from app.models.diagnosis import Diagnostico
+from app.models.user import Usuario
+from app.services import action_plan_service, diagnosis_service, report_service
+from benchmarks.datos import RESPUESTAS_SCHEMA
+
+
+def _usuario_nuevo(db, ruc: str) -> Usuario:
+    # Usuario propio: el historial del usuario 1 depende de los benchmarks que corrieron antes
+    usuario = Usuario(nombre_empresa="Empresa Presupuesto", ruc=ruc,
+                      correo_electronico=f"{ruc}@example.com", contrasena_hash="x")
+    db.add(usuario)
+    db.commit()
+    return usuario
+
+def test_create_and_process_diagnosis(db):
+    id_usuario = _usuario_nuevo(db, "20987654321").id_usuario
+    crear = lambda: diagnosis_service.create_and_process_diagnosis(db, id_usuario, RESPUESTAS_SCHEMA)
+
+    # El primer diagnóstico del mes además crea las filas de la analítica mensual: no se cuenta
+    crear()
+    # Diagnóstico + respuestas + valores SHAP (un INSERT cada uno) + analítica
+    with presupuesto_consultas(16, repeticiones=1):
+        crear()
+    crear()
+    # Con el historial lleno se poda el más antiguo y se resta de la analítica
+    # (las sentencias de la analítica se repiten: sumar el nuevo y restar el podado)
+    with presupuesto_consultas(33, repeticiones=2):
+        crear()
+
+def test_post_diagnosis_endpoint(db, monkeypatch):
+    # El mismo envío a través de la app ASGI, contado por QueryTracingMiddleware
+    # (el reporte en segundo plano abre su propia sesión, de otra base en este proceso)
+    monkeypatch.setattr(report_service, "materializar_reporte_en_segundo_plano", lambda id_diagnostico: None)
+    usuario = _usuario_nuevo(db, "20987654322")
+    app = FastAPI()
+    app.include_router(api_router, prefix="/api/v1")
+    app.add_middleware(QueryTracingMiddleware)
+
+    def get_db_prueba():
+        yield db
+    app.dependency_overrides[get_db] = get_db_prueba
+    app.dependency_overrides[get_current_user] = lambda: usuario
+
+    cliente = TestClient(app)
+    cuerpo = {"respuestas": [r.model_dump(mode="json") for r in RESPUESTAS_SCHEMA]}
+    cliente.post("/api/v1/diagnosis/", json=cuerpo)  # primero del mes (ver arriba)
+    respuesta = cliente.post("/api/v1/diagnosis/", json=cuerpo)
+    assert respuesta.status_code == 201, respuesta.text
+    # Lo del servicio + leer las respuestas del diagnóstico para serializarlo
+    assert int(respuesta.headers["x-db-queries"]) <= 17, respuesta.headers
+    assert int(respuesta.headers["x-db-max-repeats"]) <= 1, respuesta.headers
+
+def test_generate_full_report(db, diagnostico):
+    db.expire_all()
+    diagnostico = db.get(Diagnostico, diagnostico.id_diagnostico)
+    # SHAP + respuestas + recomendaciones de debilidades y de fortalezas (misma sentencia)
+    with presupuesto_consultas(4, repeticiones=2):
+        report_service.generate_full_report(db, diagnostico)
+
+def test_obtener_datos_dashboard(db, plan):
+    id_plan = plan.id_plan
+    action_plan_service.invalidar_cache_dashboard()
+    # Plan + tareas con sus recomendaciones + diagnóstico y respuestas (sin caché)
+    with presupuesto_consultas(4, repeticiones=1):
+        action_plan_service.obtener_datos_dashboard(db, id_plan)
+    # Con el análisis base en caché solo se leen el plan y las tareas
+    with presupuesto_consultas(2, repeticiones=1):
+        action_plan_service.obtener_datos_dashboard(db, id_plan)
+
+def test_comparar_diagnosticos(db, diagnostico):
+    with presupuesto_consultas(1):
+        report_service.comparar_diagnosticos(db, 1)
+
+def test_get_user_diagnoses(db, diagnostico):
+    with presupuesto_consultas(1):
+        diagnosis_service.get_user_diagnoses(db, 1)
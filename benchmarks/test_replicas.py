@@ -0,0 +1,104 @@
+# ==============================================================================
+# Enrutamiento de Lecturas a Réplicas
+# Importa app.db.replicas en un proceso nuevo con la primaria y una réplica
+# en dos archivos SQLite distintos. Cada base tiene la pregunta 1 con un
+# texto diferente, así que el texto leído dice qué base atendió la lectura.
+#
+# Con Redis (fakeredis) las lecturas van a la réplica salvo las del usuario
+# que escribió dentro de REPLICA_LAG_GUARD_SECONDS. Sin Redis, las lecturas de
+# usuarios van a la primaria.
+# ==============================================================================
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_GUARDA_S = 0.5
+
+
+def _escenario() -> dict:
+    """Se ejecuta en el proceso hijo (python -m benchmarks.test_replicas)."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    import app.models  # noqa: F401  (registra todos los modelos en Base.metadata)
+    from app.core import redis_client
+    from app.db import replicas
+    from app.db.database import Base, async_engine
+    from app.models.question import Pregunta
+
+    for url, texto in ((os.environ["DATABASE_URL"], "primaria"), (os.environ["DATABASE_REPLICA_URLS"], "replica")):
+        engine = create_engine(url)
+        Base.metadata.create_all(bind=engine)
+        with Session(engine) as db:
+            db.add(Pregunta(id_pregunta=1, texto_pregunta=texto, seccion="S", dominio="D",
+                            subdominio="S1", tipo_pregunta="Escala"))
+            db.commit()
+        engine.dispose()
+
+    async def leer(id_usuario=None) -> str:
+        db = await replicas.sesion_lectura(id_usuario)
+        try:
+            return db.get(Pregunta, 1).texto_pregunta
+        finally:
+            db.close()
+
+    async def leer_async(id_usuario=None) -> str:
+        async with await replicas.sesion_lectura_async(id_usuario) as db:
+            return (await db.get(Pregunta, 1)).texto_pregunta
+
+    async def recorrer() -> dict:
+        lecturas = {"sin_redis_usuario": await leer(1), "sin_redis_catalogo": await leer()}
+
+        import fakeredis
+        redis_client.set_redis(fakeredis.FakeAsyncRedis())
+        lecturas["antes_de_escribir"] = await leer(1)
+        await replicas.marcar_escritura(1)
+        # Otro worker: solo ve la marca en Redis
+        replicas._escrituras.clear()
+        lecturas["tras_escribir"] = await leer(1)
+        lecturas["tras_escribir_async"] = await leer_async(1)
+        lecturas["otro_usuario"] = await leer(2)
+        await asyncio.sleep(_GUARDA_S * 1.5)
+        lecturas["pasada_la_guarda"] = await leer(1)
+
+        # Las conexiones de aiosqlite abiertas no dejan terminar el proceso
+        for engine in [async_engine, *replicas.async_replica_engines]:
+            await engine.dispose()
+        return lecturas
+
+    return asyncio.run(recorrer())
+
+def test_lecturas_a_replica_y_primaria():
+    with tempfile.TemporaryDirectory() as carpeta:
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(carpeta, 'primaria.db')}",
+            "DATABASE_REPLICA_URLS": f"sqlite:///{os.path.join(carpeta, 'replica.db')}",
+            "REPLICA_LAG_GUARD_SECONDS": str(_GUARDA_S),
+            "REDIS_URL": "",
+        }
+        salida = subprocess.run(
+            [sys.executable, "-m", "benchmarks.test_replicas"],
+            cwd=_RAIZ, env=env, capture_output=True, text=True,
+        )
+    assert salida.returncode == 0, salida.stderr[-2000:]
+    lecturas = json.loads(salida.stdout.strip().splitlines()[-1])
+
+    assert lecturas == {
+        "sin_redis_usuario": "primaria",
+        "sin_redis_catalogo": "replica",
+        "antes_de_escribir": "replica",
+        "tras_escribir": "primaria",
+        "tras_escribir_async": "primaria",
+        "otro_usuario": "replica",
+        "pasada_la_guarda": "replica",
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(_escenario()))
@@ -0,0 +1,60 @@
+# ==============================================================================
+# Presupuesto de Tiempo de Arranque
+# Cada worker de gunicorn importa app.main al arrancar. Esta prueba lo importa
+# en un proceso nuevo con `python -X importtime` y falla si el tiempo
+# acumulado de app.main supera el presupuesto, o si alguna dependencia pesada
+# (que solo usan las rutas con ML o el envío de correos) se importó.
+#
+# Variables de entorno:
+#   BENCH_IMPORT_BUDGET_MS=1800   presupuesto de importación de app.main (ms)
+# ==============================================================================
+
+import os
+import re
+import subprocess
+import sys
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_EJECUCIONES = 3
+PRESUPUESTO_MS = 1800.0
+
+# Se importan recién en el primer uso (app.core.lazy o importaciones locales)
+PESADOS = ("pandas", "numpy", "sklearn", "shap", "joblib", "fastapi_mail", "jose", "redis")
+
+_LINEA = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def _importar_app():
+    """Importa app.main en un proceso nuevo. Devuelve (ms acumulados de app.main, módulos importados)."""
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=_RAIZ, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    ).stderr
+    acumulado_ms, modulos = None, set()
+    for linea in salida.splitlines():
+        coincidencia = _LINEA.match(linea)
+        if not coincidencia:
+            continue
+        modulo = coincidencia.group(3)
+        modulos.add(modulo)
+        if modulo == "app.main":
+            acumulado_ms = int(coincidencia.group(1)) / 1000
+    assert acumulado_ms is not None, salida[-2000:]
+    return acumulado_ms, modulos
+
+def test_importar_app_main():
+    presupuesto = float(os.environ.get("BENCH_IMPORT_BUDGET_MS", PRESUPUESTO_MS))
+    tiempos = []
+    for _ in range(_EJECUCIONES):
+        acumulado_ms, modulos = _importar_app()
+        tiempos.append(acumulado_ms)
+
+    importados = sorted(m for m in PESADOS if m in modulos)
+    assert not importados, f"app.main importa dependencias pesadas al arrancar: {importados}"
+
+    # El mínimo de varias ejecuciones es lo menos sensible al ruido de la máquina
+    minimo = min(tiempos)
+    print(f"\nImportar app.main: {minimo:.0f} ms (presupuesto {presupuesto:.0f} ms)")
+    assert minimo <= presupuesto, (
+        f"Importar app.main tarda {minimo:.0f} ms > presupuesto {presupuesto:.0f} ms"
+    )
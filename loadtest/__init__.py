@@ -0,0 +1,20 @@
+# ==============================================================================
+# Herramientas de prueba de carga y generación de datos sintéticos
+# ==============================================================================
+
+import os
+
+# La configuración de la app exige estas variables aunque las herramientas
+# usen su propio motor de base de datos; damos valores por defecto locales.
+for _clave, _valor in {
+    "DATABASE_URL": "sqlite:///loadtest.db",
+    "SECRET_KEY": "loadtest-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "MAIL_USERNAME": "loadtest",
+    "MAIL_PASSWORD": "loadtest",
+    "MAIL_FROM": "loadtest@example.com",
+    "MAIL_PORT": "587",
+    "MAIL_SERVER": "localhost",
+}.items():
+    os.environ.setdefault(_clave, _valor)
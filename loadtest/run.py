@@ -0,0 +1,337 @@
+# ==============================================================================
+# Prueba de Carga de Extremo a Extremo
+# Levanta la API localmente (gunicorn con N workers sobre SQLite), siembra una
+# población sintética y la somete a usuarios virtuales concurrentes que recorren
+# los flujos reales: registro, token, envío de diagnóstico, reporte, dashboard
+# y actualización de tareas. Reporta throughput y percentiles de latencia por ruta.
+#
+# Cada usuario virtual es una sola empresa que encadena solicitudes sin pausa:
+# con el límite por usuario activo agotaría sus tokens en segundos y se
+# medirían sobre todo respuestas 429. Por eso el servidor se levanta con
+# RATE_LIMIT_ENABLED=false salvo con --con-limites. Las 429 se cuentan aparte
+# y no entran en los errores ni en los percentiles.
+#
+# Uso:
+#   python -m loadtest.run --usuarios 500 --concurrencia 32 --duracion 60
+#   python -m loadtest.run --base-url http://127.0.0.1:8000 --sin-servidor
+#   python -m loadtest.run --con-limites
+# ==============================================================================
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from app.db.database import Base
+from app.models.user import Usuario
+from loadtest import synthetic
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Peso relativo de cada escenario en la mezcla de tráfico
+ESCENARIOS = {
+    "enviar_diagnostico": 2,
+    "ver_reporte": 3,
+    "ver_dashboard": 3,
+    "actualizar_tarea": 2,
+    "registrar": 0.2,
+}
+
+
+# ==============================================================================
+# CLIENTE HTTP Y MÉTRICAS
+# ==============================================================================
+class Metricas:
+    """
+    Acumula latencias (ms) y errores por ruta de forma segura entre hilos.
+    Las respuestas 429 (límite de solicitudes) se cuentan en `limitadas` y no
+    entran en las latencias ni en los errores.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.errores: Dict[str, int] = defaultdict(int)
+        self.limitadas: Dict[str, int] = defaultdict(int)
+
+    def registrar(self, ruta: str, ms: float, estado: Optional[int]):
+        """`estado` es el código HTTP, o None si la conexión falló."""
+        with self._lock:
+            if estado == 429:
+                self.limitadas[ruta] += 1
+                return
+            self.latencias[ruta].append(ms)
+            if estado is None or estado >= 400:
+                self.errores[ruta] += 1
+
+    def resumen(self, duracion: float) -> Dict[str, Dict[str, float]]:
+        resultado = {}
+        for ruta in sorted(set(self.latencias) | set(self.limitadas)):
+            arr = np.asarray(self.latencias.get(ruta) or [0.0])
+            resultado[ruta] = {
+                "solicitudes": len(self.latencias.get(ruta, [])),
+                "errores": self.errores.get(ruta, 0),
+                "limitadas": self.limitadas.get(ruta, 0),
+                "rps": round(len(self.latencias.get(ruta, [])) / duracion, 2),
+                "p50_ms": round(float(np.percentile(arr, 50)), 1),
+                "p90_ms": round(float(np.percentile(arr, 90)), 1),
+                "p99_ms": round(float(np.percentile(arr, 99)), 1),
+                "max_ms": round(float(arr.max()), 1),
+            }
+        return resultado
+
+class Cliente:
+    """Conexión keep-alive por usuario virtual que mide cada solicitud."""
+
+    def __init__(self, base_url: str, metricas: Metricas):
+        url = urllib.parse.urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.metricas = metricas
+        self.token: Optional[str] = None
+        self._conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+    def solicitar(self, metodo: str, ruta: str, nombre: str, cuerpo=None, form: bool = False):
+        headers = {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if cuerpo is not None:
+            if form:
+                cuerpo = urllib.parse.urlencode(cuerpo)
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+            else:
+                cuerpo = json.dumps(cuerpo)
+                headers["Content-Type"] = "application/json"
+
+        inicio = time.perf_counter()
+        try:
+            self._conn.request(metodo, "/api/v1" + ruta, body=cuerpo, headers=headers)
+            respuesta = self._conn.getresponse()
+            datos = respuesta.read()
+            estado = respuesta.status
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.metricas.registrar(nombre, (time.perf_counter() - inicio) * 1000, None)
+            return None
+        self.metricas.registrar(nombre, (time.perf_counter() - inicio) * 1000, estado)
+        if estado >= 400:
+            return None
+        return json.loads(datos) if datos else {}
+
+
+# ==============================================================================
+# USUARIO VIRTUAL
+# ==============================================================================
+class UsuarioVirtual(threading.Thread):
+
+    def __init__(self, base_url: str, metricas: Metricas, n_usuarios: int, fin: float, semilla: int):
+        super().__init__(daemon=True)
+        self.cliente = Cliente(base_url, metricas)
+        self.n_usuarios = n_usuarios
+        self.fin = fin
+        self.rng = random.Random(semilla)
+        self.np_rng = np.random.default_rng(semilla)
+        self.semilla = semilla
+        self.id_diagnostico: Optional[int] = None
+        self.id_plan: Optional[int] = None
+        self.tareas: List[int] = []
+        self._registros = 0
+
+    def _login(self, email: str) -> bool:
+        self.cliente.token = None
+        datos = self.cliente.solicitar("POST", "/auth/token", "POST /auth/token",
+                                       {"username": email, "password": synthetic.PASSWORD}, form=True)
+        if not datos:
+            return False
+        self.cliente.token = datos["access_token"]
+        self.id_diagnostico, self.id_plan, self.tareas = None, None, []
+        return True
+
+    def _respuestas(self):
+        crudas = synthetic.generar_respuestas(self.np_rng, 1)[0]
+        return {"respuestas": [{"id_pregunta": int(q[1:]), "valor_respuesta_cruda": v} for q, v in crudas.items()]}
+
+    def _asegurar_diagnostico(self) -> bool:
+        if self.id_diagnostico is None:
+            historial = self.cliente.solicitar("GET", "/diagnosis/", "GET /diagnosis/")
+            if historial:
+                self.id_diagnostico = historial[0]["id_diagnostico"]
+            else:
+                self.enviar_diagnostico()
+        return self.id_diagnostico is not None
+
+    def _asegurar_plan(self) -> bool:
+        if self.id_plan is None and self._asegurar_diagnostico():
+            datos = self.cliente.solicitar("POST", f"/action-plan/diagnostico/{self.id_diagnostico}",
+                                           "POST /action-plan/diagnostico/{id}")
+            if datos:
+                self.id_plan = datos["id_plan"]
+        return self.id_plan is not None
+
+    # --- Escenarios ---
+
+    def enviar_diagnostico(self):
+        datos = self.cliente.solicitar("POST", "/diagnosis/", "POST /diagnosis/", self._respuestas())
+        if datos:
+            self.id_diagnostico, self.id_plan, self.tareas = datos["id_diagnostico"], None, []
+
+    def ver_reporte(self):
+        if self._asegurar_diagnostico():
+            self.cliente.solicitar("GET", f"/diagnosis/{self.id_diagnostico}/report", "GET /diagnosis/{id}/report")
+
+    def ver_dashboard(self):
+        if self._asegurar_plan():
+            datos = self.cliente.solicitar("GET", f"/action-plan/{self.id_plan}/dashboard",
+                                           "GET /action-plan/{id}/dashboard")
+            if datos:
+                self.tareas = [t["id_tarea"] for t in datos["tareas"]]
+
+    def actualizar_tarea(self):
+        if not self.tareas:
+            self.ver_dashboard()
+        if self.tareas:
+            progreso = self.rng.choice([0, 25, 50, 75, 100])
+            self.cliente.solicitar("PUT", f"/action-plan/tareas/{self.rng.choice(self.tareas)}",
+                                   "PUT /action-plan/tareas/{id}", {
+                                       "estado": "Completada" if progreso == 100 else "Pendiente",
+                                       "progreso": progreso,
+                                   })
+            self.cliente.solicitar("GET", f"/action-plan/{self.id_plan}/dashboard", "GET /action-plan/{id}/dashboard")
+
+    def registrar(self):
+        self._registros += 1
+        email = f"vu{self.semilla}-{self._registros}-{self.rng.getrandbits(32):08x}@loadtest.nuevo"
+        creado = self.cliente.solicitar("POST", "/auth/register", "POST /auth/register", {
+            "correo_electronico": email,
+            "nombre_empresa": "Empresa Nueva",
+            "ruc": f"{self.rng.randrange(10**10, 10**11)}",
+            "contrasena": synthetic.PASSWORD,
+            "acepta_terminos": True,
+        })
+        if creado:
+            self._login(email)
+
+    def run(self):
+        if not self._login(synthetic.email_usuario(self.rng.randrange(self.n_usuarios))):
+            return
+        nombres, pesos = zip(*ESCENARIOS.items())
+        while time.time() < self.fin:
+            getattr(self, self.rng.choices(nombres, weights=pesos)[0])()
+
+
+# ==============================================================================
+# SERVIDOR Y ORQUESTACIÓN
+# ==============================================================================
+def preparar_base(database_url: str, n_usuarios: int, diagnosticos_por_usuario: int) -> int:
+    """Crea el esquema y completa la población sintética hasta `n_usuarios`."""
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        existentes = db.scalar(
+            select(func.count()).select_from(Usuario).where(Usuario.correo_electronico.like("%@loadtest.digipath"))
+        )
+        if existentes < n_usuarios:
+            print(f"Generando {n_usuarios - existentes} empresas sintéticas...")
+            synthetic.poblar(db, n_usuarios - existentes, diagnosticos_por_usuario, log=True)
+    engine.dispose()
+    return n_usuarios
+
+def lanzar_servidor(database_url: str, workers: int, puerto: int, servidor: str,
+                    con_limites: bool = False) -> subprocess.Popen:
+    env = {**os.environ, "DATABASE_URL": database_url}
+    if not con_limites:
+        env["RATE_LIMIT_ENABLED"] = "false"
+    if servidor == "gunicorn":
+        comando = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-k", "uvicorn.workers.UvicornWorker",
+                   "app.main:app", "--bind", f"127.0.0.1:{puerto}", "--log-level", "warning"]
+    else:
+        comando = [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers),
+                   "--port", str(puerto), "--log-level", "warning"]
+    proceso = subprocess.Popen(comando, cwd=_RAIZ, env=env)
+
+    limite = time.time() + 120
+    while time.time() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError("El servidor terminó durante el arranque.")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", puerto, timeout=2)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return proceso
+        except OSError:
+            time.sleep(0.5)
+    proceso.terminate()
+    raise RuntimeError("El servidor no respondió a tiempo.")
+
+def imprimir_resumen(resumen: Dict[str, Dict[str, float]], duracion: float):
+    columnas = ["solicitudes", "errores", "limitadas", "rps", "p50_ms", "p90_ms", "p99_ms", "max_ms"]
+    ancho = max(len(r) for r in resumen) if resumen else 10
+    print(f"\nDuración: {duracion:.1f}s")
+    print(f"{'ruta':<{ancho}}  " + "  ".join(f"{c:>11}" for c in columnas))
+    for ruta, fila in resumen.items():
+        print(f"{ruta:<{ancho}}  " + "  ".join(f"{fila[c]:>11}" for c in columnas))
+    total = sum(f["solicitudes"] for f in resumen.values())
+    limitadas = sum(f["limitadas"] for f in resumen.values())
+    print(f"\nTotal: {total} solicitudes, {total / duracion:.1f} req/s ({limitadas} respuestas 429 aparte)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de extremo a extremo de la API de DigiPath.")
+    parser.add_argument("--database-url", default="sqlite:///loadtest.db")
+    parser.add_argument("--usuarios", type=int, default=200, help="Empresas sintéticas en la base")
+    parser.add_argument("--diagnosticos-por-usuario", type=int, default=1)
+    parser.add_argument("--concurrencia", type=int, default=16, help="Usuarios virtuales simultáneos")
+    parser.add_argument("--duracion", type=float, default=30.0, help="Segundos de carga")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--servidor", choices=["gunicorn", "uvicorn"], default="gunicorn")
+    parser.add_argument("--base-url", default=None, help="Apunta a un servidor ya levantado")
+    parser.add_argument("--sin-servidor", action="store_true", help="No levanta el servidor ni siembra datos")
+    parser.add_argument("--con-limites", action="store_true",
+                        help="Levanta el servidor con el límite de solicitudes por usuario activo")
+    parser.add_argument("--json", default=None, help="Ruta donde guardar el resumen en JSON")
+    args = parser.parse_args()
+
+    proceso = None
+    base_url = args.base_url or f"http://127.0.0.1:{args.puerto}"
+    if not args.sin_servidor:
+        preparar_base(args.database_url, args.usuarios, args.diagnosticos_por_usuario)
+        proceso = lanzar_servidor(args.database_url, args.workers, args.puerto, args.servidor,
+                                  con_limites=args.con_limites)
+
+    try:
+        metricas = Metricas()
+        inicio = time.time()
+        usuarios = [UsuarioVirtual(base_url, metricas, args.usuarios, inicio + args.duracion, semilla=i)
+                    for i in range(args.concurrencia)]
+        for u in usuarios:
+            u.start()
+        for u in usuarios:
+            u.join()
+        duracion = time.time() - inicio
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait(timeout=30)
+
+    resumen = metricas.resumen(duracion)
+    imprimir_resumen(resumen, duracion)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"duracion_s": duracion, "concurrencia": args.concurrencia,
+                       "workers": args.workers, "rutas": resumen}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# ==============================================================================
+# Generador de Datos Sintéticos
+# Crea una población de empresas con respuestas realistas, diagnósticos ya
+# puntuados por el modelo y planes de acción. Inserta por lotes con SQLAlchemy
+# Core para poder escalar hasta ~100k diagnósticos.
+#
+# Uso:
+#   python -m loadtest.synthetic --database-url sqlite:///loadtest.db --usuarios 1000
+# ==============================================================================
+
+import argparse
+import datetime
+import os
+import time
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.db.database import Base
+from app.models.action_plan import PlanAccion, TareaPlan
+from app.models.diagnosis import Diagnostico, Respuesta, DiagnosticoSHAP
+from app.models.question import Pregunta, Recomendacion
+from app.models.user import Usuario
+from app.services import analytics_service, percentile_service
+from app.services.auth_service import get_password_hash
+from app.services.diagnosis_service import (
+    MAPA_DOMINIOS, PREGUNTAS_SI_NO, normalizar_respuesta, process_diagnosis_batch
+)
+
+# Todos los usuarios sintéticos comparten contraseña (hashear con bcrypt
+# cientos de miles de veces dominaría el tiempo de generación).
+PASSWORD = "Digipath.2025"
+
+
+def email_usuario(indice: int) -> str:
+    return f"empresa{indice:06d}@loadtest.digipath"
+
+def seed_catalog(db: Session):
+    """Siembra las 20 preguntas y sus recomendaciones de DEBILIDAD y FORTALEZA si no existen."""
+    if db.query(Pregunta.id_pregunta).first():
+        return
+    dominio_de = {q: dominio for dominio, preguntas in MAPA_DOMINIOS.items() for q in preguntas}
+    for i in range(1, 21):
+        db.add(Pregunta(
+            id_pregunta=i,
+            texto_pregunta=f"Pregunta {i}",
+            seccion="Capacidad Digital" if i <= 10 else "Capacidad de Liderazgo",
+            dominio=dominio_de[f"Q{i}"],
+            subdominio=f"Subdominio {i}",
+            tipo_pregunta="Si/No" if i in PREGUNTAS_SI_NO else "Escala",
+        ))
+        db.add(Recomendacion(id_pregunta=i, tipo_feedback="DEBILIDAD",
+                             texto_explicacion=f"Debilidad en Q{i}", texto_recomendacion=f"Mejorar Q{i}"))
+        db.add(Recomendacion(id_pregunta=i, tipo_feedback="FORTALEZA",
+                             texto_explicacion=f"Fortaleza en Q{i}"))
+    db.commit()
+
+
+# ==============================================================================
+# DISTRIBUCIÓN DE RESPUESTAS
+# ==============================================================================
+def generar_respuestas(rng: np.random.Generator, n: int) -> List[Dict[str, Any]]:
+    """
+    Genera `n` cuestionarios crudos. Cada empresa tiene una madurez latente
+    ~ Beta(2, 2.5) (la mayoría son MYPEs poco o medianamente digitalizadas) y
+    cada respuesta se dispersa alrededor de ella, con un sesgo propio por
+    pregunta para que los dominios no salgan perfectamente correlacionados.
+    """
+    madurez = rng.beta(2.0, 2.5, size=n)
+    sesgo_pregunta = rng.normal(0.0, 0.08, size=20)
+    cuestionarios = []
+    for m in madurez:
+        latente = np.clip(m + sesgo_pregunta + rng.normal(0.0, 0.15, size=20), 0.0, 1.0)
+        respuestas = {}
+        for i in range(1, 21):
+            p = latente[i - 1]
+            if i in PREGUNTAS_SI_NO:
+                respuestas[f"Q{i}"] = "Si" if rng.random() < p else "No"
+            elif i == 6:
+                respuestas[f"Q{i}"] = int(1 + round(p * 3))
+            elif i == 18:
+                respuestas[f"Q{i}"] = int(1 + round(p * 2))
+            else:
+                respuestas[f"Q{i}"] = int(1 + round(p * 6))
+        cuestionarios.append(respuestas)
+    return cuestionarios
+
+def normalizar_lote(cuestionarios: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Normaliza un lote de cuestionarios generados con normalizar_respuesta (las escalas del servicio)."""
+    preguntas = range(1, 21)
+    filas = [[normalizar_respuesta(i, respuestas[f"Q{i}"]) for i in preguntas] for respuestas in cuestionarios]
+    return pd.DataFrame(filas, columns=[f"Q{i}" for i in preguntas])
+
+
+# ==============================================================================
+# POBLACIÓN
+# ==============================================================================
+def _lotes(total: int, tamano: int) -> Iterator[range]:
+    for inicio in range(0, total, tamano):
+        yield range(inicio, min(inicio + tamano, total))
+
+def crear_usuarios(db: Session, n_usuarios: int, desde: int = 0, lote: int = 5000) -> List[int]:
+    """Inserta usuarios sintéticos (empresaNNNNNN@loadtest.digipath) y devuelve sus ids."""
+    contrasena_hash = get_password_hash(PASSWORD)
+    ids = []
+    for indices in _lotes(n_usuarios, lote):
+        filas = [{
+            "nombre_empresa": f"Empresa Sintética {desde + i}",
+            "ruc": f"20{desde + i:09d}",
+            "correo_electronico": email_usuario(desde + i),
+            "contrasena_hash": contrasena_hash,
+        } for i in indices]
+        resultado = db.execute(insert(Usuario).returning(Usuario.id_usuario, sort_by_parameter_order=True), filas)
+        ids.extend(resultado.scalars().all())
+        db.commit()
+    return ids
+
+def crear_diagnosticos(db: Session, ids_usuario: List[int], rng: np.random.Generator,
+                       con_planes: bool = True, lote: int = 500, log: bool = False) -> int:
+    """
+    Crea un diagnóstico por cada elemento de `ids_usuario` (un id puede repetirse
+    hasta 3 veces, el límite del historial). Puntúa cada lote con una sola
+    llamada al modelo y opcionalmente crea el plan de acción con sus tareas.
+    """
+    total = 0
+    for indices in _lotes(len(ids_usuario), lote):
+        inicio = time.perf_counter()
+        cuestionarios = generar_respuestas(rng, len(indices))
+        normalizadas = normalizar_lote(cuestionarios)
+        analisis = process_diagnosis_batch(normalizadas)
+
+        # Fechas repartidas en el último año para que las vistas por mes tengan datos
+        ahora = datetime.datetime.utcnow()
+        dias_atras = rng.integers(0, 365, size=len(indices))
+        filas_diag = [{
+            "id_usuario": ids_usuario[i],
+            "fecha_diagnostico": ahora - datetime.timedelta(days=int(d)),
+            "puntaje_cap_digital": float(a["puntaje_cap_digital"]),
+            "puntaje_cap_liderazgo": float(a["puntaje_cap_liderazgo"]),
+            "nivel_madurez_predicho": a["nivel_madurez_predicho"],
+            "version_modelo": a["version_modelo"],
+        } for i, a, d in zip(indices, analisis, dias_atras)]
+        ids_diag = db.execute(
+            insert(Diagnostico).returning(Diagnostico.id_diagnostico, sort_by_parameter_order=True), filas_diag
+        ).scalars().all()
+
+        filas_resp, filas_shap, drivers = [], [], {}
+        for id_diag, crudas, norm, a in zip(ids_diag, cuestionarios, normalizadas.to_numpy(), analisis):
+            for q in range(1, 21):
+                filas_resp.append({
+                    "id_diagnostico": id_diag, "id_pregunta": q,
+                    "valor_respuesta_cruda": str(crudas[f"Q{q}"]),
+                    "valor_normalizado": int(norm[q - 1]),
+                })
+            debilidades = {d["pregunta_id"] for d in a["areas_mejora_prioritarias"]}
+            drivers[id_diag] = [int(q[1:]) for q in sorted(debilidades)]
+            for s in a["shap_values"]:
+                filas_shap.append({
+                    "id_diagnostico": id_diag, "id_pregunta": int(s["pregunta_id"][1:]),
+                    "valor_shap": float(s["shap_value"]),
+                    "es_driver_clave": s["pregunta_id"] in debilidades,
+                })
+        db.execute(insert(Respuesta), filas_resp)
+        db.execute(insert(DiagnosticoSHAP), filas_shap)
+
+        if con_planes:
+            ids_plan = db.execute(
+                insert(PlanAccion).returning(PlanAccion.id_plan, sort_by_parameter_order=True),
+                [{"id_diagnostico": d, "estado": "En Progreso"} for d in ids_diag]
+            ).scalars().all()
+            filas_tareas = []
+            for id_plan, id_diag in zip(ids_plan, ids_diag):
+                for q in drivers[id_diag]:
+                    progreso = int(rng.choice([0, 0, 25, 50, 100]))
+                    filas_tareas.append({
+                        "id_plan": id_plan, "id_pregunta": q, "progreso": progreso,
+                        "estado": "Completada" if progreso == 100 else "Pendiente",
+                        "fecha_completada": ahora if progreso == 100 else None,
+                    })
+            if filas_tareas:
+                db.execute(insert(TareaPlan), filas_tareas)
+
+        analytics_service.registrar_diagnosticos(db, ids_diag)
+        db.commit()
+        percentile_service.registrar(np.vstack([percentile_service.puntajes_de_analisis(a) for a in analisis]))
+        total += len(ids_diag)
+        if log:
+            duracion = time.perf_counter() - inicio
+            print(f"  {total} diagnósticos ({len(ids_diag) / duracion:.0f}/s)")
+    return total
+
+def poblar(db: Session, n_usuarios: int, diagnosticos_por_usuario: int = 1, con_planes: bool = True,
+           semilla: int = 42, log: bool = False) -> Dict[str, int]:
+    """
+    Siembra el catálogo y crea `n_usuarios` empresas sintéticas con
+    `diagnosticos_por_usuario` diagnósticos cada una (máximo 3, como el historial).
+    Es idempotente respecto al catálogo y continúa la numeración de usuarios existentes.
+    """
+    if not 0 <= diagnosticos_por_usuario <= 3:
+        raise ValueError("diagnosticos_por_usuario debe estar entre 0 y 3")
+    rng = np.random.default_rng(semilla)
+    seed_catalog(db)
+
+    existentes = db.execute(
+        select(Usuario.id_usuario).where(Usuario.correo_electronico.like("%@loadtest.digipath"))
+    ).all()
+    ids_usuario = crear_usuarios(db, n_usuarios, desde=len(existentes))
+    if log:
+        print(f"{len(ids_usuario)} usuarios creados")
+
+    asignaciones = [u for _ in range(diagnosticos_por_usuario) for u in ids_usuario]
+    n_diag = crear_diagnosticos(db, asignaciones, rng, con_planes=con_planes, log=log)
+    return {"usuarios": len(ids_usuario), "diagnosticos": n_diag, "desde_usuario": len(existentes)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera una población sintética de empresas y diagnósticos.")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL", "sqlite:///loadtest.db"))
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--diagnosticos-por-usuario", type=int, default=1)
+    parser.add_argument("--sin-planes", action="store_true")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    inicio = time.perf_counter()
+    with Session(engine) as db:
+        resumen = poblar(db, args.usuarios, args.diagnosticos_por_usuario,
+                         con_planes=not args.sin_planes, semilla=args.semilla, log=True)
+    print(f"Listo en {time.perf_counter() - inicio:.1f}s: {resumen}")
+
+
+if __name__ == "__main__":
+    main()